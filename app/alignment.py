@@ -0,0 +1,498 @@
+# Score-only global alignment engines
+
+# The web endpoints only ever read the score of the best global alignment, so the
+# engines below never build traceback matrices and keep a single DP row in memory.
+
+import time
+
+import numpy as np
+
+# Biopython's PairwiseAligner computes scores in C; fall back to NumPy without it
+try:
+    from Bio.Align import PairwiseAligner
+except ImportError:  # pragma: no cover - depends on the installed Biopython
+    PairwiseAligner = None
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a batched alignment is still running at its deadline."""
+
+
+def encode_sequence(sequence):
+    """
+    Encodes a sequence as an array of integer symbol codes.
+
+    Parameters:
+        sequence (str or numpy.ndarray): Sequence to encode, any characters are accepted,
+            or an array of its ASCII codes.
+    Returns:
+        numpy.ndarray: One uint32 code point per character of the sequence.
+    """
+    if isinstance(sequence, np.ndarray):
+        return sequence.astype(np.uint32)
+    return np.frombuffer(sequence.encode('utf-32-le'), dtype=np.uint32)
+
+
+def numpy_alignment_score(seq1, seq2, match_score=3, mismatch_penalty=-1, gap_penalty=-2):
+    """
+    Computes the global (Needleman-Wunsch) alignment score with linear gap costs,
+    one vectorized DP row at a time.
+
+    The horizontal gap dependency inside a row is resolved with a running maximum:
+    H[j] = gap * j + max_{k <= j}(D[k] - gap * k), where D holds the diagonal and
+    vertical moves.
+
+    Parameters:
+        seq1 (str): First sequence.
+        seq2 (str): Second sequence.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty per gap position. Defaults to -2.
+    Returns:
+        int: Score of the best global alignment.
+    """
+    # Iterate over the shorter sequence so the Python loop is as short as possible
+    if len(seq1) > len(seq2):
+        seq1, seq2 = seq2, seq1
+    rows = encode_sequence(seq1)
+    columns = encode_sequence(seq2)
+    # Gap offsets used to turn the horizontal recurrence into a running maximum
+    offsets = gap_penalty * np.arange(len(columns) + 1, dtype=np.int64)
+    previous = offsets.copy()
+    current = np.empty_like(previous)
+    # One substitution row per distinct symbol of the shorter sequence
+    substitution = {
+        symbol: np.where(columns == symbol, match_score, mismatch_penalty).astype(np.int64)
+        for symbol in np.unique(rows)
+    }
+    for i, symbol in enumerate(rows, start=1):
+        current[0] = gap_penalty * i
+        np.maximum(previous[:-1] + substitution[symbol], previous[1:] + gap_penalty, out=current[1:])
+        current -= offsets
+        np.maximum.accumulate(current, out=current)
+        current += offsets
+        previous, current = current, previous
+    return int(previous[-1])
+
+
+def banded_alignment_score(seq1, seq2, bandwidth, match_score=3, mismatch_penalty=-1, gap_penalty=-2):
+    """
+    Computes the score of the best global alignment staying within `bandwidth` cells of
+    the straight line from the start to the end of the DP matrix.
+
+    The rows follow the shorter sequence and each row only computes its band, so the cost
+    is about len(longer) + 2 * bandwidth * len(shorter) cells. The result is the score of
+    a valid global alignment, never above the exact score, and equal to it once the band
+    holds the best alignment.
+
+    Parameters:
+        seq1 (str or numpy.ndarray): First sequence.
+        seq2 (str or numpy.ndarray): Second sequence.
+        bandwidth (int): Columns kept on each side of the line.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty per gap position. Defaults to -2.
+    Returns:
+        int: Score of the best global alignment within the band.
+    """
+    if len(seq1) > len(seq2):
+        seq1, seq2 = seq2, seq1
+    rows = encode_sequence(seq1)
+    columns = encode_sequence(seq2)
+    n, m = len(rows), len(columns)
+    if n == 0:
+        return gap_penalty * m
+    centers = np.arange(n + 1, dtype=np.int64) * m
+    lows = np.maximum(centers // n - bandwidth, 0)
+    highs = np.minimum(-(-centers // n) + bandwidth, m)
+    offsets = gap_penalty * np.arange(m + 1, dtype=np.int64)
+    # Outside the band; far enough from the int64 limits to absorb the offsets
+    outside = np.iinfo(np.int64).min // 2
+    previous = np.full(m + 1, outside, dtype=np.int64)
+    current = np.full(m + 1, outside, dtype=np.int64)
+    previous[:highs[0] + 1] = offsets[:highs[0] + 1]
+    for i in range(1, n + 1):
+        low, high = int(lows[i]), int(highs[i])
+        # The previous row did not write the columns past its band
+        previous[highs[i - 1] + 1:high + 1] = outside
+        start = max(low, 1)
+        substitution = np.where(columns[start - 1:high] == rows[i - 1], match_score, mismatch_penalty)
+        np.maximum(previous[start - 1:high] + substitution, previous[start:high + 1] + gap_penalty,
+                   out=current[start:high + 1])
+        if low == 0:
+            current[0] = gap_penalty * i
+        band = current[low:high + 1]
+        band -= offsets[low:high + 1]
+        np.maximum.accumulate(band, out=band)
+        band += offsets[low:high + 1]
+        if low > 0:
+            # Read as the diagonal move into the first column of the next band
+            current[low - 1] = outside
+        previous, current = current, previous
+    return int(previous[m])
+
+
+def biopython_alignment_score(seq1, seq2, match_score=3, mismatch_penalty=-1, gap_penalty=-2):
+    """
+    Computes the global alignment score with Biopython's PairwiseAligner in score-only mode.
+
+    Parameters:
+        seq1 (str): First sequence.
+        seq2 (str): Second sequence.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty per gap position. Defaults to -2.
+    Returns:
+        int: Score of the best global alignment.
+    """
+    aligner = _biopython_aligner(match_score, mismatch_penalty, gap_penalty)
+    return int(aligner.score(seq1, seq2))
+
+
+_aligners = {}
+
+
+def _biopython_aligner(match_score, mismatch_penalty, gap_penalty):
+    """Returns a cached PairwiseAligner configured for the given scoring parameters."""
+    key = (match_score, mismatch_penalty, gap_penalty)
+    aligner = _aligners.get(key)
+    if aligner is None:
+        aligner = PairwiseAligner(mode='global', match_score=match_score, mismatch_score=mismatch_penalty,
+                                  open_gap_score=gap_penalty, extend_gap_score=gap_penalty)
+        _aligners[key] = aligner
+    return aligner
+
+
+# Registered engines, looked up by name
+ALIGNMENT_ENGINES = {'numpy': numpy_alignment_score}
+if PairwiseAligner is not None:
+    ALIGNMENT_ENGINES['biopython'] = biopython_alignment_score
+
+# Default engine used by needleman_wunsch_similarity
+DEFAULT_ALIGNMENT_ENGINE = 'biopython' if 'biopython' in ALIGNMENT_ENGINES else 'numpy'
+
+
+def register_alignment_engine(name, score_function):
+    """
+    Registers a score-only alignment engine.
+
+    Parameters:
+        name (str): Name used to select the engine.
+        score_function (callable): Function taking (seq1, seq2, match_score, mismatch_penalty,
+            gap_penalty) and returning the global alignment score.
+    """
+    ALIGNMENT_ENGINES[name] = score_function
+
+
+def get_alignment_engine(name=None):
+    """
+    Looks up an alignment engine by name.
+
+    Parameters:
+        name (str, optional): Engine name. Defaults to DEFAULT_ALIGNMENT_ENGINE.
+    Returns:
+        callable: The score function of the engine.
+    Raises:
+        ValueError: If no engine is registered under the given name.
+    """
+    name = name or DEFAULT_ALIGNMENT_ENGINE
+    try:
+        return ALIGNMENT_ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown alignment engine '{name}'. Available: {', '.join(sorted(ALIGNMENT_ENGINES))}")
+
+
+def needleman_wunsch_similarity(seq1, seq2, match_score=3, mismatch_penalty=-1, gap_penalty=-2, engine=None,
+                                threshold=None):
+    """
+    Calculates the similarity score between two sequences using the Needleman-Wunsch algorithm.
+
+    Parameters:
+        seq1 (str): First DNA sequence.
+        seq2 (str): Second DNA sequence.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty for gaps. Defaults to -2.
+        engine (str, optional): Name of the alignment engine. Defaults to DEFAULT_ALIGNMENT_ENGINE.
+        threshold (float, optional): Minimum similarity of interest. When given, a banded alignment
+            with early termination is used and NaN is returned if the threshold cannot be reached.
+
+    Returns:
+        float: Similarity score between the two sequences.
+    """
+    if threshold is not None:
+        return float(similarity_many(seq1, [seq2], match_score, mismatch_penalty, gap_penalty, threshold=threshold)[0])
+    # Empty sequences have no alignment
+    if not seq1 or not seq2:
+        return 0.0
+    alignment_score = get_alignment_engine(engine)(seq1, seq2, match_score, mismatch_penalty, gap_penalty)
+    max_score = max(len(seq1), len(seq2)) * match_score  # Score of the maximum alignment
+    # Return the similarity score
+    return alignment_score / max_score
+
+
+# Score given to targets abandoned because they cannot reach their minimum score
+REJECTED_SCORE = np.iinfo(np.int64).min
+
+
+def _score_dtype(query_length, target_length, match_score, mismatch_penalty, gap_penalty):
+    """
+    Picks the DP dtype and the out-of-band sentinel for the given DP size.
+
+    Real cell values lie within +/- step * (query_length + target_length); the sentinel
+    sits below that range so anything derived from it loses every max.
+    """
+    step = max(abs(match_score), abs(mismatch_penalty), abs(gap_penalty))
+    value_range = step * (query_length + target_length)
+    dtype = np.int16 if value_range + 3 * step < np.iinfo(np.int16).max else np.int32
+    return dtype, -value_range - 2 * step
+
+
+def _symbol_indices(codes, symbols, dtype):
+    """Maps symbol codes to their index in the sorted `symbols` array, or to the dtype's maximum."""
+    indices = np.searchsorted(symbols, codes)
+    indices[indices >= len(symbols)] = 0
+    return np.where(symbols[indices] == codes, indices, np.iinfo(dtype).max).astype(dtype)
+
+
+def _band(query_length, lengths, min_scores, match_score, gap_penalty):
+    """
+    Derives the admissible diagonal band (j - i offsets) of each target from its minimum score.
+
+    An alignment with G gap columns scores at most match * (n + m - G) / 2 + gap * G, which
+    bounds G. The path must cover the length difference m - n with gaps, so the remaining
+    gaps allow an excursion of (G - |m - n|) / 2 on either side of [min(0, m - n), max(0, m - n)].
+
+    Returns:
+        tuple: Lower and upper band offsets of each target, and whether the band exists.
+    """
+    difference = lengths - query_length
+    max_gaps = np.floor((match_score * (query_length + lengths) / 2 - min_scores) / (match_score / 2 - gap_penalty))
+    slack = (max_gaps - np.abs(difference)) // 2
+    lower = np.minimum(difference, 0) - slack
+    upper = np.maximum(difference, 0) + slack
+    return lower.astype(np.int64), upper.astype(np.int64), slack >= 0
+
+
+def _reachable_scores(values, positions, d, query_length, lengths, match_score, gap_penalty):
+    """
+    Bounds the best final score of each lane over the cells of anti-diagonal d.
+
+    The rest of the alignment scores at most match * min(remaining) + gap * |remaining difference|.
+    """
+    query_left = query_length - positions
+    target_left = lengths[:, None] - (d - positions)
+    reachable = (values[:, positions].astype(np.int64)
+                 + match_score * np.minimum(query_left, target_left)
+                 + gap_penalty * np.abs(query_left - target_left))
+    # Cells outside the DP matrix of the lane
+    reachable[(target_left < 0) | (positions > d)] = REJECTED_SCORE
+    return reachable.max(axis=1)
+
+
+def _align_block(query_symbols, reversed_targets, lengths, min_scores, scoring, check_interval, deadline=None):
+    """
+    Runs the anti-diagonal DP for one block of targets.
+
+    Parameters:
+        query_symbols (numpy.ndarray): Symbol indices of the query.
+        reversed_targets (numpy.ndarray): Reversed, right-aligned target symbol indices, one row per target.
+        lengths (numpy.ndarray): Length of each target.
+        min_scores (numpy.ndarray or None): Minimum score of each target, None for a full DP.
+        scoring (tuple): Match score, mismatch penalty and gap penalty.
+        check_interval (int): Anti-diagonals between two early-termination and deadline checks.
+        deadline (float, optional): time.monotonic() at which the block is abandoned. Defaults to None.
+    Returns:
+        numpy.ndarray: Score of each target, REJECTED_SCORE for targets below their minimum.
+    Raises:
+        DeadlineExceeded: If the deadline passes before the block is aligned.
+    """
+    match_score, mismatch_penalty, gap_penalty = scoring
+    n = len(query_symbols)
+    lanes, width = reversed_targets.shape
+    dtype, out_of_band = _score_dtype(n, width, *scoring)
+    scores = np.full(lanes, REJECTED_SCORE, dtype=np.int64)
+    # Lanes still being aligned, as indices into the block
+    active = np.arange(lanes)
+    if min_scores is None:
+        lower, upper = -n, width
+    else:
+        lane_lower, lane_upper, feasible = _band(n, lengths, min_scores, match_score, gap_penalty)
+        active = active[feasible]
+        if not len(active):
+            return scores
+        lower = max(-n, int(lane_lower[active].min()))
+        upper = min(width, int(lane_upper[active].max()))
+        reversed_targets = reversed_targets[active]
+    # Anti-diagonals d - 2, d - 1 and d, indexed by query position i (cell (i, d - i))
+    before_previous = np.full((len(active), n + 1), out_of_band, dtype=dtype)
+    before_previous[:, 0] = 0
+    previous = np.full_like(before_previous, out_of_band)
+    if upper >= 1:
+        previous[:, 0] = gap_penalty
+    if lower <= -1:
+        previous[:, 1] = gap_penalty
+    current = np.empty_like(before_previous)
+    matches = np.empty((len(active), n), dtype=bool)
+    diagonal = np.empty((len(active), n), dtype=dtype)
+    gapped = np.empty((len(active), n), dtype=dtype)
+    for d in range(2, n + width + 1):
+        # Query positions of the anti-diagonal that fall inside the matrix and the band
+        lo = max(1, d - width, -((upper - d) // 2))
+        hi = min(n, d - 1, (d - lower) // 2)
+        if lo <= hi:
+            size = hi - lo + 1
+            rows = len(active)
+            matched = matches[:rows, :size]
+            diagonal_view = diagonal[:rows, :size]
+            gapped_view = gapped[:rows, :size]
+            np.equal(query_symbols[lo - 1:hi], reversed_targets[:, width - d + lo:width - d + hi + 1], out=matched)
+            # Substitution scores: mismatch + (match - mismatch) for matching cells
+            np.copyto(diagonal_view, matched, casting='unsafe')
+            diagonal_view *= match_score - mismatch_penalty
+            diagonal_view += mismatch_penalty
+            diagonal_view += before_previous[:, lo - 1:hi]
+            np.maximum(previous[:, lo - 1:hi], previous[:, lo:hi + 1], out=gapped_view)
+            gapped_view += gap_penalty
+            np.maximum(diagonal_view, gapped_view, out=current[:, lo:hi + 1])
+        # Cells just outside the band are read by the next anti-diagonals
+        current[:, lo - 1] = out_of_band
+        if hi + 1 <= n:
+            current[:, hi + 1] = out_of_band
+        # First row and first column of the DP matrix
+        if d <= width and d <= upper:
+            current[:, 0] = gap_penalty * d
+        if d <= n and -d >= lower:
+            current[:, d] = gap_penalty * d
+        finished = lengths[active] == d - n
+        if finished.any():
+            scores[active[finished]] = current[finished, n]
+        keep = ~finished
+        if deadline is not None and d % check_interval == 0 and time.monotonic() >= deadline:
+            raise DeadlineExceeded()
+        if min_scores is not None and d % check_interval == 0:
+            # Diagonal moves skip an anti-diagonal, but every path visits d - 1 or d
+            positions = np.arange(max(lo - 2, 0), min(hi + 1, n) + 1)
+            reachable = np.maximum(
+                _reachable_scores(current, positions, d, n, lengths[active], match_score, gap_penalty),
+                _reachable_scores(previous, positions, d - 1, n, lengths[active], match_score, gap_penalty))
+            keep &= reachable >= min_scores[active]
+        if not keep.all():
+            # Drop finished and hopeless lanes from the remaining anti-diagonals
+            if not keep.any():
+                break
+            active = active[keep]
+            reversed_targets = reversed_targets[keep]
+            before_previous, previous, current = previous[keep], current[keep], before_previous[keep]
+        else:
+            before_previous, previous, current = previous, current, before_previous
+    if min_scores is not None:
+        scores[scores < min_scores] = REJECTED_SCORE
+    return scores
+
+
+def alignment_scores_many(query, targets, match_score=3, mismatch_penalty=-1, gap_penalty=-2, block_size=64,
+                          min_scores=None, check_interval=32, deadline=None):
+    """
+    Computes the global alignment score of one query against many targets at once.
+
+    Targets are processed in blocks, one NumPy lane per target. The DP advances one
+    anti-diagonal per step for every target of the block; cells on an anti-diagonal are
+    independent, so each step is a handful of element-wise operations over
+    (targets x query positions). Targets are stored reversed so the characters of an
+    anti-diagonal are a contiguous slice. Each target's score is read on the
+    anti-diagonal that ends at its true length, so padding never affects it.
+
+    With `min_scores`, only the diagonal band an alignment reaching the minimum can use
+    is filled, and targets whose best reachable score drops below their minimum are
+    abandoned. Scores of the remaining targets are exact.
+
+    Parameters:
+        query (str): Query sequence.
+        targets (list of str): Target sequences.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty per gap position. Defaults to -2.
+        block_size (int, optional): Number of targets aligned together. Defaults to 64.
+        min_scores (numpy.ndarray or int, optional): Minimum score of each target. Defaults to None.
+        check_interval (int, optional): Anti-diagonals between early-termination checks. Defaults to 32.
+        deadline (float, optional): time.monotonic() at which the alignment is abandoned. Defaults to None.
+    Returns:
+        numpy.ndarray: int64 alignment score of the query against each target, REJECTED_SCORE
+            for targets below their minimum score.
+    Raises:
+        DeadlineExceeded: If the deadline passes before every target is aligned.
+    """
+    scoring = (match_score, mismatch_penalty, gap_penalty)
+    query_codes = encode_sequence(query)
+    n = len(query_codes)
+    lengths = np.fromiter((len(target) for target in targets), dtype=np.int64, count=len(targets))
+    if min_scores is not None:
+        min_scores = np.broadcast_to(np.asarray(min_scores, dtype=np.int64), lengths.shape)
+    # Aligning against an empty target (or with an empty query) is all gaps
+    scores = gap_penalty * np.maximum(lengths, n)
+    if n > 0:
+        symbols, query_symbols = np.unique(query_codes, return_inverse=True)
+        # Symbols absent from the query and padding share the largest index value
+        index_dtype = np.uint8 if len(symbols) < np.iinfo(np.uint8).max else np.uint32
+        query_symbols = query_symbols.astype(index_dtype)
+        # Sorting by length keeps padding inside each block small
+        order = np.argsort(lengths, kind='stable')
+        order = order[lengths[order] > 0]
+        for start in range(0, len(order), block_size):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded()
+            block = order[start:start + block_size]
+            width = int(lengths[block].max())
+            # Reversed targets, right-aligned: column width - j holds target position j
+            reversed_targets = np.full((len(block), width), np.iinfo(index_dtype).max, dtype=index_dtype)
+            for row, index in enumerate(block):
+                target_symbols = _symbol_indices(encode_sequence(targets[index]), symbols, index_dtype)
+                reversed_targets[row, width - len(target_symbols):] = target_symbols[::-1]
+            block_min_scores = None if min_scores is None else min_scores[block]
+            scores[block] = _align_block(query_symbols, reversed_targets, lengths[block], block_min_scores,
+                                         scoring, check_interval, deadline)
+    if min_scores is not None:
+        scores[scores < min_scores] = REJECTED_SCORE
+    return scores
+
+
+def similarity_many(query, targets, match_score=3, mismatch_penalty=-1, gap_penalty=-2, block_size=64,
+                    threshold=None, deadline=None):
+    """
+    Calculates the Needleman-Wunsch similarity of one query against many targets.
+
+    Gives the same values as calling needleman_wunsch_similarity on every pair. With a
+    threshold, targets that cannot reach it are rejected early through a banded alignment
+    and get NaN; every other similarity is still exact.
+
+    Parameters:
+        query (str): Query DNA sequence.
+        targets (list of str): Target DNA sequences.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty for gaps. Defaults to -2.
+        block_size (int, optional): Number of targets aligned together. Defaults to 64.
+        threshold (float, optional): Minimum similarity of interest. Defaults to None.
+        deadline (float, optional): time.monotonic() at which the alignment is abandoned. Defaults to None.
+    Returns:
+        numpy.ndarray: float64 similarity score for each target.
+    Raises:
+        DeadlineExceeded: If the deadline passes before every target is aligned.
+    """
+    targets = list(targets)
+    lengths = np.fromiter((len(target) for target in targets), dtype=np.int64, count=len(targets))
+    max_scores = np.maximum(lengths, len(query)) * match_score
+    similarities = np.zeros(len(targets), dtype=np.float64)
+    # Empty sequences have no alignment and keep a similarity of 0
+    aligned = lengths > 0 if query else np.zeros(len(targets), dtype=bool)
+    min_scores = None
+    if threshold is not None:
+        min_scores = np.ceil(threshold * max_scores - 1e-9).astype(np.int64)
+        similarities[~aligned & (threshold > 0)] = np.nan
+    if aligned.any():
+        scores = alignment_scores_many(query, [targets[index] for index in np.flatnonzero(aligned)], match_score,
+                                       mismatch_penalty, gap_penalty, block_size,
+                                       None if min_scores is None else min_scores[aligned], deadline=deadline)
+        similarities[aligned] = np.where(scores == REJECTED_SCORE, np.nan, scores / max_scores[aligned])
+    return similarities
@@ -1,113 +1,82 @@
 # Import necessary libraries
 
 # Flask related imports
-from flask import render_template, request, jsonify, Flask
+from flask import render_template, request, jsonify, Flask, Response, stream_with_context, g
 
 # Bioinformatics related imports
-from Bio import pairwise2
-
-# HTTP requests
-import requests
+from alignment import needleman_wunsch_similarity
+from population import PopulationStore, PopulationUnavailable
+from fasta import read_sequence, read_records, InvalidSequence
+from scan_pool import ScanPool, ScanResult
+from similarity_cache import SimilarityCache, RedisSimilarityBackend
+from seed_extend import seed_extend_similarity
+from jobs import JobManager, JobsUnavailable, MemoryBroker, RedisBroker
+from model_registry import ModelRegistry, ModelUnavailable
+import metrics
+from metrics import span, CallbackCounter
 
 # Data processing and machine learning imports
-import pandas as pd
 from sklearn.preprocessing import MaxAbsScaler
 from sklearn.feature_extraction.text import CountVectorizer
 import lightgbm as lgb
-
-# Sparse matrices and serialization
-import pickle as pkl
+import numpy as np
 
 # Error handling and threading
-import traceback as tb
 import threading
 import time
+import io
+import json
+import math
+import os
 
 
 application = Flask(__name__, template_folder='../templates', static_folder='../static')
-API_URL = 'https://dna-testing-system-jl95.onrender.com/api/EisaAPI'
+# POPULATION_API_URL points the application at another population API, such as the benchmark stand-in
+API_URL = os.environ.get('POPULATION_API_URL', 'https://dna-testing-system-jl95.onrender.com/api/EisaAPI')
+# Persistent population snapshot, memory-mapped by every worker
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'population_snapshot'))
+# Process-wide cache of the population API, revalidated in the background once older than the TTL
+population_store = PopulationStore(API_URL, ttl=60, stale_ttl=600, snapshot_dir=SNAPSHOT_DIR)
+# Process pool of the population scans, started once per worker; SCAN_PROCESSES=0 scans in the request thread
+SCAN_PROCESSES = int(os.environ.get('SCAN_PROCESSES', max((os.cpu_count() or 1) // 2, 1)))
+SCAN_CHUNK_SIZE = int(os.environ.get('SCAN_CHUNK_SIZE', 64))
+# Seconds a request may spend scanning, below the gunicorn worker timeout so partial results are returned
+SCAN_DEADLINE = float(os.environ.get('SCAN_DEADLINE', 100))
+# Similarities already computed for a query and a sequence, SIMILARITY_CACHE_SIZE=0 disables the cache;
+# with SIMILARITY_CACHE_URL (Redis) the workers share their entries
+SIMILARITY_CACHE_SIZE = int(os.environ.get('SIMILARITY_CACHE_SIZE', 100000))
+SIMILARITY_CACHE_URL = os.environ.get('SIMILARITY_CACHE_URL')
+similarity_cache = SimilarityCache(
+    SIMILARITY_CACHE_SIZE,
+    RedisSimilarityBackend.from_url(SIMILARITY_CACHE_URL) if SIMILARITY_CACHE_URL else None)
+scan_pool = ScanPool(SCAN_PROCESSES, SCAN_CHUNK_SIZE, cache=similarity_cache)
+for _name, _documentation, _attribute in (
+        ('dna_similarity_cache_hits_total', 'Similarities answered from the similarity cache.', 'hits'),
+        ('dna_similarity_cache_misses_total', 'Similarities missing from the similarity cache.', 'misses'),
+        ('dna_similarity_cache_evictions_total', 'Entries evicted from the similarity cache.', 'evictions')):
+    metrics.registry.register(CallbackCounter(_name, _documentation,
+                                              lambda attribute=_attribute: getattr(similarity_cache, attribute)))
+# With METRICS_DIR, the workers write their metrics there and /metrics adds up every worker
+metrics.registry.directory = os.environ.get('METRICS_DIR')
+# /compare aligns full-length sequences with seed-and-extend once one is longer than LONG_COMPARE_LENGTH
+# bases (0 keeps truncating to 2000 bases); uploads are read up to MAX_COMPARE_LENGTH bases
+LONG_COMPARE_LENGTH = int(os.environ.get('LONG_COMPARE_LENGTH', 2000))
+MAX_COMPARE_LENGTH = int(os.environ.get('MAX_COMPARE_LENGTH', 10000000))
 
-def needleman_wunsch_similarity(seq1, seq2, match_score=3, mismatch_penalty=-1, gap_penalty=-2):
-    alignments = pairwise2.align.globalms(seq1, seq2, match_score, mismatch_penalty, gap_penalty, gap_penalty)
-    """
-    Calculates the similarity score between two sequences using the Needleman-Wunsch algorithm.
-
-    Parameters:
-        seq1 (str): First DNA sequence.
-        seq2 (str): Second DNA sequence.
-        match_score (int, optional): Score for matches. Defaults to 3.
-        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
-        gap_penalty (int, optional): Penalty for gaps. Defaults to -2.
 
-    Returns:
-        float: Similarity score between the two sequences.
+def scan_payload(payload, scan):
     """
-    if not alignments:
-        return 0.0
-    best_alignment = alignments[0] # Highest score alignment 
-    alignment_score = best_alignment[2]  # Score of the best alignment
-    max_score = max(len(seq1), len(seq2)) * match_score  # Score of the maximum alignment
-    similarity_score = alignment_score / max_score  # Calculate the similarity score
-    # Return the similarity score
-    return similarity_score 
-
-
+    Flags a response built from a partial scan.
 
-def retrieve_dna_sequence_from_file(file, max_length=2000):
-    """
-    Retrieves DNA sequence data from a file, respecting a maximum length constraint.
-    
     Parameters:
-        file (file object): A file object containing DNA sequence data.
-        max_length (int, optional): The maximum length of DNA sequence to retrieve. Defaults to 2000.
+        payload (dict): The response fields.
+        scan (ScanResult): The scan the response is built from, None if there was none.
     Returns:
-        str: DNA sequence data extracted from the file, truncated to `max_length` if necessary.
-    """
-    data = b''  # Initialize as bytes
-    total_length = 0
-    # Read the file line by line
-    for line in file:
-        line = line.strip()  # Remove leading/trailing whitespace
-        if line.startswith(b'>'):   # Check if the line is a header line (starts with '>')
-            continue 
-        remaining_length = max_length - total_length
-        if remaining_length <= 0:
-            break  # Exit loop if the limit is reached
-        # Append data to the byte string, truncating if necessary
-        data += line[:remaining_length]
-        total_length += min(len(line), remaining_length)    # Update the total length
-    return data.decode()  # Decode the byte string to a regular string and return it
-
-def retrieve_api_data(API_URL):
-    """
-    Retrieve data from an API.
-
-    Parameters:
-        API_URL (str): The URL of the API.
-    Returns:
-        dict: The API response data, or an error message if the request fails.
+        dict: The payload, with "complete": false if the scan ran out of time.
     """
-    try:
-        # Make a GET request to the API
-        response = requests.get(API_URL)
-        # Check the status code of the response
-        if response.status_code == 200:
-            # return the response as a dictionary
-            api_data = response.json()
-            # Check if the response is in the expected format
-            if not isinstance(api_data, dict) or 'population' not in api_data:
-                # Return an error message if the response is not in the expected format or missing required keys
-                return {"error": "API response is not in the expected format."}
-            else:
-                # Return the response as a dic
-                return api_data
-        else:
-            # Return an error message if the response status code is not 200
-            return {"error": "Failed to retrieve data from API"}
-    # Catch any exceptions 
-    except Exception as e:
-        # Return an error message if the request fails    
-        return {"error": str(e)}
+    if scan is not None and not scan.complete:
+        payload["complete"] = False
+    return payload
 
 # worker 
 
@@ -117,6 +86,46 @@ def worker():
     time.sleep(50)
     print("Exiting worker")
     
+
+@application.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Opt-in profiling: the response gets a Server-Timing header with the time of each stage
+    if request.headers.get('X-Profile'):
+        metrics.start_profile()
+
+
+@application.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint)
+    metrics.REQUESTS.inc(1, endpoint, response.status_code)
+    profile = metrics.stop_profile()
+    if profile is not None:
+        stages = {}
+        for stage, seconds in profile:
+            stages[stage] = stages.get(stage, 0) + seconds
+        stages['total'] = elapsed
+        response.headers['Server-Timing'] = ', '.join(f'{stage};dur={seconds * 1000:.3f}' for stage, seconds in stages.items())
+    metrics.registry.write()
+    return response
+
+
+@application.route('/metrics', methods=['GET'])
+def metrics_page():
+    """Latency histograms and counters of every stage, in the Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@application.errorhandler(InvalidSequence)
+def invalid_sequence(e):
+    """Returns an error message when an uploaded file is not a DNA sequence."""
+    return jsonify({
+        "message": str(e),
+        "statusCode": 400
+    }), {'Connection': 'keep-alive'}
+
  # Home page
 @application.route('/')
 def home_page():
@@ -134,11 +143,22 @@ def compare_page():
     """
     return render_template('compare.html')
 
+
+def align_pair(sequence_a, sequence_b):
+    """Computes the similarity of two sequences, counting the alignment."""
+    metrics.ALIGNMENTS.inc()
+    return needleman_wunsch_similarity(sequence_a, sequence_b)
+
+
 @application.route('/compare', methods=['POST'])
 def compare():
     """
     upload two files and compare them using the needleman_wunsch_similarity function 
     if the files are not uploaded or if the files are empty, return an error message
+    Sequences longer than LONG_COMPARE_LENGTH are compared over their full length with
+    seed_extend_similarity, and the response then has "method": "seed_and_extend"; an
+    upload with an invalid symbol past its first 2000 bases is compared over those bases.
+    The similarity is global, so it goes below 0 when the lengths differ widely.
 
     Parameters:
         None.
@@ -164,10 +184,29 @@ def compare():
             "statusCode": 401
         })
     # Retrieve the DNA sequences from the uploaded files
-    sequence_a = retrieve_dna_sequence_from_file(file_a)
-    sequence_b = retrieve_dna_sequence_from_file(file_b)
-    # Compare the sequences using the needleman_wunsch_similarity function
-    similarity_score = needleman_wunsch_similarity(sequence_a, sequence_b)
+    sequence_a = sequence_b = None
+    if LONG_COMPARE_LENGTH > 0:
+        try:
+            sequence_a = read_sequence(file_a, max_length=MAX_COMPARE_LENGTH)
+            sequence_b = read_sequence(file_b, max_length=MAX_COMPARE_LENGTH)
+        except InvalidSequence:
+            # A symbol outside the alphabet past the first 2000 bases falls back to comparing those bases
+            file_a.seek(0)
+            file_b.seek(0)
+            sequence_a = sequence_b = None
+    if sequence_a is None:
+        sequence_a = read_sequence(file_a)
+        sequence_b = read_sequence(file_b)
+    extra = {}
+    if LONG_COMPARE_LENGTH > 0 and max(len(sequence_a), len(sequence_b)) > LONG_COMPARE_LENGTH:
+        # A full alignment of long sequences is too slow, chain exact seeds and align between them
+        with span('alignment'):
+            similarity_score = seed_extend_similarity(sequence_a, sequence_b)
+        extra["method"] = "seed_and_extend"
+    else:
+        # Compare the sequences using the needleman_wunsch_similarity function
+        with span('alignment'):
+            similarity_score = similarity_cache.similarity(sequence_a[:2000], sequence_b[:2000], align_pair)
     # Calculate the similarity percentage
     similarity_percentage = round(similarity_score * 100)
     # Determine the match status based on the similarity score. 
@@ -176,6 +215,7 @@ def compare():
     return jsonify({
         "similarity_percentage": similarity_percentage,
         "match_status": match_status,
+        **extra,
         "message": "Successful Comparison",
         "statusCode": 200
     })
@@ -190,106 +230,163 @@ def identify():
     """
     Upload a file containing DNA sequences and identify matches from an API data set
     using the needleman_wunsch_similarity function. The comparison is based on a 
-    similarity threshold.
+    similarity threshold: an exact (100%) identification is a lookup of identical
+    sequences, an optional lower 'threshold' form field (in percent) runs a full
+    alignment scan and returns the most similar entry meeting it.
 
     Parameters:
         None.
 
     Returns:
         A JSON response with match information, similarity percentage, match status, and a message: dict
+        (with "complete": false if the scan reached the request deadline)
         A JSON response with an error message if the file is not uploaded or if the file is empty: dict
     """
+    # Scans stop at the request deadline and return what they found
+    deadline = time.monotonic() + SCAN_DEADLINE
+    arguments, error = read_identify_form()
+    if error is not None:
+        return jsonify(error), {'Connection': 'keep-alive'}
+    # Retrieve the population from the cached store
+    try:
+        population = population_store.get()
+    except PopulationUnavailable as e:
+        # Return an error message if the population could not be retrieved or is not in the expected format
+        return jsonify({
+            "message": str(e),
+            "statusCode": 401
+        }), {'Connection': 'keep-alive'}
+    response = jsonify(identify_in_population(population, *arguments, deadline=deadline))
+    # Set the connection header to keep-alive
+    response.headers['Connection'] = 'keep-alive'
+    return response
+
+
+def status_error(selected_status):
+    """
+    Validates the status of the population records to search.
+
+    Parameters:
+        selected_status (str): Status from the form.
+    Returns:
+        dict: The error payload, None if the status is valid.
+    """
+    valid_statuses = ['missing', 'acknowledged', 'crime', 'disaster']
+    if selected_status != 'all' and selected_status not in valid_statuses:
+        # Return an error message if selected status is not valid
+        return {
+            "message":
+                "Invalid status. Please select one of: 'missing', 'acknowledged', 'crime', 'disaster' or 'all' to search in all database.",
+            "statusCode": 400
+        }
+    return None
+
+
+def read_identify_form(reader=read_sequence):
+    """
+    Reads and validates the uploaded file and the form fields of an identification.
+
+    Parameters:
+        reader (callable, optional): Reads the uploaded file. Defaults to read_sequence.
+    Returns:
+        tuple: (sequence, status, similarity threshold between 0 and 1) and an error payload, one of them None.
+    """
     # Check if 'file' parameter is provided in the request
     if 'file' not in request.files:
         # Return an error message if the file is not uploaded 
-        return jsonify({
+        return None, {
             "message": "Please upload a file of DNA sequences.",
             "statusCode": 401
-        }), {'Connection': 'keep-alive'}
+        }
 
     # Get the uploaded file from the form
     file_a = request.files['file']
     if file_a.filename == '':
         # Return an error message if the file is empty 
-        return jsonify({
+        return None, {
             "message": "Please upload a non-empty file for the DNA sequence.",
             "statusCode": 401
-        }), {'Connection': 'keep-alive'}
+        }
     # Get the selected status from the form 
     selected_status = request.form.get('status')
+    # Get the optional similarity threshold in percent, only a fuzzy threshold needs a full alignment scan
+    try:
+        threshold_percentage = float(request.form.get('threshold', 100))
+    except ValueError:
+        threshold_percentage = None
+    if threshold_percentage is None or not 0 < threshold_percentage <= 100:
+        return None, {
+            "message": "Invalid threshold. Please provide a similarity percentage between 0 and 100.",
+            "statusCode": 400
+        }
+    # Check the selected status
+    error = status_error(selected_status)
+    if error is not None:
+        return None, error
+    # Retrieve DNA sequence from the uploaded file with a maximum length of 2000 bases,
+    # uppercased like the population sequences
+    sequence_a = reader(file_a, max_length=2000)
+    # Threshold for similarity score (1 is a 100% match)
+    return (sequence_a, selected_status, threshold_percentage / 100), None
 
-    # Retrieve API data
-    api_data = retrieve_api_data(API_URL)
-    # Check if API data is a dictionary and contains 'population' key
-    if 'error' in api_data:
-        # Return an error message if the API data is not a dictionary or does not contain 'poplation' key 
-        return jsonify({
-            "message": api_data['error'],
-            "statusCode": 401
-        }), {'Connection': 'keep-alive'}
-    # Retrieve DNA sequence from the uploaded file with a maximum length of 2000 bases
-    sequence_a = retrieve_dna_sequence_from_file(file_a, max_length=2000)
+
+def identify_in_population(population, sequence_a, selected_status, similarity_threshold, deadline=None, progress=None):
+    """
+    Identifies the population entry matching a DNA sequence.
+
+    Parameters:
+        population (PopulationSnapshot): The population.
+        sequence_a (str): Uploaded DNA sequence.
+        selected_status (str): Status of the entries to search, or 'all'.
+        similarity_threshold (float): Similarity a match must reach (1 is a 100% match).
+        deadline (float, optional): time.monotonic() at which the scan stops. Defaults to None.
+        progress (callable, optional): Called with the fraction of the scan done. Defaults to None.
+    Returns:
+        dict: The identification response.
+    """
     # Initialize variables for match information
     matches = []
-    similarity_threshold = 1  # Threshold for similarity score (100% match)
-    match_status = "No match found"
-
-    # Extract necessary keys for match information from API data
-    info_keys = ['name', 'status', 'description', 'createdAt', 'updatedAt', 
-                 'address', 'national_id', 'phone', 'gender', 'birthdate', 'bloodType']
-
-    # Check if API data is a dictionary and contains 'population' key
-    if isinstance(api_data, dict) and 'population' in api_data:
-        if selected_status == 'all':
-            filtered_data = api_data['population']
-        else:   
-            # Extract filtered data based on selected status
-            valid_statuses = ['missing', 'acknowledged', 'crime', 'disaster']
-            if selected_status not in valid_statuses:
-                # Return an error message if selected status is not valid
-                return jsonify({
-                    "message":
-                        "Invalid status. Please select one of: 'missing', 'acknowledged', 'crime', 'disaster' or 'all' to search in all database.",
-                    "statusCode": 400
-                }), {'Connection': 'keep-alive'}
-            # Filter API data based on selected status
-            filtered_data = [entry for entry in api_data['population'] if entry.get('status') == selected_status]
-        # Iterate over filtered data and compare each entry's DNA sequence with the uploaded sequence
-        for entry in filtered_data:
-            if 'DNA_sequence' in entry:
-                # Retrieve DNA sequence for comparison, truncated to 2000 bases
-                sequence_b = entry['DNA_sequence'][:2000]
-                # Calculate similarity score between the two sequences
-                similarity_score = needleman_wunsch_similarity(sequence_a, sequence_b)
+    scan = None
+    if similarity_threshold == 1:
+        # A 100% similarity means identical sequences, so look the sequence up instead of aligning
+        exact_matches = population.exact_index.lookup(sequence_a, selected_status)
+        if exact_matches:
+            match_info = dict(exact_matches[0].info)
+            matches.append(match_info)
+            similarity_percentage = 100
+    else:
+        # Compare the uploaded sequence with the DNA sequence of every entry with the selected status in one batch
+        filtered_data = population.filter(selected_status)
+        # Entries that cannot reach the threshold are rejected early by a banded alignment
+        scan = scan_pool.scan(population, filtered_data, sequence_a, threshold=similarity_threshold,
+                              deadline=deadline, progress=progress)
+        best_score = None
+        for index, similarity_score, scanned in zip(filtered_data, scan.scores.tolist(), scan.scanned.tolist()):
+            # A NaN score is a rejected entry
+            if not scanned or math.isnan(similarity_score):
+                continue
+            record = population.records[index]
+            # Keep the most similar entry that meets the threshold
+            if similarity_score >= similarity_threshold and (best_score is None or similarity_score > best_score):
+                match_info = dict(record.info)
+                matches.append(match_info)
+                best_score = similarity_score
                 similarity_percentage = round(similarity_score * 100)
-                print(f"Comparing with {entry.get('name', 'unknown')} - Similarity Score: {similarity_score}, Similarity Percentage: {similarity_percentage}%")
-                # Check if similarity score meets the threshold
-                if similarity_score == similarity_threshold:
-                    # Extract match information
-                    match_info = {key: entry[key] for key in info_keys if key in entry}
-                    matches.append(match_info)
-                    if similarity_percentage == 100:
-                        # Stop the search if a perfect match is found
-                        break
-    # Check if there are any matches found and return the response as JSON
+    # Check if there are any matches found and return the response
     if matches:
-        response = jsonify({
+        return scan_payload({
             "matches": match_info,
             "similarity_percentage": similarity_percentage,
             "match_status": "DNA MATCH",
             "message": "Successful identification",
             "statusCode": 200
-        })
-    else:
-        # Return an message if no matches are found or the similarity score does not meet the threshold
-        response = jsonify({
-            "message": "Successful identification",
-            "match_status": "DNA NOT MATCH",
-            "statusCode": 200
-        })
-    # Set the connection header to keep-alive
-    response.headers['Connection'] = 'keep-alive'
-    return response
+        }, scan)
+    # Return an message if no matches are found or the similarity score does not meet the threshold
+    return scan_payload({
+        "message": "Successful identification",
+        "match_status": "DNA NOT MATCH",
+        "statusCode": 200
+    }, scan)
 
 @application.route('/missing', methods=['GET', 'POST'])
 def missing():
@@ -307,123 +404,476 @@ def missing():
 
     Returns:
         JSON response: dict containing information about the main DNA match, potential relatives, 
-                    and status messages indicating the outcome of the operation.
+                    and status messages indicating the outcome of the operation. A scan that reaches
+                    the request deadline returns what it found with "complete": false.
+        With ?stream=ndjson or ?stream=sse (or an Accept header of application/x-ndjson or
+        text/event-stream), the events of missing_events() are streamed as they happen instead:
+        progress frames, each match and potential relative as soon as it is found, and a final
+        "result" frame with the fields of the JSON response, which are authoritative.
     """
     # Handle GET request
     if request.method == 'GET':
         return render_template('missing.html')
+    deadline = time.monotonic() + SCAN_DEADLINE
+    # Optional streaming of matches and progress as they are found
+    stream_format = request.args.get('stream') or request.form.get('stream')
+    if stream_format is None:
+        accepted = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson', 'text/event-stream'])
+        stream_format = {'application/x-ndjson': 'ndjson', 'text/event-stream': 'sse'}.get(accepted)
+    sequence_a, error = read_missing_form()
+    if error is not None:
+        return jsonify(error), {'Connection': 'keep-alive'}
+    # Retrieve the population from the cached store
+    try:
+        population = population_store.get()
+    except PopulationUnavailable as e:
+        return jsonify({
+            "message": str(e),
+            "statusCode": 401
+        }), {'Connection': 'keep-alive'}
+    if stream_format in ('ndjson', 'sse'):
+        return stream_events(missing_events(population, sequence_a, deadline=deadline), stream_format)
+    return jsonify(search_missing(population, sequence_a, deadline=deadline)), {'Connection': 'keep-alive'}
+
+
+def read_missing_form(reader=read_sequence):
+    """
+    Reads and validates the uploaded file of a missing person search.
+
+    Parameters:
+        reader (callable, optional): Reads the uploaded file. Defaults to read_sequence.
+    Returns:
+        tuple: The uploaded sequence and an error payload, one of them None.
+    """
     # Check if file part is  in the request
     if 'file' not in request.files:
-        return jsonify({
+        return None, {
             "message": "Please upload a file of DNA sequences.",
             "statusCode": 401
-        }), {'Connection': 'keep-alive'}
+        }
 
     file_a = request.files['file']
     # Check if the uploaded file is not empty 
     if file_a.filename == '':
-        return jsonify({
+        return None, {
             "message": "Please upload a non-empty file for the DNA sequence.",
             "statusCode": 401
-        }), {'Connection': 'keep-alive'}
-    # Retrieve the DNA sequence from the uploaded file 
-    sequence_a = retrieve_dna_sequence_from_file(file_a, max_length=2000)
-    # Retrieve API data 
-    api_data = retrieve_api_data(API_URL)
-    # Handle API error response
-    if 'error' in api_data:
-        return jsonify({
-            "message": api_data['error'],
-            "statusCode": 401
-        }), {'Connection': 'keep-alive'}
+        }
+    # Retrieve the DNA sequence from the uploaded file, uppercased like the population sequences
+    return reader(file_a, max_length=2000), None
+
+
+# Thresholds for determining similarity
+SIMILARITY_THRESHOLD = 100
+SIMILARITY_THRESHOLD_CHILD = 96
+# Lowest similarity that rounds up to the relative threshold
+MIN_RELATIVE_SIMILARITY = (SIMILARITY_THRESHOLD_CHILD - 0.5) / 100
+# Seconds between the progress events of a streamed search
+PROGRESS_INTERVAL = 0.5
+
+
+def missing_events(population, sequence_a, deadline=None):
+    """
+    Runs a missing person search, yielding its events as they happen.
+
+    Events are dicts with a "type":
+    - "progress": "scanned" of "total" candidate records aligned after "elapsed" seconds
+    - "match": "main_match_info" of an exact match, as soon as its chunk is aligned
+    - "relative": "relative_data" of a potential relative, as soon as its chunk is aligned
+    - "result": the final response fields, as returned by /missing; they are authoritative
+      (a relative streamed before the exact match of the same person is left out of them)
+
+    Parameters:
+        population (PopulationSnapshot): The population.
+        sequence_a (str): Uploaded DNA sequence.
+        deadline (float, optional): time.monotonic() at which the scan stops. Defaults to None.
+    Yields:
+        dict: The events of the search.
+    """
+    start = time.monotonic()
+    # Only records sharing enough k-mers can reach the relative threshold
+    candidates = population.kmer_index.candidates(sequence_a, MIN_RELATIVE_SIMILARITY)
+    metrics.KMER_CANDIDATES.observe(len(candidates))
+    scores = np.full(len(candidates), np.nan)
+    scanned = np.zeros(len(candidates), dtype=bool)
+
+    def progress_event():
+        return {"type": "progress", "scanned": int(scanned.sum()), "total": len(candidates),
+                "elapsed": round(time.monotonic() - start, 3)}
+
+    yield progress_event()
+    last_progress = time.monotonic()
+    # Align the candidates in chunks, abandoning records as soon as they cannot reach the
+    # threshold (their similarity is NaN)
+    for chunk, chunk_scores in scan_pool.iter_chunks(population, candidates, sequence_a,
+                                                     threshold=MIN_RELATIVE_SIMILARITY, deadline=deadline):
+        scores[chunk] = chunk_scores
+        scanned[chunk] = True
+        for index, similarity_score in zip(candidates[chunk].tolist(), chunk_scores.tolist()):
+            if math.isnan(similarity_score):
+                continue
+            record = population.records[index]
+            similarity_percentage = round(similarity_score * 100)
+            if similarity_percentage == SIMILARITY_THRESHOLD:
+                yield {"type": "match", "main_match_info": {
+                    **record.info, "similarity_percentage": similarity_percentage, "match_status": "DNA MATCH"}}
+            elif similarity_percentage >= SIMILARITY_THRESHOLD_CHILD:
+                yield {"type": "relative", "relative_data": dict(record.info)}
+        if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+            yield progress_event()
+            last_progress = time.monotonic()
+    yield progress_event()
+    yield {"type": "result", **missing_response(population, candidates, ScanResult(scores, scanned))}
 
+
+def missing_response(population, candidates, scan):
+    """
+    Builds the /missing response from the similarities of the candidate records.
+
+    Parameters:
+        population (PopulationSnapshot): The population.
+        candidates (numpy.ndarray): Positions of the candidate records.
+        scan (ScanResult): Similarities of the candidates, NaN below the relative threshold.
+    Returns:
+        dict: The search response.
+    """
     match_info = {} # Dictionary to hold information of exact DNA match 
     potential_children_info = []  # List to hold information of potential relatives - Childern
-    
-    # Keys for extracting relevant information from the API data 
-    info_keys = ['name', 'status', 'description', 'createdAt', 'updatedAt', 
-                 'address', 'national_id', 'phone', 'gender', 'birthdate', 'bloodType']
-    
-    # Thresholds for determining similarity
-    SIMILARITY_THRESHOLD = 100
-    SIMILARITY_THRESHOLD_CHILD = 96
-    
-    # Check if the API data contains a population
-    if isinstance(api_data, dict) and 'population' in api_data:
-        for entry in api_data['population']:
-            if 'DNA_sequence' in entry:
-                # Compare the DNA sequence with the uploaded sequence
-                sequence_b = entry['DNA_sequence'][:2000]
-                similarity_score = needleman_wunsch_similarity(sequence_a, sequence_b)
-                similarity_percentage = round(similarity_score * 100)
+    for index, similarity_score in zip(candidates.tolist(), scan.scores.tolist()):
+        # Also skips records not scanned before the deadline
+        if math.isnan(similarity_score):
+            continue
+        record = population.records[index]
+        similarity_percentage = round(similarity_score * 100)
 
-                print(f"Comparing with {entry.get('name', 'unknown')} - Similarity Score: {similarity_score}, Similarity Percentage: {similarity_percentage}%")
-
-                # check for an exact match 
-                if similarity_percentage == SIMILARITY_THRESHOLD:
-                    match_info = {key: entry[key] for key in info_keys if key in entry}
-                    match_info["similarity_percentage"] = similarity_percentage
-                    match_info["match_status"] = "DNA MATCH"
-                
-                # check for potential child or relative
-                if similarity_percentage >= SIMILARITY_THRESHOLD_CHILD :
-                    child_info = {key: entry[key] for key in info_keys if key in entry}
-                    potential_children_info.append({
-                        "relative_data": child_info
-                    })
+        # check for an exact match 
+        if similarity_percentage == SIMILARITY_THRESHOLD:
+            match_info = dict(record.info)
+            match_info["similarity_percentage"] = similarity_percentage
+            match_info["match_status"] = "DNA MATCH"
+        
+        # check for potential child or relative
+        if similarity_percentage >= SIMILARITY_THRESHOLD_CHILD :
+            potential_children_info.append({
+                "relative_data": dict(record.info)
+            })
     # Prepare the response based on the matching information 
     if match_info:
         main_national_id = match_info.get("national_id")
         potential_children_info = [child for child in potential_children_info if child["relative_data"].get("national_id") != main_national_id]
         
         if potential_children_info:
-            return jsonify({
+            return scan_payload({
                 "main_match_info": match_info,
                 "potential_relative_info": potential_children_info,
                 "message": "Successful identification",
                 "statusCode": 200
-            })
+            }, scan)
         else:
-            return jsonify({
+            return scan_payload({
                 "main_match_info": match_info,
                 "potential_relative_info": None,
                 "message": "Successful identification",
                 "statusCode": 200
-            })
+            }, scan)
     elif not potential_children_info and not match_info:
-        return jsonify({
+        return scan_payload({
             "main_match_info": None,
             "potential_relative_info": None,
             "message": "No match found.",
             "statusCode": 200
-        }), {'Connection': 'keep-alive'}
+        }, scan)
         
     else: 
-            return jsonify({
+            return scan_payload({
                 "main_match_info": None,
                 "potential_relative_info": potential_children_info,
                 "message": "Founded a potential relative.",
                 "statusCode": 200
-            }), {'Connection': 'keep-alive'}
+            }, scan)
 
-def pickle_deserialize_object(file_path_name):
-    """Deserializes the object from the given path"""
-    data_object = None
+
+def search_missing(population, sequence_a, deadline=None, progress=None):
+    """
+    Searches the population for the exact match and the potential relatives of a DNA sequence.
+
+    Parameters:
+        population (PopulationSnapshot): The population.
+        sequence_a (str): Uploaded DNA sequence.
+        deadline (float, optional): time.monotonic() at which the scan stops. Defaults to None.
+        progress (callable, optional): Called with the fraction of the scan done. Defaults to None.
+    Returns:
+        dict: The search response.
+    """
+    for event in missing_events(population, sequence_a, deadline):
+        if event["type"] == "progress" and progress is not None and event["total"]:
+            progress(event["scanned"] / event["total"])
+        elif event["type"] == "result":
+            return {key: value for key, value in event.items() if key != "type"}
+
+
+def stream_events(events, stream_format):
+    """
+    Streams events as NDJSON lines or Server-Sent Events.
+
+    Parameters:
+        events (iterable of dict): Events with a "type".
+        stream_format (str): 'ndjson' or 'sse'.
+    Returns:
+        flask.Response: The streaming response.
+    """
+    if stream_format == 'sse':
+        body = (f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events)
+        mimetype = 'text/event-stream'
+    else:
+        body = (json.dumps(event) + "\n" for event in events)
+        mimetype = 'application/x-ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Largest number of FASTA records in a batch identification
+MAX_BATCH_RECORDS = 100
+
+
+def batch_response(records, search):
+    """
+    Runs a search for every record of a batch against one population snapshot.
+
+    Parameters:
+        records (list of tuple): (header, sequence) of each uploaded record.
+        search (callable): Called with the population and a sequence, returns the response of the record.
+    Returns:
+        tuple: The batch response and its HTTP headers, or an error naming the first record
+            without bases.
+    """
+    # Index and header of the first record without bases, such as a header with nothing under it
+    empty = next(((index, header) for index, (header, sequence) in enumerate(records) if not sequence), None)
+    if not records:
+        error = "Please upload a FASTA file with at least one record."
+    elif len(records) > MAX_BATCH_RECORDS:
+        error = f"Too many records, a batch holds at most {MAX_BATCH_RECORDS}."
+    elif empty is not None:
+        error = f"Invalid DNA sequence: record {empty[0]} ({empty[1]!r}) has no bases."
+    else:
+        error = None
+    if error is not None:
+        return jsonify({
+            "message": error,
+            "statusCode": 400
+        }), {'Connection': 'keep-alive'}
+    # The population is retrieved once and every record is scanned against the same snapshot,
+    # so its indexes and mapped sequences are reused across the batch
     try:
-        with open(file_path_name, "rb") as data_infile:
-            data_object = pkl.load(data_infile)
-    except Exception as e:
-        print(f"Error occurred while deserializing object: {e}")
-        tb.print_exc()
-    return data_object
-# Load models and vectorizers at startup
+        population = population_store.get()
+    except PopulationUnavailable as e:
+        return jsonify({
+            "message": str(e),
+            "statusCode": 401
+        }), {'Connection': 'keep-alive'}
+    results = [{
+        "id": index,
+        "header": header,
+        "result": search(population, sequence),
+    } for index, (header, sequence) in enumerate(records)]
+    return jsonify({
+        "results": results,
+        "message": "Successful identification",
+        "statusCode": 200
+    }), {'Connection': 'keep-alive'}
+
+
+@application.route('/identify/batch', methods=['POST'])
+def identify_batch():
+    """
+    Identifies every record of an uploaded multi-record FASTA file, with the form fields of /identify.
+
+    Parameters:
+        None.
+
+    Returns:
+        A JSON response with the /identify response of each record, in file order: dict
+        A JSON response with an error message if the file or the form fields are invalid: dict
+    """
+    # One deadline for the whole batch, records not scanned in time are flagged "complete": false
+    deadline = time.monotonic() + SCAN_DEADLINE
+    arguments, error = read_identify_form(reader=read_records)
+    if error is not None:
+        return jsonify(error), {'Connection': 'keep-alive'}
+    records, selected_status, similarity_threshold = arguments
+    return batch_response(records, lambda population, sequence: identify_in_population(
+        population, sequence, selected_status, similarity_threshold, deadline=deadline))
+
+
+@application.route('/missing/batch', methods=['POST'])
+def missing_batch():
+    """
+    Searches the exact match and potential relatives of every record of an uploaded multi-record FASTA file.
+
+    Parameters:
+        None.
+
+    Returns:
+        A JSON response with the /missing response of each record, in file order: dict
+        A JSON response with an error message if the file is invalid: dict
+    """
+    deadline = time.monotonic() + SCAN_DEADLINE
+    records, error = read_missing_form(reader=read_records)
+    if error is not None:
+        return jsonify(error), {'Connection': 'keep-alive'}
+    return batch_response(records, lambda population, sequence: search_missing(
+        population, sequence, deadline=deadline))
+
+
+# Asynchronous jobs: long searches are submitted, run by background workers and polled for.
+# JOB_BROKER_URL=redis://... (or the REDIS_URL of a Redis add-on) shares the jobs with job_worker.py
+# processes, unset keeps them in this process, which only works with a single web process
+JOB_BROKER_URL = os.environ.get('JOB_BROKER_URL') or os.environ.get('REDIS_URL')
+# Web processes run JOB_WORKERS job threads, started on their first submission so none run in the gunicorn master
+job_manager = JobManager(RedisBroker.from_url(JOB_BROKER_URL) if JOB_BROKER_URL else MemoryBroker(),
+                         result_ttl=float(os.environ.get('JOB_RESULT_TTL', 3600)),
+                         workers=int(os.environ.get('JOB_WORKERS', 0 if JOB_BROKER_URL else 2)))
+# Seconds a job may spend scanning
+JOB_DEADLINE = float(os.environ.get('JOB_DEADLINE', 3600))
+# Longest long-poll of a job status
+MAX_JOB_WAIT = 30
+
+
+def run_identify_job(payload, progress):
+    population = population_store.get()
+    return identify_in_population(population, payload['sequence'], payload['status'], payload['threshold'],
+                                  deadline=time.monotonic() + JOB_DEADLINE, progress=progress)
+
+
+def run_missing_job(payload, progress):
+    population = population_store.get()
+    return search_missing(population, payload['sequence'], deadline=time.monotonic() + JOB_DEADLINE, progress=progress)
+
+
+job_manager.register('identify', run_identify_job)
+job_manager.register('missing', run_missing_job)
+
+
+def require_shared_jobs():
+    """
+    Checks that every web process sees the jobs of this one.
+
+    gunicorn_config.py sets WEB_CONCURRENCY to the number of workers in each of them; it
+    is unset under a single-process server. With several workers, a job kept in a
+    MemoryBroker would be unknown to the worker that answers its status requests.
+
+    Raises:
+        JobsUnavailable: If the broker is in-process and there are several web processes.
+    """
+    if not job_manager.broker.shared and int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+        raise JobsUnavailable("Asynchronous jobs need a shared broker (JOB_BROKER_URL) with several web workers.")
+
+
+@application.errorhandler(JobsUnavailable)
+def jobs_unavailable(e):
+    return jsonify({
+        "message": str(e),
+        "statusCode": 503
+    }), 503
+
+
+def job_submitted(job):
+    """Returns the response of a submitted job."""
+    return jsonify({
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "message": "Job submitted",
+        "statusCode": 202
+    }), 202
+
+
+@application.route('/jobs/identify', methods=['POST'])
+def submit_identify_job():
+    """
+    Submits an identification job, with the same form as /identify.
+
+    Returns:
+        A JSON response with the job id and the URL to poll: dict
+        A JSON response with an error message if the form is invalid: dict
+    """
+    require_shared_jobs()
+    arguments, error = read_identify_form()
+    if error is not None:
+        return jsonify(error)
+    sequence_a, selected_status, similarity_threshold = arguments
+    return job_submitted(job_manager.submit('identify', {
+        "sequence": sequence_a, "status": selected_status, "threshold": similarity_threshold}))
+
+
+@application.route('/jobs/missing', methods=['POST'])
+def submit_missing_job():
+    """
+    Submits a missing person search job, with the same form as /missing.
+
+    Returns:
+        A JSON response with the job id and the URL to poll: dict
+        A JSON response with an error message if the file is missing: dict
+    """
+    require_shared_jobs()
+    sequence_a, error = read_missing_form()
+    if error is not None:
+        return jsonify(error)
+    return job_submitted(job_manager.submit('missing', {"sequence": sequence_a}))
+
+
+@application.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Returns the status, progress and, once finished, the result of a job.
+
+    The optional 'wait' query parameter long-polls: the response is sent when the job
+    finishes or after that many seconds (at most MAX_JOB_WAIT).
+
+    Returns:
+        A JSON response with the job record: dict
+        A JSON response with an error message if the job does not exist or expired: dict
+    """
+    require_shared_jobs()
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), MAX_JOB_WAIT)
+    except ValueError:
+        wait = 0
+    job = job_manager.get(job_id, wait)
+    if job is None:
+        return jsonify({
+            "message": "Job not found or expired.",
+            "statusCode": 404
+        }), 404
+    return jsonify({**job, "statusCode": 200})
+
+# Kinship model artifacts, loaded once (before gunicorn forks with preload_app) and reloaded when the files change.
+# A missing artifact leaves the model endpoints answering 503 while the alignment endpoints keep
+# working; MODELS_REQUIRED=1 stops the startup instead, for deployments that must serve predictions.
+MODELS_DIR = os.environ.get('MODELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+model_registry = ModelRegistry(MODELS_DIR, model_file=os.environ.get('MODEL_FILE', 'finalized_model_lgb.pkl'),
+                               check_interval=float(os.environ.get('MODEL_RELOAD_INTERVAL', 30)))
 try:
-    vectorizer = pickle_deserialize_object("../models/vectorizer.pkl")
-    model = pickle_deserialize_object("../models/finalized_model_lgb.pkl")
-    scaler = pickle_deserialize_object("../models/scaler.pkl")
-except Exception as e:
+    model_registry.load()
+except ModelUnavailable as e:
+    if os.environ.get('MODELS_REQUIRED', '0') == '1':
+        raise
     print(f"Error loading model/vectorizer: {e}")
 
+
+@application.errorhandler(ModelUnavailable)
+def model_unavailable(e):
+    return jsonify({
+        "message": str(e),
+        "statusCode": 503
+    }), 503
+
+
+@application.route('/models', methods=['GET'])
+def model_status():
+    """Reports whether the model artifacts are loaded, when, and how long each took to load."""
+    return jsonify(model_registry.status())
+
 #Helper functions from doctor bonat script 
 def k_mer_words_original(dna_sequence_string, k_mer_length=7):
     return [dna_sequence_string[x:x + k_mer_length].lower() for x in range(len(dna_sequence_string) - k_mer_length + 1)]
@@ -442,31 +892,6 @@ def bag_of_words(word_column, word_ngram):
     return X
 
 
-def pickle_deserialize_object(file_path_name):
-    """
-    Deserialize an object from a file using pickle.
-    
-    Args:
-        file_path_name (str): The path and name of the file from which the object will be loaded.
-    
-    Returns:
-        object: The deserialized object. Returns None if deserialization fails.
-    
-    Raises:
-        Exception: If there is any error during the deserialization process.
-    """
-    data_object = None
-    try:
-        with open(file_path_name, "rb") as data_infile:
-            data_object = pkl.load(data_infile)
-    except Exception as e:
-        print(f"Error occurred while deserializing object: {e}")
-        tb.print_exc()
-    return data_object
-
-# Helper functions from Model script 
-def generate_k_mers(sequence, k):
-    return [sequence[i:i+k] for i in range(len(sequence)-k+1)]
 @application.route('/predict', methods=['GET'])
 def home():
     return render_template('predict.html')
@@ -489,30 +914,18 @@ def predict():
             "statusCode": 401
         })
 
-    parent_dna = retrieve_dna_sequence_from_file(file_a)
-    child_dna = retrieve_dna_sequence_from_file(file_b)
-    # Generate k-mers
-    k = 7
-    parent_kmers = ' '.join(generate_k_mers(parent_dna, k))
-    child_kmers = ' '.join(generate_k_mers(child_dna, k))
-    # Vectorize sequences
+    parent_dna = read_sequence(file_a)
+    child_dna = read_sequence(file_b)
+    artifacts = model_registry.get()
+    # Build the sparse, scaled parent+child k-mer count row from integer k-mer codes
     try:
-        parent_vector = vectorizer.transform([parent_kmers]).toarray()
-        child_vector = vectorizer.transform([child_kmers]).toarray()
+        features = artifacts.featurizer.pair_features([(parent_dna, child_dna)], artifacts.scale)
     except Exception as e:
         return jsonify({'error': f'Error in vectorization: {e}'}), 500
-    # Concatenate features
-    X_parent_new = pd.DataFrame(parent_vector)
-    X_child_new = pd.DataFrame(child_vector)
-    features = pd.concat([X_parent_new, X_child_new], axis=1)
-    # Scale features
-    try:
-        features = scaler.transform(features)
-    except Exception as e:
-        return jsonify({'error': f'Error in scaling features: {e}'}), 500
     # Make a prediction
     try:
-        prediction = model.predict(features)
+        with span('model_predict'):
+            prediction = artifacts.model.predict(features)
     except Exception as e:
         return jsonify({'error': f'Error in making prediction: {e}'}), 500 
     result = 'relative' if prediction[0] == 1 else 'not relative'
@@ -528,6 +941,197 @@ def predict():
             "message": "Successful Prediction",
             "statusCode": 200,
         })
+
+# Largest number of parent/child pairs accepted by one batch prediction
+MAX_BATCH_PAIRS = 1000
+
+
+def read_batch_pairs():
+    """
+    Reads the parent/child pairs of a batch prediction request.
+
+    The pairs are either uploaded as repeated 'file_a' (parent) and 'file_b' (child)
+    multipart files, paired in order, or sent as an NDJSON body (Content-Type
+    application/x-ndjson) with one {"id": ..., "parent": ..., "child": ...} object per
+    line, where 'id' is optional and the sequences are plain or FASTA text.
+
+    Returns:
+        tuple: List of (id, parent, child) and an error message, one of them None.
+    Raises:
+        InvalidSequence: If a sequence contains symbols outside the DNA alphabet.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        pairs = []
+        for number, line in enumerate(request.get_data().splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                item = None
+            if not isinstance(item, dict) or not isinstance(item.get('parent'), str) or not isinstance(item.get('child'), str):
+                return None, f"Line {number} is not a JSON object with 'parent' and 'child' sequences."
+            pairs.append((item.get('id', len(pairs)),
+                          read_sequence(io.BytesIO(item['parent'].encode())),
+                          read_sequence(io.BytesIO(item['child'].encode()))))
+        return pairs, None
+    parents = request.files.getlist('file_a')
+    children = request.files.getlist('file_b')
+    if len(parents) != len(children) or any(file.filename == '' for file in parents + children):
+        return None, "Please upload one non-empty 'file_b' for each 'file_a'."
+    return [(parent.filename, read_sequence(parent), read_sequence(child))
+            for parent, child in zip(parents, children)], None
+
+
+@application.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Predicts the kinship of many parent/child pairs in one request.
+
+    All pairs are featurized into one sparse matrix, scaled and passed to the model in a
+    single call, so the per-call overhead is paid once per batch instead of once per pair.
+
+    Parameters:
+        None.
+
+    Returns:
+        A JSON response with the prediction of each pair, in request order: dict
+        A JSON response with an error message if the pairs are missing or malformed: dict
+    """
+    pairs, error = read_batch_pairs()
+    if error is None and not pairs:
+        error = "Please provide at least one parent/child pair."
+    elif error is None and len(pairs) > MAX_BATCH_PAIRS:
+        error = f"Too many pairs, a batch holds at most {MAX_BATCH_PAIRS}."
+    if error is not None:
+        return jsonify({
+            "message": error,
+            "statusCode": 400
+        })
+    artifacts = model_registry.get()
+    model = artifacts.model
+    try:
+        features = artifacts.featurizer.pair_features([(parent, child) for _, parent, child in pairs], artifacts.scale)
+    except Exception as e:
+        return jsonify({'error': f'Error in vectorization: {e}'}), 500
+    try:
+        with span('model_predict'):
+            if hasattr(model, 'predict_proba'):
+                # One call gives both, labels are picked like the classifier's predict()
+                probabilities = model.predict_proba(features)
+                labels = model.classes_[probabilities.argmax(axis=1)]
+                probabilities = probabilities[:, list(model.classes_).index(1)]
+            else:
+                labels = model.predict(features)
+                probabilities = [None] * len(pairs)
+    except Exception as e:
+        return jsonify({'error': f'Error in making prediction: {e}'}), 500
+    predictions = [{
+        "id": pair_id,
+        "prediction": 'relative' if label == 1 else 'not relative',
+        "probability": None if probability is None else float(probability),
+    } for (pair_id, _, _), label, probability in zip(pairs, labels, probabilities)]
+    return jsonify({
+        "predictions": predictions,
+        "message": "Successful Prediction",
+        "statusCode": 200,
+    })
+
+
+# Largest number of candidates returned by a relative ranking
+MAX_TOP_K = 100
+
+
+def relative_scores(model, features):
+    """
+    Scores feature rows with the kinship model in one call.
+
+    Parameters:
+        model: The kinship classifier.
+        features (scipy.sparse.csr_matrix): Scaled parent+child feature rows.
+    Returns:
+        numpy.ndarray: Probability of the 'relative' class for each row.
+    """
+    with span('model_predict'):
+        if hasattr(model, 'predict_proba'):
+            return model.predict_proba(features)[:, list(model.classes_).index(1)]
+        # A raw LightGBM Booster predicts the probability directly
+        return model.predict(features)
+
+
+@application.route('/rank', methods=['POST'])
+def rank_relatives():
+    """
+    Ranks the population records by the kinship model's probability of being related to an uploaded sequence.
+
+    The query is paired with every record with the selected status ('all' by default) in
+    one sparse feature matrix, scored with a single model call, and the `top_k` most
+    probable relatives are returned. The form field 'role' tells whether the uploaded
+    sequence is the 'parent' (default) or the 'child' of the pairs.
+
+    Parameters:
+        None.
+
+    Returns:
+        A JSON response with the ranked candidates and their probability: dict
+        A JSON response with an error message if the file or a parameter is invalid: dict
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({
+            "message": "Please upload a non-empty file for the DNA sequence.",
+            "statusCode": 401
+        }), {'Connection': 'keep-alive'}
+    selected_status = request.form.get('status', 'all')
+    query_role = request.form.get('role', 'parent')
+    try:
+        top_k = int(request.form.get('top_k', 10))
+    except ValueError:
+        top_k = 0
+    if not 1 <= top_k <= MAX_TOP_K or query_role not in ('parent', 'child'):
+        return jsonify({
+            "message": f"Invalid parameters. 'top_k' must be between 1 and {MAX_TOP_K} and 'role' either 'parent' or 'child'.",
+            "statusCode": 400
+        }), {'Connection': 'keep-alive'}
+    error = status_error(selected_status)
+    if error is not None:
+        return jsonify(error), {'Connection': 'keep-alive'}
+    sequence_a = read_sequence(request.files['file'], max_length=2000)
+    try:
+        population = population_store.get()
+    except PopulationUnavailable as e:
+        return jsonify({
+            "message": str(e),
+            "statusCode": 401
+        }), {'Connection': 'keep-alive'}
+    indices = population.filter(selected_status)
+    candidates = []
+    if indices:
+        artifacts = model_registry.get()
+        try:
+            matrix = artifacts.population_features.matrix(population)[indices]
+            features = artifacts.featurizer.query_features(sequence_a, matrix, query_role, artifacts.scale)
+        except Exception as e:
+            return jsonify({'error': f'Error in vectorization: {e}'}), 500
+        try:
+            scores = relative_scores(artifacts.model, features)
+        except Exception as e:
+            return jsonify({'error': f'Error in making prediction: {e}'}), 500
+        # Highest probability first, population order among ties
+        order = np.lexsort((np.arange(len(scores)), -scores))[:top_k]
+        for position in order.tolist():
+            record = population.records[indices[position]]
+            candidates.append({
+                "relative_data": dict(record.info),
+                "probability": float(scores[position]),
+                "prediction": 'relative' if scores[position] > 0.5 else 'not relative'
+            })
+    return jsonify({
+        "candidates": candidates,
+        "message": "Successful ranking",
+        "statusCode": 200
+    }), {'Connection': 'keep-alive'}
+
+
 if __name__ == "__main__":
     application.run(debug=True)
 
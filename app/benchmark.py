@@ -0,0 +1,383 @@
+# Throughput, latency and memory of the endpoints against a synthetic population
+#
+# Usage, from the app directory:
+#   python benchmark.py [--records 1000] [--length 2000] [--requests 50] [--concurrency 4]
+#                       [--mode client|gunicorn|both] [--workers 2] [--seed 0] [--output report.json]
+# A local stand-in of the population API serves `--records` synthetic records of `--length`
+# bases, mutated from the sequences in data/. /compare, /identify, /missing and /predict are
+# driven through the Flask test client in this process and/or through a gunicorn server on a
+# free port, and the report (throughput, p50/p99 latency, peak RSS) is printed as JSON.
+# /predict is reported as skipped when the model artifacts are not available.
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from fasta import read_sequence, InvalidSequence
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(APP_DIR, '..', 'data')
+STATUSES = ['missing', 'acknowledged', 'crime', 'disaster']
+
+
+def source_sequences(directory=DATA_DIR):
+    """Returns the sequence of every .txt file of `directory`, the first 2000 bases of files with invalid symbols."""
+    sequences = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.txt'))):
+        with open(path, 'rb') as file:
+            try:
+                sequence = read_sequence(file, max_length=None)
+            except InvalidSequence:
+                file.seek(0)
+                sequence = read_sequence(file, max_length=2000)
+        if sequence:
+            sequences.append(sequence)
+    return sequences
+
+
+def mutate(sequence, rate, rng):
+    """Applies random substitutions, insertions and deletions, each at a third of `rate` per base."""
+    bases = []
+    for base in sequence:
+        draw = rng.random()
+        if draw < rate / 3:
+            continue
+        if draw < 2 * rate / 3:
+            bases.append(rng.choice('ACGT'))
+            bases.append(base)
+        elif draw < rate:
+            bases.append(rng.choice('ACGT'))
+        else:
+            bases.append(base)
+    return ''.join(bases)
+
+
+def synthetic_population(count, length, seed=0, directory=DATA_DIR):
+    """
+    Generates a population API response of mutated windows of the sequences in data/.
+
+    Parameters:
+        count (int): Number of records.
+        length (int): Bases of each record, before mutation.
+        seed (int, optional): Random seed. Defaults to 0.
+        directory (str, optional): Directory of the source sequences. Defaults to DATA_DIR.
+    Returns:
+        dict: {"population": [...]} with the fields of the real API.
+    """
+    rng = random.Random(seed)
+    sources = source_sequences(directory)
+    population = []
+    for index in range(count):
+        source = sources[index % len(sources)]
+        # Short sources are repeated up to the requested length
+        repeated = source * (length // len(source) + 2)
+        start = rng.randrange(len(source))
+        population.append({
+            "_id": f"{index:08d}",
+            "name": f"synthetic_{index}",
+            "status": STATUSES[index % len(STATUSES)],
+            "national_id": str(index),
+            "updatedAt": "2024-01-01T00:00:00.000Z",
+            "DNA_sequence": mutate(repeated[start:start + length], rng.uniform(0, 0.1), rng),
+        })
+    return {"population": population}
+
+
+class PopulationServer:
+    """
+    Local stand-in of the population API, serving one JSON response with an ETag.
+
+    `responses` lists the status of every response, update() changes the population and
+    `delay` holds every response back by that many seconds.
+    """
+
+    def __init__(self, population):
+        self.responses = []
+        self.delay = 0
+        self.update(population)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                time.sleep(server.delay)
+                body, etag = server.body, server.etag
+                if self.headers.get('If-None-Match') == etag:
+                    server.responses.append(304)
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                server.responses.append(200)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/population'
+
+    def update(self, population):
+        """Serves another population, with a new ETag."""
+        body = json.dumps(population).encode()
+        self.body, self.etag = body, '"' + hashlib.md5(body).hexdigest() + '"'
+        self.size = len(body)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='population-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def build_requests(population, count, seed=0):
+    """
+    Builds `count` requests per endpoint from the population records.
+
+    /identify looks up exact records, /missing searches slightly mutated records (so
+    relatives are found), /compare and /predict pair two records.
+
+    Returns:
+        dict: Endpoint name to a list of (path, form fields, {file field: bytes}).
+    """
+    rng = random.Random(seed + 1)
+    sequences = [entry['DNA_sequence'] for entry in population['population']]
+    pick = lambda: rng.choice(sequences).encode()
+    return {
+        'compare': [('/compare', {}, {'file_a': pick(), 'file_b': pick()}) for _ in range(count)],
+        'identify': [('/identify', {'status': 'all'}, {'file': pick()}) for _ in range(count)],
+        'missing': [('/missing', {}, {'file': mutate(rng.choice(sequences), 0.01, rng).encode()}) for _ in range(count)],
+        'predict': [('/predict', {}, {'file_a': pick(), 'file_b': pick()}) for _ in range(count)],
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def run_endpoint(send, items, concurrency):
+    """
+    Sends one endpoint's requests after a warm-up request, from `concurrency` threads.
+
+    Parameters:
+        send (callable): Sends (path, form fields, files) and returns (HTTP status, JSON body or None).
+        items (list): The requests.
+        concurrency (int): Number of concurrent senders.
+    Returns:
+        dict: Throughput, latency percentiles in milliseconds and error count.
+    """
+    # The first request also fetches and indexes the population or loads the pool
+    start = time.perf_counter()
+    status, body = send(items[0])
+    cold_ms = (time.perf_counter() - start) * 1000
+    if status == 503:
+        return {"skipped": (body or {}).get('message', 'service unavailable')}
+
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            status, body = send(item)
+            ok = status == 200 and (body is None or body.get('statusCode', 200) == 200)
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(timed, items))
+    elapsed = time.perf_counter() - start
+    latencies = [seconds * 1000 for seconds, _ in results]
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "seconds": elapsed,
+        "throughput_rps": len(results) / elapsed,
+        "cold_ms": cold_ms,
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+def bench_client(population_url, requests_by_endpoint, concurrency, snapshot_dir):
+    """Drives the endpoints through the Flask test client, in this process."""
+    os.environ['POPULATION_API_URL'] = population_url
+    os.environ['SNAPSHOT_DIR'] = snapshot_dir
+    os.environ.setdefault('MODELS_REQUIRED', '0')
+    import application
+    clients = threading.local()
+
+    def send(item):
+        path, data, files = item
+        if not hasattr(clients, 'client'):
+            clients.client = application.application.test_client()
+        form = dict(data, **{name: (io.BytesIO(content), name + '.txt') for name, content in files.items()})
+        response = clients.client.post(path, data=form)
+        return response.status_code, response.get_json(silent=True)
+
+    endpoints = {name: run_endpoint(send, items, concurrency) for name, items in requests_by_endpoint.items()}
+    # ru_maxrss is in kilobytes on Linux
+    return {"endpoints": endpoints, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def process_tree(pid):
+    """Returns `pid` and the pids of all its descendants."""
+    parents = {}
+    for stat_path in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat_path) as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        parents.setdefault(int(fields[1]), []).append(int(stat_path.split('/')[2]))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(parents.get(current, []))
+    return tree
+
+
+def resident_mb(pids):
+    """Sum of the resident set sizes of processes, in megabytes."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def bench_gunicorn(population_url, requests_by_endpoint, concurrency, workers, snapshot_dir, timeout=120):
+    """Drives the endpoints over HTTP through a gunicorn server started with gunicorn_config.py."""
+    port = free_port()
+    environment = dict(os.environ, POPULATION_API_URL=population_url, SNAPSHOT_DIR=snapshot_dir)
+    environment.setdefault('MODELS_REQUIRED', '0')
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(APP_DIR, '..', 'gunicorn_config.py'),
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers), 'application:application']
+    log = tempfile.TemporaryFile()
+    server = subprocess.Popen(command, cwd=APP_DIR, env=environment, stdout=subprocess.DEVNULL, stderr=log)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if server.poll() is not None:
+                log.seek(0)
+                lines = log.read().decode(errors='replace').strip().splitlines()
+                return {"error": f"gunicorn exited with status {server.returncode}: {lines[-1] if lines else ''}"}
+            try:
+                requests.get(base_url + '/', timeout=1)
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    return {"error": "gunicorn did not start in time"}
+                time.sleep(0.2)
+        # Peak of the summed RSS of the master, the workers and their pool processes
+        peak = [resident_mb(process_tree(server.pid))]
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(0.2):
+                peak[0] = max(peak[0], resident_mb(process_tree(server.pid)))
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        sessions = threading.local()
+
+        def send(item):
+            path, data, files = item
+            if not hasattr(sessions, 'session'):
+                sessions.session = requests.Session()
+            response = sessions.session.post(base_url + path, data=data, timeout=timeout,
+                                             files={name: (name + '.txt', content) for name, content in files.items()})
+            try:
+                return response.status_code, response.json()
+            except ValueError:
+                return response.status_code, None
+
+        endpoints = {name: run_endpoint(send, items, concurrency) for name, items in requests_by_endpoint.items()}
+        sampling.set()
+        sampler.join()
+        return {"endpoints": endpoints, "workers": workers, "peak_rss_mb": peak[0]}
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the endpoints against a synthetic population.')
+    parser.add_argument('--records', type=int, default=1000, help='number of synthetic population records')
+    parser.add_argument('--length', type=int, default=2000, help='bases per synthetic record')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent requests')
+    parser.add_argument('--mode', choices=['client', 'gunicorn', 'both'], default='client',
+                        help='drive the Flask test client, a gunicorn server or both')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the population and the requests')
+    parser.add_argument('--output', help='file to write the JSON report to, in addition to stdout')
+    args = parser.parse_args()
+
+    population = synthetic_population(args.records, args.length, args.seed)
+    requests_by_endpoint = build_requests(population, args.requests, args.seed)
+    server = PopulationServer(population).start()
+    snapshot_dir = tempfile.mkdtemp(prefix='benchmark_snapshot_')
+    report = {
+        "config": vars(args),
+        "population": {"records": args.records, "length": args.length, "response_bytes": server.size},
+    }
+    try:
+        if args.mode in ('gunicorn', 'both'):
+            report["gunicorn"] = bench_gunicorn(server.url, requests_by_endpoint, args.concurrency, args.workers,
+                                                os.path.join(snapshot_dir, 'gunicorn'))
+        if args.mode in ('client', 'both'):
+            report["client"] = bench_client(server.url, requests_by_endpoint, args.concurrency,
+                                            os.path.join(snapshot_dir, 'client'))
+    finally:
+        server.stop()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    text = json.dumps(report, indent=1)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
@@ -0,0 +1,73 @@
+# Throughput of /predict/batch against sequential /predict calls
+#
+# Usage, from the app directory:
+#   python benchmark_predict.py [--pairs 200] [--model path/to/model.pkl]
+# Pairs are drawn in turn from the parent/child tests in data/Model_test_only. --model
+# loads another pickled model when models/finalized_model_lgb.pkl is not available.
+
+import argparse
+import glob
+import io
+import json
+import os
+import time
+
+
+def load_pairs(count, directory='../data/Model_test_only'):
+    """Returns `count` (parent, child) file contents, cycling through the test directories."""
+    tests = []
+    for test in sorted(glob.glob(os.path.join(directory, '*', 'Test_*'))):
+        files = sorted(glob.glob(os.path.join(test, '*.txt')))
+        if len(files) == 2:
+            tests.append(tuple(open(path, 'rb').read() for path in files))
+    return [tests[index % len(tests)] for index in range(count)]
+
+
+def run_sequential(client, pairs):
+    """Posts each pair to /predict and returns the elapsed seconds and the predictions."""
+    start = time.perf_counter()
+    predictions = []
+    for parent, child in pairs:
+        response = client.post('/predict', data={'file_a': (io.BytesIO(parent), 'parent.txt'),
+                                                 'file_b': (io.BytesIO(child), 'child.txt')})
+        predictions.append(response.get_json()['prediction'])
+    return time.perf_counter() - start, predictions
+
+
+def run_batch_multipart(client, pairs):
+    """Posts all pairs to /predict/batch as multipart files."""
+    data = {'file_a': [(io.BytesIO(parent), f'parent_{index}.txt') for index, (parent, _) in enumerate(pairs)],
+            'file_b': [(io.BytesIO(child), f'child_{index}.txt') for index, (_, child) in enumerate(pairs)]}
+    start = time.perf_counter()
+    response = client.post('/predict/batch', data=data)
+    return time.perf_counter() - start, [item['prediction'] for item in response.get_json()['predictions']]
+
+
+def run_batch_ndjson(client, pairs):
+    """Posts all pairs to /predict/batch as NDJSON."""
+    body = '\n'.join(json.dumps({"id": index, "parent": parent.decode(), "child": child.decode()})
+                     for index, (parent, child) in enumerate(pairs))
+    start = time.perf_counter()
+    response = client.post('/predict/batch', data=body, content_type='application/x-ndjson')
+    return time.perf_counter() - start, [item['prediction'] for item in response.get_json()['predictions']]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare /predict/batch with sequential /predict calls.')
+    parser.add_argument('--pairs', type=int, default=200, help='number of parent/child pairs')
+    parser.add_argument('--model', help='pickled model to use instead of models/finalized_model_lgb.pkl')
+    args = parser.parse_args()
+    if args.model:
+        os.environ['MODEL_FILE'] = os.path.abspath(args.model)
+    # The model is loaded when the application is imported
+    import application
+    client = application.application.test_client()
+    pairs = load_pairs(args.pairs)
+    sequential_seconds, expected = run_sequential(client, pairs)
+    report = {"pairs": len(pairs),
+              "sequential": {"seconds": sequential_seconds, "pairs_per_second": len(pairs) / sequential_seconds}}
+    for name, run in (("batch_multipart", run_batch_multipart), ("batch_ndjson", run_batch_ndjson)):
+        seconds, predictions = run(client, pairs)
+        report[name] = {"seconds": seconds, "pairs_per_second": len(pairs) / seconds,
+                        "speedup": sequential_seconds / seconds, "same_predictions": predictions == expected}
+    print(json.dumps(report, indent=1))
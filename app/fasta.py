@@ -0,0 +1,237 @@
+# Streaming reader for uploaded DNA sequences in FASTA or plain-text format
+
+import numpy as np
+
+from metrics import span
+
+# IUPAC nucleotide codes accepted in a sequence, after case folding
+ALPHABET = b'ACGTUNRYKMSWBDHV'
+_WHITESPACE = b' \t\r\n\v\f'
+_UPPERCASE = bytes.maketrans(ALPHABET.lower(), ALPHABET)
+# Longest header kept for a record name
+MAX_HEADER_LENGTH = 256
+
+
+class InvalidSequence(ValueError):
+    """
+    Raised when an uploaded sequence contains symbols outside ALPHABET.
+
+    Attributes:
+        symbol (str): The first invalid symbol.
+        line (int): Line of the file holding the symbol, from 1.
+        base (int): Position of the symbol among the bases of its record, from 1.
+        record (int): Index of the record holding the symbol, in file order.
+        header (str): Header of that record, empty for headerless text.
+    """
+
+    def __init__(self, symbol, line, base, record=0, header=''):
+        self.symbol = symbol
+        self.line = line
+        self.base = base
+        self.record = record
+        self.header = header
+        location = f"line {line}, base {base}"
+        # Records are only named in files with headers
+        if header or record:
+            location += f" of record {record} ({header!r})"
+        super().__init__(f"Invalid DNA sequence: unexpected symbol {symbol!r} at {location}.")
+
+
+class FastaRecord:
+    """
+    Boundaries of one FASTA record within the bases read from a file.
+
+    Attributes:
+        header (str): Header line without the leading '>', empty for headerless text.
+        start (int): Offset of the first base of the record.
+        end (int): Offset past the last base of the record.
+    """
+
+    __slots__ = ('header', 'start', 'end')
+
+    def __init__(self, header, start, end=None):
+        self.header = header
+        self.start = start
+        self.end = start if end is None else end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"FastaRecord({self.header!r}, {self.start}, {self.end})"
+
+
+class FastaSequence:
+    """
+    Bases read from a file, concatenated in file order, with the record boundaries.
+
+    Attributes:
+        data (bytearray): Uppercase bases.
+        records (list of FastaRecord): Records read, in file order; text before the first
+            header is a record with an empty header.
+    """
+
+    def __init__(self, data, records):
+        self.data = data
+        self.records = records
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def text(self):
+        """The bases as a string."""
+        return self.data.decode('ascii')
+
+    def array(self):
+        """Returns the bases as a uint8 array of ASCII codes sharing the buffer, as taken by the alignment engines."""
+        return np.frombuffer(self.data, dtype=np.uint8)
+
+    def record_text(self, index):
+        """Returns the bases of one record as a string."""
+        record = self.records[index]
+        return self.data[record.start:record.end].decode('ascii')
+
+
+def read_fasta(file, max_length=2000, chunk_size=1 << 16, max_record_length=None):
+    """
+    Reads the DNA sequence of an uploaded FASTA or plain-text file.
+
+    The file is read in fixed-size chunks appended to a buffer that grows with the bases
+    kept, so the cost is linear in the bytes read and a short upload stays small. Header
+    lines (starting with '>', after any indentation) are skipped and open a new record;
+    a '>' inside a line is an invalid symbol. All whitespace is removed, including inside
+    a line, and bases are uppercased. Reading stops once
+    `max_length` bases were collected, and bases of a record past `max_record_length`
+    are skipped, so only the bases kept are validated.
+
+    Parameters:
+        file (file object): Binary file object, such as a Werkzeug upload.
+        max_length (int, optional): The maximum number of bases to retrieve, across all
+            records. Defaults to 2000; None reads the whole file.
+        chunk_size (int, optional): Number of bytes read at a time. Defaults to 65536.
+        max_record_length (int, optional): The maximum number of bases kept per record.
+            Defaults to None (no limit).
+    Returns:
+        FastaSequence: The bases, truncated to `max_length`, with the record boundaries.
+    Raises:
+        InvalidSequence: If a base is not an IUPAC nucleotide code.
+    """
+    with span('upload_parse'):
+        return _read_fasta(file, max_length, chunk_size, max_record_length)
+
+
+def _read_fasta(file, max_length, chunk_size, max_record_length):
+    data = bytearray()
+    length = 0
+    records = []
+    record = None
+    # Header bytes of the record being read, None outside a header line
+    header = None
+    # Whether only indentation was read since the last line break
+    line_start = True
+    # Line breaks in the chunks before the current one
+    lines = 0
+    while max_length is None or length < max_length:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        start = 0
+        while start < len(chunk) and (max_length is None or length < max_length):
+            if header is not None:
+                newline = chunk.find(b'\n', start)
+                end = len(chunk) if newline < 0 else newline
+                if len(header) < MAX_HEADER_LENGTH:
+                    header += chunk[start:min(end, start + MAX_HEADER_LENGTH - len(header))]
+                if newline < 0:
+                    break
+                record = FastaRecord(header.strip().decode('utf-8', 'replace'), length)
+                records.append(record)
+                header = None
+                line_start = True
+                start = newline + 1
+                continue
+            marker = _find_header(chunk, start, line_start)
+            end = len(chunk) if marker < 0 else marker
+            bases = chunk[start:end].translate(_UPPERCASE, _WHITESPACE)
+            if max_length is not None:
+                bases = bases[:max_length - length]
+            if max_record_length is not None:
+                bases = bases[:max_record_length - (len(record) if record is not None else 0)]
+            if bases:
+                if record is None:
+                    record = FastaRecord('', length)
+                    records.append(record)
+                invalid = bases.translate(None, ALPHABET)
+                if invalid:
+                    base = length - record.start + bases.index(invalid[:1]) + 1
+                    # Whitespace was removed from the bases, so the symbol is located in the chunk itself
+                    position = chunk.index(invalid[:1], start)
+                    line = lines + chunk.count(b'\n', 0, position) + 1
+                    raise InvalidSequence(chr(invalid[0]), line, base, len(records) - 1, record.header)
+                data += bases
+                length += len(bases)
+                record.end = length
+            if marker < 0:
+                line_start = _at_line_start(chunk[start:], line_start)
+                break
+            header = b''
+            start = marker + 1
+        lines += chunk.count(b'\n')
+    if header is not None and (max_length is None or length < max_length):
+        # Header on the last line of the file
+        records.append(FastaRecord(header.strip().decode('utf-8', 'replace'), length))
+    return FastaSequence(data, records)
+
+
+def _at_line_start(text, line_start):
+    """Whether only whitespace follows the last line break of `text`, given whether its start was at a line start."""
+    newline = text.rfind(b'\n')
+    if newline >= 0:
+        line_start = True
+        text = text[newline + 1:]
+    return line_start and not text.translate(None, _WHITESPACE)
+
+
+def _find_header(chunk, start, line_start):
+    """Returns the offset of the next '>' opening a line (after indentation) in `chunk`, -1 if there is none."""
+    marker = chunk.find(b'>', start)
+    while marker >= 0:
+        line = chunk.rfind(b'\n', start, marker)
+        if _at_line_start(chunk[line + 1 if line >= 0 else start:marker], line_start or line >= 0):
+            return marker
+        # The rest of this line holds no header
+        newline = chunk.find(b'\n', marker)
+        marker = chunk.find(b'>', newline) if newline >= 0 else -1
+    return marker
+
+
+def read_sequence(file, max_length=2000):
+    """
+    Retrieves the uppercase DNA sequence of an uploaded file, truncated to `max_length`.
+
+    Parameters:
+        file (file object): Binary file object, such as a Werkzeug upload.
+        max_length (int, optional): The maximum length of DNA sequence to retrieve. Defaults to 2000.
+    Returns:
+        str: DNA sequence of the file.
+    Raises:
+        InvalidSequence: If a base is not an IUPAC nucleotide code.
+    """
+    return read_fasta(file, max_length).text
+
+
+def read_records(file, max_length=2000):
+    """
+    Retrieves each record of an uploaded multi-record FASTA file.
+
+    Parameters:
+        file (file object): Binary file object, such as a Werkzeug upload.
+        max_length (int, optional): The maximum length of each record's DNA sequence. Defaults to 2000.
+    Returns:
+        list of tuple: (header, uppercase DNA sequence) of each record, in file order.
+    Raises:
+        InvalidSequence: If a base is not an IUPAC nucleotide code, with the record holding it.
+    """
+    sequence = read_fasta(file, max_length=None, max_record_length=max_length)
+    return [(record.header, sequence.record_text(index)) for index, record in enumerate(sequence.records)]
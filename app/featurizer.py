@@ -0,0 +1,217 @@
+# k-mer count features for the relative prediction model, computed on integer k-mer codes
+
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from metrics import span
+
+_INVALID = 255
+_BASES = np.full(256, _INVALID, dtype=np.uint8)
+for _index, _base in enumerate(b'ACGT'):
+    _BASES[_base] = _index
+    _BASES[ord(chr(_base).lower())] = _index
+
+
+def base4_codes(sequence, k):
+    """
+    Computes the base-4 code of every k-mer made only of A, C, G and T (in any case).
+
+    Parameters:
+        sequence (str or numpy.ndarray): DNA sequence, or its uint8 ASCII codes.
+        k (int): k-mer length.
+    Returns:
+        numpy.ndarray: int64 code of each k-mer without other symbols, in sequence order.
+    """
+    if not isinstance(sequence, np.ndarray):
+        sequence = np.frombuffer(sequence.encode('utf-8'), dtype=np.uint8)
+    symbols = _BASES[sequence]
+    count = len(symbols) - k + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.int64)
+    codes = np.zeros(count, dtype=np.int64)
+    for offset in range(k):
+        codes <<= 2
+        codes |= symbols[offset:offset + count] & 3
+    # A k-mer is kept when its window has no invalid symbol
+    invalid = np.concatenate(([0], np.cumsum(symbols == _INVALID)))
+    return codes[invalid[k:] == invalid[:count]]
+
+
+class KmerFeaturizer:
+    """
+    Sparse k-mer counts over a fitted CountVectorizer vocabulary.
+
+    The vectorizer of the model tokenizes the space-joined, lowercased k-mers of a
+    sequence, and its vocabulary only holds k-mers of a, c, g and t, so its count
+    vector is the number of occurrences of each vocabulary k-mer. Mapping the base-4
+    codes of the k-mers through a code-to-column table gives the same counts without
+    building strings.
+    """
+
+    def __init__(self, vocabulary, k=7):
+        """
+        Parameters:
+            vocabulary (dict): Vocabulary of the fitted CountVectorizer (k-mer to column).
+            k (int, optional): k-mer length. Defaults to 7.
+        """
+        self.k = k
+        self.n_features = len(vocabulary)
+        # Column of every base-4 code, -1 for k-mers outside the vocabulary
+        self.columns = np.full(4 ** k, -1, dtype=np.int64)
+        for kmer, column in vocabulary.items():
+            if len(kmer) != k or not kmer.isascii():
+                continue
+            codes = base4_codes(kmer, k)
+            if len(codes):
+                self.columns[codes[0]] = column
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, k=7):
+        """Builds the featurizer of a fitted CountVectorizer."""
+        return cls(vectorizer.vocabulary_, k)
+
+    @classmethod
+    def from_columns(cls, columns, n_features):
+        """
+        Builds a featurizer from the code-to-column table of another one, such as a saved export.
+
+        Parameters:
+            columns (numpy.ndarray): int64 column of every base-4 code, -1 outside the vocabulary.
+            n_features (int): Size of the vocabulary.
+        """
+        featurizer = cls.__new__(cls)
+        featurizer.k = (len(columns).bit_length() - 1) // 2
+        featurizer.n_features = n_features
+        featurizer.columns = columns
+        return featurizer
+
+    def counts(self, sequence):
+        """
+        Counts the vocabulary k-mers of a sequence.
+
+        Parameters:
+            sequence (str or numpy.ndarray): DNA sequence.
+        Returns:
+            tuple: Sorted column indices and their int64 counts.
+        """
+        columns = self.columns[base4_codes(sequence, self.k)]
+        return np.unique(columns[columns >= 0], return_counts=True)
+
+    def transform(self, sequences):
+        """
+        Computes the count matrix of several sequences, as vectorizer.transform would.
+
+        Parameters:
+            sequences (list): DNA sequences.
+        Returns:
+            scipy.sparse.csr_matrix: int64 counts, one row per sequence.
+        """
+        return self.assemble([[self.counts(sequence)] for sequence in sequences], self.n_features)
+
+    def pair_features(self, pairs, scale=None):
+        """
+        Builds the model input of (parent, child) pairs: the parent counts followed by the child counts.
+
+        Parameters:
+            pairs (list of tuple): (parent, child) DNA sequences.
+            scale (numpy.ndarray, optional): Per-column divisor, such as the `scale_` of the
+                fitted MaxAbsScaler. Defaults to None (raw counts).
+        Returns:
+            scipy.sparse.csr_matrix: One row of 2 * n_features columns per pair, int64 counts
+                or float64 scaled counts.
+        """
+        with span('featurization'):
+            rows = [[self.counts(parent), self.counts(child)] for parent, child in pairs]
+            features = self.assemble(rows, 2 * self.n_features)
+        if scale is not None:
+            # Divide like MaxAbsScaler does on dense input, so values match it bit for bit
+            with span('scaling'):
+                features.data = features.data / scale[features.indices]
+        return features
+
+    def query_features(self, query, matrix, query_role='parent', scale=None):
+        """
+        Builds the model input pairing one sequence with every row of a count matrix.
+
+        Parameters:
+            query (str or numpy.ndarray): Query DNA sequence.
+            matrix (scipy.sparse.csr_matrix): Counts of the other sequences, as from transform().
+            query_role (str, optional): 'parent' puts the query counts first, 'child' last. Defaults to 'parent'.
+            scale (numpy.ndarray, optional): Per-column divisor, as for pair_features(). Defaults to None.
+        Returns:
+            scipy.sparse.csr_matrix: One row of 2 * n_features columns per row of `matrix`.
+        """
+        with span('featurization'):
+            query_row = self.assemble([[self.counts(query)]], self.n_features)
+            repeated = query_row[np.zeros(matrix.shape[0], dtype=np.int64)]
+            blocks = [repeated, matrix] if query_role == 'parent' else [matrix, repeated]
+            features = sparse.hstack(blocks, format='csr')
+        if scale is not None:
+            with span('scaling'):
+                features.data = features.data / scale[features.indices]
+        return features
+
+    def assemble(self, rows, width):
+        """Builds a CSR matrix from rows of (columns, counts) blocks, each block shifted by n_features."""
+        indices, data, indptr = [], [], [0]
+        for blocks in rows:
+            for position, (columns, counts) in enumerate(blocks):
+                indices.append(columns + position * self.n_features)
+                data.append(counts)
+            indptr.append(indptr[-1] + sum(len(columns) for columns, _ in blocks))
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+        data = np.concatenate(data) if data else np.zeros(0, dtype=np.int64)
+        return sparse.csr_matrix((data, indices, np.array(indptr, dtype=np.int64)), shape=(len(rows), width))
+
+
+class PopulationFeatures:
+    """
+    Count rows of the population records, cached across population snapshots.
+
+    A record's row is computed once and reused while its key and `updatedAt` are
+    unchanged, so a new snapshot only featurizes the records that changed. The
+    assembled matrix is kept for the latest snapshot.
+    """
+
+    def __init__(self, featurizer):
+        """
+        Parameters:
+            featurizer (KmerFeaturizer): Featurizer of the model.
+        """
+        self.featurizer = featurizer
+        # Record key -> (updatedAt, (columns, counts))
+        self._entries = {}
+        self._snapshot = None
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.computed = 0
+
+    def matrix(self, snapshot):
+        """
+        Returns the count matrix of a population snapshot, one row per record.
+
+        Parameters:
+            snapshot (PopulationSnapshot): The population.
+        Returns:
+            scipy.sparse.csr_matrix: int64 counts of every record, in population order.
+        """
+        with self._lock, span('featurization'):
+            if snapshot is self._snapshot:
+                return self._matrix
+            rows, cached = [], {}
+            for record, sequence in zip(snapshot.records, snapshot.sequences):
+                updated_at = record.info.get('updatedAt')
+                entry = self._entries.get(record.key) if record.key is not None else None
+                if entry is None or updated_at is None or entry[0] != updated_at:
+                    entry = (updated_at, self.featurizer.counts(sequence))
+                    self.computed += 1
+                if record.key is not None:
+                    cached[record.key] = entry
+                rows.append([entry[1]])
+            # Rows of records that left the population are dropped
+            self._entries = cached
+            self._snapshot = snapshot
+            self._matrix = self.featurizer.assemble(rows, self.featurizer.n_features)
+            return self._matrix
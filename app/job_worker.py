@@ -0,0 +1,21 @@
+# Background worker running the asynchronous jobs of the web application
+#
+# Usage, from the app directory, with the broker shared with the web processes:
+#   JOB_BROKER_URL=redis://localhost:6379/0 python job_worker.py [--threads 2]
+# REDIS_URL, as set by a Redis add-on, is used when JOB_BROKER_URL is not set. Without either the jobs
+# are run by the web process itself and there is nothing to serve. The Procfile runs it as `worker`.
+
+import argparse
+import os
+import sys
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the asynchronous jobs of the web application.')
+    parser.add_argument('--threads', type=int, default=2, help='number of jobs run at the same time')
+    args = parser.parse_args()
+    if not os.environ.get('JOB_BROKER_URL') and not os.environ.get('REDIS_URL'):
+        sys.exit("JOB_BROKER_URL is not set: without a shared broker the web processes run their own jobs.")
+    # The jobs do not use the kinship model
+    os.environ.setdefault('MODELS_REQUIRED', '0')
+    import application
+    application.job_manager.serve(args.threads)
@@ -0,0 +1,234 @@
+# Asynchronous jobs: a pluggable broker, background workers and job records kept for a TTL
+
+import json
+import math
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+FINISHED = (DONE, FAILED)
+
+
+class JobsUnavailable(Exception):
+    """Raised when jobs cannot be submitted or looked up, such as an in-process broker behind several web processes."""
+
+
+class MemoryBroker:
+    """
+    In-process broker: a queue of pending jobs and a dictionary of job records.
+
+    Only workers of the same process see the jobs, which suits a single web process,
+    development and tests.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._changed = threading.Condition()
+
+    def enqueue(self, job, payload, ttl):
+        self.save(job, ttl)
+        self._queue.put((job['id'], job['kind'], payload))
+
+    def dequeue(self, timeout):
+        """Returns the next (job id, kind, payload), or None if there is none within `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def save(self, job, ttl):
+        with self._changed:
+            self._jobs[job['id']] = (dict(job), time.monotonic() + ttl)
+            self._changed.notify_all()
+
+    def load(self, job_id):
+        with self._changed:
+            now = time.monotonic()
+            for expired in [key for key, (_, expires_at) in self._jobs.items() if expires_at <= now]:
+                del self._jobs[expired]
+            entry = self._jobs.get(job_id)
+            return dict(entry[0]) if entry else None
+
+    def wait(self, job_id, timeout):
+        """Waits until a job finishes or `timeout` seconds pass, then returns its record."""
+        with self._changed:
+            self._changed.wait_for(lambda: (self.load(job_id) or {}).get('status', DONE) in FINISHED, timeout)
+        return self.load(job_id)
+
+
+class RedisBroker:
+    """
+    Broker backed by Redis, shared by the web processes and the job_worker processes.
+
+    Job records are JSON strings expiring after their TTL and pending jobs a list.
+    Any client with the redis-py interface works, including local stand-ins for tests.
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix='jobs:'):
+        """
+        Parameters:
+            client (redis.Redis): Redis client.
+            prefix (str, optional): Prefix of the keys. Defaults to 'jobs:'.
+        """
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, prefix='jobs:'):
+        import redis
+        return cls(redis.Redis.from_url(url), prefix)
+
+    def enqueue(self, job, payload, ttl):
+        self.save(job, ttl)
+        self.client.lpush(self.prefix + 'queue', json.dumps([job['id'], job['kind'], payload]))
+
+    def dequeue(self, timeout):
+        item = self.client.brpop(self.prefix + 'queue', timeout=max(math.ceil(timeout), 1))
+        return tuple(json.loads(item[1])) if item else None
+
+    def save(self, job, ttl):
+        self.client.set(self.prefix + job['id'], json.dumps(job), ex=max(math.ceil(ttl), 1))
+
+    def load(self, job_id):
+        data = self.client.get(self.prefix + job_id)
+        return json.loads(data) if data else None
+
+    def wait(self, job_id, timeout, interval=0.25):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.load(job_id)
+            if job is None or job['status'] in FINISHED or time.monotonic() >= deadline:
+                return job
+            time.sleep(interval)
+
+
+class JobManager:
+    """
+    Submits jobs to a broker and runs them on background workers.
+
+    A handler is registered per job kind and called as handler(payload, progress), where
+    progress(fraction) records how far the job got; its return value is the job result.
+    Pending and running jobs are kept for `pending_ttl` seconds, finished ones for
+    `result_ttl` seconds.
+
+    The `workers` threads of a process are started on its first submission, so a process
+    that forks after creating the manager (a gunicorn master with preload_app) starts
+    none and each forked process starts its own.
+    """
+
+    def __init__(self, broker, result_ttl=3600, pending_ttl=86400, workers=0):
+        """
+        Parameters:
+            broker (MemoryBroker or RedisBroker): Where jobs are queued and stored.
+            result_ttl (float, optional): Seconds finished jobs are kept. Defaults to 3600.
+            pending_ttl (float, optional): Seconds unfinished jobs are kept. Defaults to 86400.
+            workers (int, optional): Threads started in each submitting process. Defaults to 0.
+        """
+        self.broker = broker
+        self.result_ttl = result_ttl
+        self.pending_ttl = pending_ttl
+        self.workers = workers
+        self.handlers = {}
+        self._workers = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind, payload):
+        """
+        Queues a job.
+
+        Parameters:
+            kind (str): Registered job kind.
+            payload (dict): JSON-serializable arguments of the handler.
+        Returns:
+            dict: The job record.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        self._ensure_workers()
+        now = time.time()
+        job = {"id": uuid.uuid4().hex, "kind": kind, "status": QUEUED, "progress": 0.0,
+               "result": None, "error": None, "created_at": now, "updated_at": now}
+        self.broker.enqueue(job, payload, self.pending_ttl)
+        return job
+
+    def get(self, job_id, wait=0):
+        """
+        Returns a job record, optionally waiting up to `wait` seconds for the job to finish.
+
+        Returns:
+            dict: The job record, None if it does not exist or expired.
+        """
+        if wait > 0:
+            return self.broker.wait(job_id, wait)
+        return self.broker.load(job_id)
+
+    def run_once(self, timeout=1.0):
+        """
+        Runs the next pending job, if one arrives within `timeout` seconds.
+
+        Returns:
+            bool: Whether a job was run.
+        """
+        item = self.broker.dequeue(timeout)
+        if item is None:
+            return False
+        job_id, kind, payload = item
+        job = self.broker.load(job_id)
+        if job is None:
+            return True
+        job.update(status=RUNNING, updated_at=time.time())
+        self.broker.save(job, self.pending_ttl)
+
+        def progress(fraction):
+            job.update(progress=round(float(fraction), 4), updated_at=time.time())
+            self.broker.save(job, self.pending_ttl)
+
+        try:
+            result = self.handlers[kind](payload, progress)
+            job.update(status=DONE, progress=1.0, result=result)
+        except Exception as e:
+            print(f"Error occurred while running job {job_id}: {e}")
+            traceback.print_exc()
+            job.update(status=FAILED, error=str(e))
+        job['updated_at'] = time.time()
+        self.broker.save(job, self.result_ttl)
+        return True
+
+    def work_forever(self):
+        while True:
+            self.run_once()
+
+    def start_workers(self, count):
+        """Starts `count` daemon threads running jobs."""
+        for number in range(count):
+            worker = threading.Thread(target=self.work_forever, name=f'job-worker-{len(self._workers)}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _ensure_workers(self):
+        """Starts the `workers` threads of this process on its first submission."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads do not survive a fork
+                self._workers = []
+                self._pid = os.getpid()
+                self.start_workers(self.workers)
+
+    def serve(self, count):
+        """Runs jobs on `count` threads until the process is stopped."""
+        self.start_workers(count)
+        for worker in list(self._workers):
+            worker.join()
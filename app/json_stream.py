@@ -0,0 +1,113 @@
+# Incremental parsing of a JSON object whose bulk is one array, decoded item by item
+
+import codecs
+import json
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+_NUMBER = '+-.0123456789eE'
+
+
+class _TextBuffer:
+    """Decoded text of a stream of UTF-8 byte chunks, read on demand."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.position = 0
+        self.eof = False
+
+    def fill(self, size):
+        """Reads chunks until `size` more characters are buffered or the stream ends."""
+        # The consumed text is dropped, so the buffer only holds the value being decoded
+        pieces = [self.text[self.position:]]
+        self.position = 0
+        missing = size
+        while missing > 0 and not self.eof:
+            chunk = next(self.chunks, None)
+            piece = self.decoder.decode(b'', final=True) if chunk is None else self.decoder.decode(chunk)
+            self.eof = chunk is None
+            pieces.append(piece)
+            missing -= len(piece)
+        self.text = ''.join(pieces)
+
+    def peek(self):
+        """Skips whitespace and returns the next character, '' at the end of the stream."""
+        while True:
+            while self.position < len(self.text) and self.text[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.text) or self.eof:
+                return self.text[self.position:self.position + 1]
+            self.fill(1)
+
+    def expect(self, characters):
+        """Consumes the next character, which must be one of `characters`."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of {characters!r}, got {character or 'the end of the stream'!r}")
+        self.position += 1
+        return character
+
+    def value(self):
+        """Decodes the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.position)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                end = None
+            # A number ending with the buffer, or before its fraction or exponent, may continue in the next chunk
+            if end is not None and (self.eof or (end < len(self.text) and self.text[end] not in _NUMBER)):
+                self.position = end
+                return value
+            # Doubling the pending text keeps a large value linear to decode
+            self.fill(max(len(self.text) - self.position, 1))
+
+
+def iter_array_items(chunks, key):
+    """
+    Yields the items of the array under `key` of a JSON object, one at a time.
+
+    Only the item being decoded and the current chunk are held in memory; the other
+    members of the object are decoded and discarded.
+
+    Parameters:
+        chunks (iterable of bytes): The UTF-8 encoded JSON document, such as response.iter_content().
+        key (str): Member of the top-level object holding the array.
+    Yields:
+        The decoded items, in order.
+    Raises:
+        ValueError: If the document is not a JSON object, is malformed, or `key` does not hold an array.
+    """
+    buffer = _TextBuffer(chunks)
+    buffer.expect('{')
+    found = False
+    if buffer.peek() == '}':
+        buffer.position += 1
+    else:
+        while True:
+            name = buffer.value()
+            if not isinstance(name, str):
+                raise ValueError("Expected an object member name")
+            buffer.expect(':')
+            if name == key and buffer.peek() == '[':
+                found = True
+                buffer.position += 1
+                if buffer.peek() == ']':
+                    buffer.position += 1
+                else:
+                    while True:
+                        yield buffer.value()
+                        if buffer.expect(',]') == ']':
+                            break
+            else:
+                buffer.value()
+            if buffer.expect(',}') == '}':
+                break
+    if buffer.peek():
+        raise ValueError("Extra data after the JSON object")
+    if not found:
+        raise ValueError(f"No array under {key!r}")
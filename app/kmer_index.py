@@ -0,0 +1,194 @@
+# k-mer inverted index used to prune population records before alignment
+
+import math
+import time
+
+import numpy as np
+
+# Bits per base in a k-mer code: A, C, G, T and one symbol for anything else
+BITS_PER_BASE = 3
+_OTHER = 4
+_SYMBOLS = np.full(256, _OTHER, dtype=np.int64)
+for _index, _base in enumerate(b'ACGT'):
+    _SYMBOLS[_base] = _index
+    _SYMBOLS[ord(chr(_base).lower())] = _index
+
+
+def kmer_codes(sequence, k):
+    """
+    Computes the integer code of every k-mer of a sequence.
+
+    Bases are case-folded and every symbol other than A, C, G and T shares one code,
+    so k-mers that are identical in the sequences are always identical codes.
+
+    Parameters:
+        sequence (str or numpy.ndarray): DNA sequence, or its uint8 ASCII codes.
+        k (int): k-mer length.
+    Returns:
+        numpy.ndarray: int64 code of each of the len(sequence) - k + 1 k-mers.
+    """
+    if not isinstance(sequence, np.ndarray):
+        sequence = np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)
+    symbols = _SYMBOLS[sequence]
+    count = len(symbols) - k + 1
+    codes = np.zeros(max(count, 0), dtype=np.int64)
+    for offset in range(k if count > 0 else 0):
+        codes <<= BITS_PER_BASE
+        codes |= symbols[offset:offset + count]
+    return codes
+
+
+def max_edits(length, similarity, match_score=3, mismatch_penalty=-1, gap_penalty=-2):
+    """
+    Bounds the number of edits an alignment can contain and still reach a similarity.
+
+    The similarity is alignment score / (match_score * length), where length is the
+    longer sequence. Against that maximum a mismatch costs (match - mismatch) and a gap
+    column at least (match / 2 - gap).
+
+    Parameters:
+        length (numpy.ndarray or int): Length of the longer sequence.
+        similarity (float): Similarity threshold.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty for gaps. Defaults to -2.
+    Returns:
+        numpy.ndarray or int: Largest number of mismatches and gap columns.
+    """
+    deficit = match_score * np.asarray(length) * (1 - similarity)
+    edit_cost = min(match_score - mismatch_penalty, match_score / 2 - gap_penalty)
+    return np.floor(deficit / edit_cost + 1e-9).astype(np.int64)
+
+
+class KmerIndex:
+    """
+    Inverted index from k-mer codes to the population records containing them.
+
+    Candidates are selected with the q-gram lemma: two sequences within e edits share at
+    least max(len) - k + 1 - k * e k-mers, counted with multiplicity. With the edit bound
+    derived from a similarity threshold, every record that can reach the threshold is a
+    candidate (recall 1). `edit_budget` below 1 shrinks the edit bound to trade recall
+    for smaller candidate sets; `measure` reports both on labelled data.
+    """
+
+    def __init__(self, sequences, k=10, match_score=3, mismatch_penalty=-1, gap_penalty=-2):
+        """
+        Builds the index.
+
+        Parameters:
+            sequences (list): Population sequences, already truncated, as strings or uint8 arrays.
+            k (int, optional): k-mer length, at most 21. Defaults to 10.
+            match_score (int, optional): Score for matches. Defaults to 3.
+            mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+            gap_penalty (int, optional): Penalty for gaps. Defaults to -2.
+        """
+        start = time.perf_counter()
+        self.k = k
+        self.scoring = (match_score, mismatch_penalty, gap_penalty)
+        self.lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+        # (code, record, count) triples of every distinct k-mer of every record
+        codes, records, counts = [], [], []
+        for record, sequence in enumerate(sequences):
+            record_codes, record_counts = np.unique(kmer_codes(sequence, k), return_counts=True)
+            codes.append(record_codes)
+            counts.append(record_counts)
+            records.append(np.full(len(record_codes), record, dtype=np.int64))
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+        order = np.argsort(codes, kind='stable')
+        # Postings sorted by code, with the offsets of each code's range
+        self.codes, self.offsets = np.unique(codes[order], return_index=True)
+        self.offsets = np.append(self.offsets, len(order))
+        self.records = np.concatenate(records)[order] if records else np.zeros(0, dtype=np.int64)
+        self.counts = np.concatenate(counts)[order] if counts else np.zeros(0, dtype=np.int64)
+        self.build_seconds = time.perf_counter() - start
+
+    def shared_kmers(self, sequence):
+        """
+        Counts the k-mers each record shares with a sequence, with multiplicity.
+
+        Parameters:
+            sequence (str): Query DNA sequence.
+        Returns:
+            numpy.ndarray: Number of shared k-mers for each record.
+        """
+        query_codes, query_counts = np.unique(kmer_codes(sequence, self.k), return_counts=True)
+        positions = np.searchsorted(self.codes, query_codes)
+        positions[positions >= len(self.codes)] = 0
+        found = self.codes[positions] == query_codes if len(self.codes) else np.zeros(len(query_codes), dtype=bool)
+        starts = self.offsets[positions[found]]
+        sizes = self.offsets[positions[found] + 1] - starts
+        # Flattened posting ranges of all query k-mers
+        postings = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        shared = np.minimum(self.counts[postings], np.repeat(query_counts[found], sizes))
+        return np.bincount(self.records[postings], weights=shared, minlength=len(self.lengths)).astype(np.int64)
+
+    def candidates(self, sequence, similarity, edit_budget=1.0):
+        """
+        Selects the records that may reach a similarity with a sequence.
+
+        Parameters:
+            sequence (str): Query DNA sequence.
+            similarity (float): Similarity threshold (between 0 and 1).
+            edit_budget (float, optional): Fraction of the edit bound allowed; 1.0 keeps
+                every record that can reach the threshold. Defaults to 1.0.
+        Returns:
+            numpy.ndarray: Indices of the candidate records, in population order; its length
+                is the candidate count, the index keeps no per-query state.
+        """
+        match_score, mismatch_penalty, gap_penalty = self.scoring
+        longer = np.maximum(self.lengths, len(sequence))
+        shorter = np.minimum(self.lengths, len(sequence))
+        # The length difference alone can rule a record out
+        best_score = match_score * shorter + gap_penalty * (longer - shorter)
+        reachable = (shorter > 0) & (best_score >= similarity * match_score * longer - 1e-9)
+        edits = np.floor(max_edits(longer, similarity, *self.scoring) * edit_budget).astype(np.int64)
+        required = longer - self.k + 1 - self.k * edits
+        shared = self.shared_kmers(sequence)
+        return np.flatnonzero(reachable & (shared >= required))
+
+    def measure(self, queries, similarities, similarity, edit_budget=1.0):
+        """
+        Measures the candidate-set size and recall of the index on labelled data.
+
+        Parameters:
+            queries (list of str): Query sequences.
+            similarities (numpy.ndarray): True similarity of each query (rows) to each record (columns).
+            similarity (float): Similarity threshold.
+            edit_budget (float, optional): Fraction of the edit bound allowed. Defaults to 1.0.
+        Returns:
+            dict: Build time, mean candidate-set size and fraction, and recall.
+        """
+        relevant = found = candidate_total = 0
+        for query, row in zip(queries, similarities):
+            candidates = self.candidates(query, similarity, edit_budget)
+            targets = np.flatnonzero(np.asarray(row) >= similarity)
+            relevant += len(targets)
+            found += len(np.intersect1d(targets, candidates))
+            candidate_total += len(candidates)
+        mean_candidates = candidate_total / max(len(queries), 1)
+        return {
+            "build_seconds": self.build_seconds,
+            "records": len(self.lengths),
+            "mean_candidates": mean_candidates,
+            "candidate_fraction": mean_candidates / max(len(self.lengths), 1),
+            "recall": found / relevant if relevant else math.nan,
+        }
+
+
+if __name__ == "__main__":
+    # Tune k and the edit budget on the labelled sequences in data/Model_test_only
+    import glob
+    import json
+    from alignment import needleman_wunsch_similarity
+
+    def read_sequence(path, max_length=2000):
+        with open(path) as sequence_file:
+            return ''.join(line.strip() for line in sequence_file if not line.startswith('>'))[:max_length]
+
+    sequences = [read_sequence(path) for path in sorted(glob.glob('../data/Model_test_only/*/Test_*/*.txt'))]
+    similarities = np.array([[needleman_wunsch_similarity(a, b) for b in sequences] for a in sequences])
+    for k in (8, 10, 12):
+        index = KmerIndex(sequences, k=k)
+        for edit_budget in (1.0, 0.75, 0.5):
+            report = index.measure(sequences, similarities, 0.955, edit_budget)
+            print(json.dumps({"k": k, "edit_budget": edit_budget, **report}))
@@ -0,0 +1,229 @@
+# Latency histograms and counters of the request stages, in the Prometheus text format
+
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Stage timings of the request being profiled in this context, None when it is not profiled
+_profile = contextvars.ContextVar('profile', default=None)
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in pairs) + '}'
+
+
+class Counter:
+    """Monotonic count, optionally split by labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def state(self):
+        with self._lock:
+            return {json.dumps(labels): value for labels, value in self._values.items()}
+
+    @staticmethod
+    def merge(total, state):
+        for labels, value in state.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def lines(self, state):
+        for labels, value in sorted(state.items()):
+            yield f'{self.name}{_label_text(self.labelnames, json.loads(labels))} {value}'
+
+
+class Histogram:
+    """Distribution of observed values, durations by default, over fixed buckets, optionally split by labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Labels -> per-bucket counts (the last one is +Inf), sum
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def state(self):
+        with self._lock:
+            return {json.dumps(labels): [list(counts), total] for labels, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def merge(total, state):
+        for labels, (counts, value_sum) in state.items():
+            if labels not in total:
+                total[labels] = [[0] * len(counts), 0.0]
+            total[labels][0] = [a + b for a, b in zip(total[labels][0], counts)]
+            total[labels][1] += value_sum
+
+    def lines(self, state):
+        for labels, (counts, value_sum) in sorted(state.items()):
+            values = json.loads(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_label_text(self.labelnames, values, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_label_text(self.labelnames, values)} {value_sum}'
+            yield f'{self.name}_count{_label_text(self.labelnames, values)} {cumulative}'
+
+
+class CallbackCounter(Counter):
+    """Counter whose value is read from a function, such as a cache's hit count."""
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def state(self):
+        return {json.dumps(()): self.function()}
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process, rendered in the Prometheus text format.
+
+    Each gunicorn worker counts its own requests. With a `directory`, every process
+    writes its metrics there at most every `interval` seconds and /metrics sums the
+    files of all processes, so a scrape covers every worker whichever one answers it.
+    """
+
+    def __init__(self, directory=None, interval=1.0):
+        """
+        Parameters:
+            directory (str, optional): Directory shared by the processes. Defaults to None (this process only).
+            interval (float, optional): Seconds between two writes of the metrics of a process. Defaults to 1.0.
+        """
+        self.directory = directory
+        self.interval = interval
+        self.metrics = []
+        self._written_at = 0.0
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def state(self):
+        """Returns the current values of every metric, by name."""
+        return {metric.name: metric.state() for metric in self.metrics}
+
+    def write(self, force=False):
+        """Writes the metrics of this process to the shared directory, at most every `interval` seconds."""
+        if self.directory is None or (not force and time.monotonic() - self._written_at < self.interval):
+            return
+        self._written_at = time.monotonic()
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + '.tmp', 'w') as file:
+                json.dump(self.state(), file)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Error occurred while writing the metrics: {e}")
+
+    def render(self):
+        """Returns the metrics of every process in the Prometheus text format."""
+        states = [self.state()]
+        if self.directory is not None:
+            self.write(force=True)
+            states = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                try:
+                    with open(path) as file:
+                        states.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        lines = []
+        for metric in self.metrics:
+            total = {}
+            for state in states:
+                metric.merge(total, state.get(metric.name, {}))
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.lines(total))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.histogram('dna_stage_seconds', 'Seconds spent in each request stage.', ('stage',))
+REQUEST_SECONDS = registry.histogram('dna_request_seconds', 'Seconds spent handling a request, by endpoint.',
+                                     ('endpoint',))
+REQUESTS = registry.counter('dna_requests_total', 'Requests handled, by endpoint and status code.',
+                            ('endpoint', 'status'))
+RECORDS_SCANNED = registry.counter('dna_records_scanned_total',
+                                   'Population records compared by similarity scans, cached or aligned.')
+ALIGNMENTS = registry.counter('dna_alignments_total', 'Pairwise alignments computed.')
+KMER_CANDIDATES = registry.histogram('dna_kmer_candidates', 'Population records kept by the k-mer index per search.',
+                                     buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+
+
+def observe(stage, seconds):
+    """Records the duration of a stage, and adds it to the profile of the current request."""
+    STAGE_SECONDS.observe(seconds, stage)
+    profile = _profile.get()
+    if profile is not None:
+        profile.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one occurrence of a stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def start_profile():
+    """Starts collecting the stage timings of the current request."""
+    _profile.set([])
+
+
+def stop_profile():
+    """
+    Stops collecting the stage timings of the current request.
+
+    Returns:
+        list of tuple: (stage, seconds) in completion order, None if the request was not profiled.
+    """
+    profile = _profile.get()
+    _profile.set(None)
+    return profile
@@ -0,0 +1,213 @@
+# Kinship model artifacts, loaded once per process with load timings and hot reload
+
+import os
+import pickle as pkl
+import threading
+import time
+
+import numpy as np
+
+from featurizer import KmerFeaturizer, PopulationFeatures
+
+
+class ModelUnavailable(Exception):
+    """Raised when the model artifacts are missing or cannot be loaded."""
+
+
+class ModelArtifacts:
+    """
+    One loaded version of the model artifacts.
+
+    Attributes:
+        model: The kinship classifier.
+        scale (numpy.ndarray): Per-column divisor of the fitted MaxAbsScaler.
+        featurizer (KmerFeaturizer): Featurizer over the vectorizer vocabulary.
+        population_features (PopulationFeatures): Cached count rows of the population.
+        timings (dict): Seconds spent loading each artifact.
+        mtimes (tuple): Modification times of the source files when they were loaded.
+        loaded_at (float): time.time() of the load.
+    """
+
+    def __init__(self, model, scale, featurizer, timings, mtimes):
+        self.model = model
+        self.scale = scale
+        self.featurizer = featurizer
+        self.population_features = PopulationFeatures(featurizer)
+        self.timings = timings
+        self.mtimes = mtimes
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """
+    Loads the pickled model, vectorizer and scaler and serves them to the endpoints.
+
+    The vectorizer and scaler are only needed for two arrays: the featurizer's k-mer
+    code-to-column table and the scaler's per-column divisor. After the first load they
+    are exported next to the pickles as .npy files and later loads memory-map them, so
+    startup only unpickles the model. Loaded before gunicorn forks its workers
+    (preload_app), the artifacts are shared copy-on-write.
+
+    Every `check_interval` seconds a request compares the modification times of the
+    pickles with the loaded ones; when they changed, the artifacts are reloaded in a
+    background thread and swapped in once loaded, while requests keep the old ones.
+    Artifacts that could not be loaded are retried the same way, so a model added after
+    startup is served without a restart.
+    """
+
+    def __init__(self, directory, model_file='finalized_model_lgb.pkl', vectorizer_file='vectorizer.pkl',
+                 scaler_file='scaler.pkl', check_interval=30):
+        """
+        Parameters:
+            directory (str): Directory of the artifacts.
+            model_file (str, optional): Model pickle, relative to `directory` or absolute. Defaults to 'finalized_model_lgb.pkl'.
+            vectorizer_file (str, optional): CountVectorizer pickle. Defaults to 'vectorizer.pkl'.
+            scaler_file (str, optional): MaxAbsScaler pickle. Defaults to 'scaler.pkl'.
+            check_interval (float, optional): Seconds between checks for changed artifacts, 0 disables hot reload. Defaults to 30.
+        """
+        self.paths = {name: os.path.join(directory, file) for name, file in
+                      (('model', model_file), ('vectorizer', vectorizer_file), ('scaler', scaler_file))}
+        self.export_paths = {'columns': os.path.join(directory, 'featurizer_columns.npy'),
+                             'scale': os.path.join(directory, 'scaler_scale.npy')}
+        self.check_interval = check_interval
+        self.artifacts = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._checked_at = time.monotonic()
+
+    def get(self):
+        """
+        Returns the current artifacts, starting a background reload if their files changed
+        or, until they load, at most every `check_interval` seconds.
+
+        Returns:
+            ModelArtifacts: The loaded artifacts.
+        Raises:
+            ModelUnavailable: If the artifacts are not loaded yet.
+        """
+        artifacts = self.artifacts
+        if self.check_interval and time.monotonic() - self._checked_at >= self.check_interval:
+            self._checked_at = time.monotonic()
+            # Artifacts that failed to load are retried until they load
+            if artifacts is None or self._mtimes() != artifacts.mtimes:
+                self._reload_in_background()
+        if artifacts is None:
+            raise ModelUnavailable(self.error or "The model is not loaded.")
+        return artifacts
+
+    def load(self):
+        """
+        Loads the artifacts and makes them current.
+
+        Returns:
+            ModelArtifacts: The loaded artifacts.
+        Raises:
+            ModelUnavailable: If an artifact is missing or cannot be loaded.
+        """
+        try:
+            artifacts = self._load()
+        except ModelUnavailable as e:
+            self.error = str(e)
+            raise
+        self.artifacts = artifacts
+        self.error = None
+        total = sum(artifacts.timings.values())
+        print(f"Loaded the model artifacts in {total:.3f}s: "
+              + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in artifacts.timings.items()))
+        return artifacts
+
+    def status(self):
+        """Returns the load state, timings and source files of the current artifacts."""
+        artifacts = self.artifacts
+        return {
+            "loaded": artifacts is not None,
+            "error": self.error,
+            "loaded_at": artifacts.loaded_at if artifacts else None,
+            "load_seconds": artifacts.timings if artifacts else None,
+            "files": {name: os.path.basename(path) for name, path in self.paths.items()},
+        }
+
+    def _load(self):
+        mtimes = self._mtimes()
+        export_current = self._export_current(mtimes)
+        required = ['model'] if export_current else ['model', 'vectorizer', 'scaler']
+        missing = [self.paths[name] for name in required if not os.path.exists(self.paths[name])]
+        if missing:
+            raise ModelUnavailable(f"Missing model artifacts: {', '.join(missing)}")
+        timings = {}
+        try:
+            model = self._timed(timings, 'model', self._unpickle, self.paths['model'])
+            if export_current:
+                columns = self._timed(timings, 'columns', np.load, self.export_paths['columns'], mmap_mode='r')
+                scale = self._timed(timings, 'scale', np.load, self.export_paths['scale'], mmap_mode='r')
+            else:
+                vectorizer = self._timed(timings, 'vectorizer', self._unpickle, self.paths['vectorizer'])
+                scaler = self._timed(timings, 'scaler', self._unpickle, self.paths['scaler'])
+                columns = self._timed(timings, 'columns', lambda: KmerFeaturizer.from_vectorizer(vectorizer).columns)
+                scale = np.asarray(scaler.scale_, dtype=np.float64)
+                self._export(columns, scale)
+        except ModelUnavailable:
+            raise
+        except Exception as e:
+            raise ModelUnavailable(f"Error loading the model artifacts: {e}")
+        # The scaler covers the parent counts followed by the child counts
+        featurizer = KmerFeaturizer.from_columns(columns, len(scale) // 2)
+        if len(scale) % 2 or int(np.max(columns, initial=-1)) >= featurizer.n_features:
+            raise ModelUnavailable("The scaler does not match the vectorizer vocabulary.")
+        return ModelArtifacts(model, scale, featurizer, timings, mtimes)
+
+    def _export_current(self, mtimes):
+        """Whether the .npy export exists and is not older than the pickles it was made from."""
+        try:
+            exported = min(os.stat(path).st_mtime_ns for path in self.export_paths.values())
+        except OSError:
+            return False
+        return all(mtime is None or mtime <= exported for mtime in mtimes[1:])
+
+    def _export(self, columns, scale):
+        """Saves the featurizer table and scaler divisor; a read-only directory only loses the speedup."""
+        try:
+            np.save(self.export_paths['columns'], columns)
+            np.save(self.export_paths['scale'], scale)
+        except OSError as e:
+            print(f"Could not export the model arrays: {e}")
+
+    def _mtimes(self):
+        """Modification times of the model, vectorizer and scaler pickles, None for missing ones."""
+        mtimes = []
+        for path in self.paths.values():
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _reload_in_background(self):
+        """Starts a background reload unless one is already running."""
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_reload, name='model-reload', daemon=True).start()
+
+    def _background_reload(self):
+        try:
+            self.load()
+        except ModelUnavailable as e:
+            # Keep serving the loaded artifacts, the next check retries
+            print(f"Error occurred while reloading the model: {e}")
+        finally:
+            self._reloading = False
+
+    @staticmethod
+    def _timed(timings, name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def _unpickle(path):
+        with open(path, "rb") as data_infile:
+            return pkl.load(data_infile)
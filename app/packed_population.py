@@ -0,0 +1,284 @@
+# Persistent, memory-mapped population snapshot with 2-bit packed sequences
+
+# Layout of a snapshot directory:
+#   sequences.<generation>.bin  append-only data file; each record is its 2-bit packed bases
+#                               (4 per byte), followed by a 1-bit ambiguity mask when the
+#                               sequence has symbols other than A, C, G and T
+#   records.json                side table: validators of the API response, the current data
+#                               file and one compact row per record
+#   lock                        flock()ed while a process syncs the snapshot
+# Every worker maps the data file read-only, so all of them share it through the page cache.
+# Mappings hold a shared flock() on their data file; compaction only removes older
+# generations that nobody holds, so a mapped file can always be opened again by path.
+
+import fcntl
+import glob
+import json
+import mmap
+import os
+import time
+
+import numpy as np
+
+_BASES = np.frombuffer(b'ACGT', dtype=np.uint8)
+_CODES = np.full(256, 255, dtype=np.uint8)
+_CODES[_BASES] = np.arange(4, dtype=np.uint8)
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+# Compaction runs once dead bytes exceed this fraction of the data file
+COMPACTION_RATIO = 0.5
+# Reads of the side table when its data file was compacted away in between
+LOAD_ATTEMPTS = 5
+
+
+def pack_sequence(sequence):
+    """
+    Packs an uppercase DNA sequence into 2-bit codes with an ambiguity mask.
+
+    Parameters:
+        sequence (str): DNA sequence.
+    Returns:
+        tuple: Packed bytes (packed bases, then the mask if any symbol is ambiguous) and the
+            ambiguous symbols in order of position.
+    """
+    symbols = np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)
+    codes = _CODES[symbols]
+    ambiguous = codes == 255
+    codes = np.where(ambiguous, 0, codes)
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    packed = (padded.reshape(-1, 4) << _SHIFTS).sum(axis=1, dtype=np.uint8).tobytes()
+    if not ambiguous.any():
+        return packed, ''
+    return packed + np.packbits(ambiguous).tobytes(), symbols[ambiguous].tobytes().decode('ascii')
+
+
+def unpack_sequence(buffer, offset, length, ambiguous):
+    """
+    Decodes a packed sequence into an array of ASCII bytes without building a string.
+
+    Parameters:
+        buffer (numpy.ndarray): uint8 view of the data file.
+        offset (int): Byte offset of the record.
+        length (int): Number of bases.
+        ambiguous (str): Ambiguous symbols of the record, in order of position.
+    Returns:
+        numpy.ndarray: uint8 ASCII code of every base.
+    """
+    packed_size = -(-length // 4)
+    packed = buffer[offset:offset + packed_size]
+    sequence = _BASES[((packed[:, None] >> _SHIFTS) & 3).reshape(-1)[:length]]
+    if ambiguous:
+        mask = np.unpackbits(buffer[offset + packed_size:offset + packed_size + -(-length // 8)], count=length)
+        sequence[mask.astype(bool)] = np.frombuffer(ambiguous.encode('ascii'), dtype=np.uint8)
+    return sequence
+
+
+def map_data_file(path):
+    """
+    Maps a data file read-only and holds a shared lock on it until the file is closed.
+
+    Parameters:
+        path (str): Path of the data file.
+    Returns:
+        tuple: The open file and a uint8 view of its contents.
+    Raises:
+        FileNotFoundError: If the file does not exist or was removed by a compaction.
+    """
+    data_file = open(path, 'rb')
+    try:
+        fcntl.flock(data_file, fcntl.LOCK_SH)
+        status = os.fstat(data_file.fileno())
+        # Removed between the open and the lock
+        if status.st_nlink == 0:
+            raise FileNotFoundError(path)
+        buffer = np.zeros(0, dtype=np.uint8)
+        if status.st_size > 0:
+            buffer = np.frombuffer(mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ), dtype=np.uint8)
+    except BaseException:
+        data_file.close()
+        raise
+    return data_file, buffer
+
+
+def record_key(entry):
+    """Returns the identity of a population entry across API responses, or None."""
+    return entry.get('_id') or entry.get('national_id')
+
+
+class PackedSequences:
+    """
+    Read-only list-like view of the sequences of a snapshot.
+
+    Items are uint8 arrays of ASCII bases decoded from the memory map on access. The
+    view keeps its data file open, and locked against removal, for as long as it lives.
+    """
+
+    def __init__(self, buffer, rows, data_file=None):
+        self.buffer = buffer
+        self.rows = rows
+        self.data_file = data_file
+        # Other processes map the same file by path, such as the scan pool
+        self.path = data_file.name if data_file is not None else None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lengths(self):
+        """Returns the int64 length of every sequence, read from the side table."""
+        return np.fromiter((row[4] for row in self.rows), dtype=np.int64, count=len(self.rows))
+
+    def __getitem__(self, index):
+        row = self.rows[index]
+        return unpack_sequence(self.buffer, row[3], row[4], row[5])
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class PackedPopulation:
+    """
+    A population snapshot stored in a directory, synced incrementally from API entries.
+
+    Rows of the side table are [key, updatedAt, status, offset, length, ambiguous, info].
+    """
+
+    def __init__(self, directory):
+        """
+        Parameters:
+            directory (str): Snapshot directory, created if missing.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.table_path = os.path.join(directory, 'records.json')
+
+    def exists(self):
+        return os.path.exists(self.table_path)
+
+    def read_table(self):
+        """
+        Reads the side table.
+
+        Returns:
+            dict: The side table, with an empty record list if there is no snapshot yet.
+        """
+        if not self.exists():
+            return {"generation": 0, "etag": None, "last_modified": None, "synced_at": None, "records": []}
+        with open(self.table_path) as table_file:
+            return json.load(table_file)
+
+    def data_path(self, generation):
+        return os.path.join(self.directory, f'sequences.{generation}.bin')
+
+    def load(self):
+        """
+        Maps the snapshot read-only.
+
+        Returns:
+            tuple: The side table and a PackedSequences view of its sequences.
+        Raises:
+            FileNotFoundError: If the data file of the records is still missing after LOAD_ATTEMPTS reads.
+        """
+        for _ in range(LOAD_ATTEMPTS):
+            table = self.read_table()
+            path = self.data_path(table['generation'])
+            try:
+                data_file, buffer = map_data_file(path)
+            except FileNotFoundError:
+                # Compacted by another process since the side table was read
+                if table['records']:
+                    continue
+                data_file, buffer = None, np.zeros(0, dtype=np.uint8)
+            return table, PackedSequences(buffer, table['records'], data_file)
+        raise FileNotFoundError(f"Missing data file of the population snapshot: {path}")
+
+    def sync(self, records, sequences, etag=None, last_modified=None):
+        """
+        Brings the snapshot up to date with the records parsed from an API response.
+
+        Records whose key and `updatedAt` match a stored record keep their packed bytes;
+        the others are packed and appended. Stored records missing from `records` are
+        dropped and the data file is compacted into a new generation once dead bytes
+        dominate it.
+
+        Parameters:
+            records (list of PopulationRecord): Population records.
+            sequences (list of str): Truncated, uppercased sequence of each record.
+            etag (str, optional): ETag of the API response. Defaults to None.
+            last_modified (str, optional): Last-Modified header of the API response. Defaults to None.
+        Returns:
+            dict: Counts of 'reused' and 'packed' records.
+        """
+        with open(os.path.join(self.directory, 'lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            table = self.read_table()
+            self._remove_unused(table['generation'])
+            data_path = self.data_path(table['generation'])
+            stored = {}
+            # Without its data file, no stored record can be reused
+            if os.path.exists(data_path):
+                stored = {row[0]: row for row in table['records'] if row[0] is not None}
+            rows = []
+            counts = {"reused": 0, "packed": 0}
+            with open(data_path, 'ab') as data_file:
+                offset = data_file.tell()
+                for record, sequence in zip(records, sequences):
+                    key, updated_at = record.key, record.info.get('updatedAt')
+                    row = stored.pop(key, None)
+                    if row is not None and updated_at is not None and row[1] == updated_at:
+                        rows.append([key, row[1], record.status, row[3], row[4], row[5], record.info])
+                        counts["reused"] += 1
+                        continue
+                    packed, ambiguous = pack_sequence(sequence)
+                    data_file.write(packed)
+                    rows.append([key, updated_at, record.status, offset, len(sequence), ambiguous, record.info])
+                    offset += len(packed)
+                    counts["packed"] += 1
+            live_size = sum(_record_size(row) for row in rows)
+            if offset and live_size < offset * (1 - COMPACTION_RATIO):
+                table['generation'] = self._compact(table['generation'], rows)
+            table.update({"etag": etag, "last_modified": last_modified, "synced_at": time.time(), "records": rows})
+            # Readers only ever see a complete side table
+            temporary_path = self.table_path + '.tmp'
+            with open(temporary_path, 'w') as table_file:
+                json.dump(table, table_file, separators=(',', ':'))
+            os.replace(temporary_path, self.table_path)
+            return counts
+
+    def _compact(self, generation, rows):
+        """Copies the live records into a new data file generation and updates their offsets."""
+        with open(self.data_path(generation), 'rb') as old_file:
+            old_data = old_file.read()
+        offset = 0
+        with open(self.data_path(generation + 1), 'wb') as new_file:
+            for row in rows:
+                size = _record_size(row)
+                new_file.write(old_data[row[3]:row[3] + size])
+                row[3] = offset
+                offset += size
+        # Processes that still map the old file keep it until they reload, a later sync removes it
+        self._remove_unused(generation + 1)
+        return generation + 1
+
+    def _remove_unused(self, generation):
+        """Removes the data files older than `generation` that no process maps any more."""
+        for path in glob.glob(os.path.join(self.directory, 'sequences.*.bin')):
+            try:
+                if int(os.path.basename(path).split('.')[1]) >= generation:
+                    continue
+            except ValueError:
+                continue
+            with open(path, 'rb') as old_file:
+                try:
+                    fcntl.flock(old_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                os.remove(path)
+
+
+def _record_size(row):
+    """Returns the number of bytes a side-table row points to."""
+    size = -(-row[4] // 4)
+    if row[5]:
+        size += -(-row[4] // 8)
+    return size
@@ -0,0 +1,372 @@
+# Population data structures and the cached population store
+
+import hashlib
+import threading
+import time
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from json_stream import iter_array_items
+from kmer_index import KmerIndex
+from metrics import span
+from packed_population import PackedPopulation, PackedSequences, record_key
+
+# Number of bases of each population sequence used for comparisons
+SEQUENCE_LENGTH = 2000
+
+# Keys of a population entry returned with match information
+INFO_KEYS = ['name', 'status', 'description', 'createdAt', 'updatedAt',
+             'address', 'national_id', 'phone', 'gender', 'birthdate', 'bloodType']
+# Bytes of the API response read at a time while it is parsed
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+
+class PopulationUnavailable(Exception):
+    """Raised when the population cannot be retrieved from the API."""
+
+
+def sequence_digest(sequence):
+    """
+    Computes the digest used to look up identical sequences.
+
+    Parameters:
+        sequence (str or numpy.ndarray): DNA sequence, already truncated to the compared
+            length, as a string or an array of ASCII bytes.
+    Returns:
+        bytes: 16-byte BLAKE2b digest of the sequence.
+    """
+    data = sequence.tobytes() if isinstance(sequence, np.ndarray) else sequence.encode()
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def preprocess_entry(entry, sequence_length=SEQUENCE_LENGTH):
+    """
+    Reduces a population entry to what the endpoints use.
+
+    Parameters:
+        entry (dict): Population entry with a 'DNA_sequence'.
+        sequence_length (int, optional): Number of bases kept. Defaults to SEQUENCE_LENGTH.
+    Returns:
+        tuple: Truncated, uppercased sequence, status and the dict of INFO_KEYS fields.
+    """
+    info = {key: entry[key] for key in INFO_KEYS if key in entry}
+    return entry['DNA_sequence'][:sequence_length].upper(), entry.get('status'), info
+
+
+class PopulationRecord:
+    """
+    Metadata of a population entry; its sequence is kept by the snapshot.
+
+    Attributes:
+        status (str): Status of the entry ('missing', 'crime', ...).
+        info (dict): The INFO_KEYS fields present in the entry.
+        key (str): Identity of the entry across API responses (_id or national_id), if any.
+    """
+
+    __slots__ = ('status', 'info', 'key')
+
+    def __init__(self, status, info, key=None):
+        self.status = status
+        self.info = info
+        self.key = key
+
+    @property
+    def name(self):
+        return self.info.get('name', 'unknown')
+
+
+def read_population(chunks, sequence_length=SEQUENCE_LENGTH):
+    """
+    Parses a population API response incrementally into records and truncated sequences.
+
+    Entries are decoded one at a time and reduced to what the endpoints use as soon as
+    they are parsed, so memory grows with the retained records rather than with the
+    size of the response and its full-length sequences.
+
+    Parameters:
+        chunks (iterable of bytes): The response body, such as response.iter_content().
+        sequence_length (int, optional): Number of bases kept. Defaults to SEQUENCE_LENGTH.
+    Returns:
+        tuple: List of PopulationRecord and list of their sequences, for the entries that
+            have a DNA sequence.
+    Raises:
+        PopulationUnavailable: If the response is not in the expected format or the transfer fails.
+    """
+    records, sequences = [], []
+    try:
+        for entry in iter_array_items(chunks, 'population'):
+            if not isinstance(entry, dict) or 'DNA_sequence' not in entry:
+                continue
+            sequence, status, info = preprocess_entry(entry, sequence_length)
+            records.append(PopulationRecord(status, info, record_key(entry)))
+            sequences.append(sequence)
+    except ValueError:
+        raise PopulationUnavailable("API response is not in the expected format.")
+    except requests.RequestException as e:
+        raise PopulationUnavailable(str(e))
+    return records, sequences
+
+
+class ExactMatchIndex:
+    """
+    Index of population records keyed by the digest of their truncated DNA sequence.
+
+    A similarity of 1 from needleman_wunsch_similarity is only reached when both
+    sequences are identical, so exact identification is a dictionary lookup instead
+    of a scan. Records are partitioned by `status`; the 'all' partition covers the
+    whole population. Each bucket keeps records in population order so the first
+    match is the same record the linear scan would have found.
+    """
+
+    ALL = 'all'
+
+    def __init__(self, records, sequences, digests=None):
+        """
+        Builds the index.
+
+        Parameters:
+            records (list of PopulationRecord): Population records.
+            sequences (list): Sequence of each record.
+            digests (list of bytes, optional): sequence_digest() of each sequence. Defaults to None (computed).
+        """
+        if digests is None:
+            digests = [sequence_digest(sequence) for sequence in sequences]
+        self.partitions = {self.ALL: {}}
+        for record, sequence, digest in zip(records, sequences, digests):
+            # Empty sequences never reach a similarity of 1
+            if not len(sequence):
+                continue
+            self.partitions[self.ALL].setdefault(digest, []).append(record)
+            self.partitions.setdefault(record.status, {}).setdefault(digest, []).append(record)
+
+    def lookup(self, sequence, status=ALL):
+        """
+        Returns the population records whose truncated sequence is identical to `sequence`.
+
+        Parameters:
+            sequence (str): Query DNA sequence, truncated like the population sequences.
+            status (str, optional): Status partition to search. Defaults to 'all'.
+        Returns:
+            list of PopulationRecord: Matching records in population order, empty if there is none.
+        """
+        if not sequence:
+            return []
+        return self.partitions.get(status, {}).get(sequence_digest(sequence), [])
+
+
+class PopulationSnapshot:
+    """
+    One version of the population with the indexes built from it.
+
+    Attributes:
+        records (list of PopulationRecord): Population records.
+        sequences (list): Sequence of each record, as strings or, for snapshots mapped from
+            disk, as a PackedSequences view yielding arrays of ASCII bytes.
+        digests (list of bytes): sequence_digest() of each sequence.
+        lengths (numpy.ndarray): int64 length of each sequence.
+        exact_index (ExactMatchIndex): Index of identical sequences.
+        etag (str): ETag of the API response, if any.
+        last_modified (str): Last-Modified header of the API response, if any.
+        fetched_at (float): time.monotonic() of the last fetch or revalidation.
+    """
+
+    def __init__(self, records, sequences, etag=None, last_modified=None, fetched_at=None):
+        self.records = records
+        self.sequences = sequences
+        self.digests = [sequence_digest(sequence) for sequence in sequences]
+        if isinstance(sequences, PackedSequences):
+            self.lengths = sequences.lengths()
+        else:
+            self.lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+        self.exact_index = ExactMatchIndex(records, sequences, self.digests)
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+        self._kmer_index = None
+        self._lock = threading.Lock()
+
+    @property
+    def kmer_index(self):
+        """The KmerIndex of the population, built on first use."""
+        with self._lock:
+            if self._kmer_index is None:
+                self._kmer_index = KmerIndex(self.sequences)
+            return self._kmer_index
+
+    def filter(self, status):
+        """
+        Returns the positions of the records with a given status, or of every record for 'all'.
+
+        Parameters:
+            status (str): Status to keep.
+        Returns:
+            list of int: Record positions in population order.
+        """
+        if status == ExactMatchIndex.ALL:
+            return list(range(len(self.records)))
+        return [index for index, record in enumerate(self.records) if record.status == status]
+
+
+def create_session(pool_size=10):
+    """
+    Creates a pooled HTTP session with keep-alive and compressed transfers.
+
+    Parameters:
+        pool_size (int, optional): Number of pooled connections per host. Defaults to 10.
+    Returns:
+        requests.Session: The configured session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+
+class PopulationStore:
+    """
+    Process-wide cache of the population API.
+
+    A snapshot younger than `ttl` is served as is. An older one is still served for up to
+    `stale_ttl` more seconds while a background thread revalidates it with
+    If-None-Match / If-Modified-Since; past that, requests wait for the refresh. A 304
+    response only renews the snapshot, so records and indexes are rebuilt only when the
+    population actually changes.
+
+    With a `snapshot_dir`, the population is kept in a PackedPopulation: a cold process
+    maps it from disk instead of waiting for the API, then revalidates it with the stored
+    validators, and a changed population only packs the records that changed.
+    """
+
+    def __init__(self, url, ttl=60, stale_ttl=600, timeout=(5, 60), session=None, snapshot_dir=None):
+        """
+        Parameters:
+            url (str): URL of the population API.
+            ttl (float, optional): Seconds a snapshot is served without revalidation. Defaults to 60.
+            stale_ttl (float, optional): Seconds a stale snapshot is served while it is revalidated. Defaults to 600.
+            timeout (tuple, optional): Connect and read timeouts in seconds. Defaults to (5, 60).
+            session (requests.Session, optional): HTTP session. Defaults to create_session().
+            snapshot_dir (str, optional): Directory of the persistent snapshot. Defaults to None (memory only).
+        """
+        self.url = url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.session = session or create_session()
+        self.snapshot = None
+        self.packed = PackedPopulation(snapshot_dir) if snapshot_dir else None
+        self._refresh_lock = threading.Lock()
+        # Guards _refreshing only, so requests never wait on a fetch to check it
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        """
+        Returns the current population snapshot, fetching or revalidating it as needed.
+
+        Returns:
+            PopulationSnapshot: The population.
+        Raises:
+            PopulationUnavailable: If there is no usable snapshot and the API request fails.
+        """
+        snapshot = self.snapshot
+        if snapshot is None and self.packed is not None and self.packed.exists():
+            with self._refresh_lock:
+                if self.snapshot is None:
+                    try:
+                        self.snapshot = self._load_packed()
+                    except FileNotFoundError as e:
+                        # A damaged snapshot is rebuilt from the API
+                        print(f"Error occurred while loading the population snapshot: {e}")
+            snapshot = self.snapshot
+        if snapshot is not None:
+            age = time.monotonic() - snapshot.fetched_at
+            if age < self.ttl:
+                return snapshot
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background()
+                return snapshot
+        with self._refresh_lock:
+            # Another request may have refreshed the snapshot while this one waited
+            if self.snapshot is not snapshot and self.snapshot is not None:
+                return self.snapshot
+            return self.refresh()
+
+    def refresh(self):
+        """
+        Fetches the population, sending validators of the current snapshot.
+
+        Returns:
+            PopulationSnapshot: The new or revalidated snapshot.
+        Raises:
+            PopulationUnavailable: If the request fails or the response is not in the expected format.
+        """
+        with span('population_fetch'):
+            return self._refresh()
+
+    def _refresh(self):
+        snapshot = self.snapshot
+        headers = {}
+        if snapshot is not None:
+            if snapshot.etag:
+                headers['If-None-Match'] = snapshot.etag
+            if snapshot.last_modified:
+                headers['If-Modified-Since'] = snapshot.last_modified
+        try:
+            # The body is streamed into the parser instead of being read whole
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise PopulationUnavailable(str(e))
+        with response:
+            if response.status_code == 304 and snapshot is not None:
+                snapshot.fetched_at = time.monotonic()
+                return snapshot
+            if response.status_code != 200:
+                raise PopulationUnavailable("Failed to retrieve data from API")
+            records, sequences = read_population(response.iter_content(RESPONSE_CHUNK_SIZE))
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if self.packed is not None:
+            self.packed.sync(records, sequences, etag, last_modified)
+            self.snapshot = self._load_packed(fetched_at=time.monotonic())
+            return self.snapshot
+        self.snapshot = PopulationSnapshot(records, sequences, etag, last_modified)
+        return self.snapshot
+
+    def _load_packed(self, fetched_at=None):
+        """
+        Builds a snapshot from the persistent snapshot.
+
+        Parameters:
+            fetched_at (float, optional): time.monotonic() of the fetch. Defaults to None, which
+                derives it from the time the snapshot was synced so its age carries over.
+        Returns:
+            PopulationSnapshot: The mapped snapshot.
+        """
+        with span('population_load'):
+            table, sequences = self.packed.load()
+        if fetched_at is None:
+            age = time.time() - (table['synced_at'] or 0)
+            fetched_at = time.monotonic() - max(age, 0)
+        records = [PopulationRecord(row[2], row[6], row[0]) for row in table['records']]
+        return PopulationSnapshot(records, sequences, table['etag'], table['last_modified'], fetched_at)
+
+    def _refresh_in_background(self):
+        """Starts a background revalidation unless one is already running."""
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name='population-refresh', daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            with self._refresh_lock:
+                self.refresh()
+        except PopulationUnavailable as e:
+            # Keep serving the stale snapshot, the next request retries
+            print(f"Error occurred while refreshing the population: {e}")
+        finally:
+            self._refreshing = False
@@ -0,0 +1,250 @@
+# Population scans split into chunks across a persistent process pool, with deadlines
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from alignment import similarity_many, DeadlineExceeded
+from metrics import observe, ALIGNMENTS, RECORDS_SCANNED
+from packed_population import PackedSequences, map_data_file, unpack_sequence
+
+# Data files mapped by this pool process, by path
+_mapped = {}
+
+
+def _map(path):
+    """Returns the uint8 view of a snapshot data file, mapping it on first use."""
+    if path not in _mapped:
+        # Files of older snapshots are not used again; closing them releases their lock
+        for data_file, _ in _mapped.values():
+            data_file.close()
+        _mapped.clear()
+        _mapped[path] = map_data_file(path)
+    return _mapped[path][1]
+
+
+def _chunk_targets(snapshot, indices):
+    """
+    Returns the targets of a pool task.
+
+    Records of a packed snapshot are sent as their data file and (offset, length,
+    ambiguous symbols), so the pool process decodes them from its own mapping of the
+    file; other snapshots send the sequences.
+    """
+    sequences = snapshot.sequences
+    if isinstance(sequences, PackedSequences) and sequences.path is not None:
+        return sequences.path, [tuple(sequences.rows[index][3:6]) for index in indices.tolist()]
+    return [sequences[index] for index in indices.tolist()]
+
+
+def _scan_chunk(targets, query, threshold, deadline):
+    """
+    Aligns a query against one chunk of the population, unless the deadline passed.
+
+    Parameters:
+        targets (list or tuple): Target sequences, or a data file and the rows of its
+            records, as from _chunk_targets().
+    Returns:
+        numpy.ndarray: Similarities of the chunk, or None if it was skipped or the
+            deadline passed while it was aligned.
+    """
+    if deadline is not None and time.monotonic() >= deadline:
+        return None
+    if isinstance(targets, tuple):
+        path, rows = targets
+        buffer = _map(path)
+        targets = [unpack_sequence(buffer, offset, length, ambiguous) for offset, length, ambiguous in rows]
+    try:
+        return similarity_many(query, targets, threshold=threshold, deadline=deadline)
+    except DeadlineExceeded:
+        return None
+
+
+class ScanResult:
+    """
+    Similarities of a scan, which may be partial.
+
+    Attributes:
+        scores (numpy.ndarray): Similarity of each scanned target, NaN for targets rejected
+            by the threshold or not scanned.
+        scanned (numpy.ndarray): Whether each target was scanned before the deadline.
+        complete (bool): Whether every target was scanned.
+    """
+
+    def __init__(self, scores, scanned):
+        self.scores = scores
+        self.scanned = scanned
+        self.complete = bool(scanned.all())
+
+
+class ScanPool:
+    """
+    Persistent process pool that aligns a query against the population in chunks.
+
+    The pool is started on first use in each process (so once per gunicorn worker).
+    Pool processes map the packed snapshot file themselves, so every worker and pool
+    process shares its pages through the page cache and tasks only carry record
+    offsets; a snapshot held in memory sends the sequences of each chunk instead.
+    Every scan has a deadline: chunks not started by then are cancelled, running ones
+    stop at their next deadline check, and the result reports which targets were scanned.
+    With `processes` set to 0, chunks run in the calling thread with the same deadline.
+    With a SimilarityCache, known similarities are answered first and only the other
+    targets are aligned.
+    """
+
+    def __init__(self, processes=None, chunk_size=64, start_method='forkserver', cache=None):
+        """
+        Parameters:
+            processes (int, optional): Number of pool processes, 0 scans in-process. Defaults to the CPU count.
+            chunk_size (int, optional): Number of targets per task. Defaults to 64.
+            start_method (str, optional): multiprocessing start method of the pool. Defaults to 'forkserver'.
+            cache (SimilarityCache, optional): Cache of the similarities. Defaults to None.
+        """
+        self.processes = os.cpu_count() if processes is None else processes
+        self.chunk_size = chunk_size
+        self.start_method = start_method
+        self._executor = None
+        self._pid = None
+        self.cache = cache
+        self._cache_snapshot = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def scan(self, snapshot, indices, query, threshold=None, deadline=None, progress=None):
+        """
+        Computes the similarity of a query with population records.
+
+        Parameters:
+            snapshot (PopulationSnapshot): The population.
+            indices (list of int): Positions of the records to scan.
+            query (str): Query DNA sequence.
+            threshold (float, optional): Similarity threshold passed to similarity_many. Defaults to None.
+            deadline (float, optional): time.monotonic() after which no chunk is started. Defaults to None.
+            progress (callable, optional): Called with the fraction of records scanned after each chunk. Defaults to None.
+        Returns:
+            ScanResult: Similarities of the records, in the order of `indices`.
+        """
+        scores = np.full(len(indices), np.nan)
+        scanned = np.zeros(len(indices), dtype=bool)
+        for chunk, chunk_scores in self.iter_chunks(snapshot, indices, query, threshold, deadline):
+            scores[chunk] = chunk_scores
+            scanned[chunk] = True
+            if progress is not None:
+                progress(scanned.mean())
+        return ScanResult(scores, scanned)
+
+    def iter_chunks(self, snapshot, indices, query, threshold=None, deadline=None):
+        """
+        Aligns a query with population records, yielding the similarities of each chunk as it completes.
+
+        Chunks complete in any order; cached similarities come first, as one chunk. Closing
+        the generator early cancels the queued chunks.
+
+        Parameters:
+            snapshot (PopulationSnapshot): The population.
+            indices (list of int): Positions of the records to scan.
+            query (str): Query DNA sequence.
+            threshold (float, optional): Similarity threshold passed to similarity_many. Defaults to None.
+            deadline (float, optional): time.monotonic() after which no chunk is started. Defaults to None.
+        Yields:
+            tuple: Positions in `indices` covered by the chunk and the similarities of its records.
+        """
+        start = time.perf_counter()
+        indices = np.asarray(indices, dtype=np.int64)
+        positions = np.arange(len(indices))
+        if self.cache is not None:
+            self._sync_cache(snapshot)
+            # Lengths come from the snapshot, so cached targets are never decoded
+            lengths = snapshot.lengths[indices]
+            digests = [snapshot.digests[index] for index in indices.tolist()]
+            cached, found = self.cache.lookup(query, digests, threshold)
+            RECORDS_SCANNED.inc(int(found.sum()))
+            if found.any():
+                yield np.flatnonzero(found), cached[found]
+            positions = np.flatnonzero(~found)
+        chunks = self._scan_chunks(snapshot, indices, positions, query, threshold, deadline)
+        try:
+            for chunk, scores in chunks:
+                RECORDS_SCANNED.inc(len(chunk))
+                ALIGNMENTS.inc(len(chunk))
+                if self.cache is not None:
+                    self.cache.store(query, lengths[chunk],
+                                     [digests[position] for position in chunk.tolist()], scores, threshold)
+                yield chunk, scores
+        finally:
+            chunks.close()
+            observe('alignment', time.perf_counter() - start)
+
+    def _scan_chunks(self, snapshot, indices, positions, query, threshold, deadline):
+        """Aligns a query with the records at `positions` of `indices`, yielding each chunk as it completes."""
+        chunks = [positions[start:start + self.chunk_size] for start in range(0, len(positions), self.chunk_size)]
+        if not chunks:
+            return
+        if self.processes == 0:
+            for chunk in chunks:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                try:
+                    scores = similarity_many(query, [snapshot.sequences[index] for index in indices[chunk]],
+                                             threshold=threshold, deadline=deadline)
+                except DeadlineExceeded:
+                    return
+                yield chunk, scores
+            return
+        pending = set()
+        try:
+            executor = self._get_executor()
+            futures = {executor.submit(_scan_chunk, _chunk_targets(snapshot, indices[chunk]), query, threshold,
+                                       deadline): chunk
+                       for chunk in chunks}
+            pending = set(futures)
+            while pending:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # Deadline reached, running chunks stop at their next deadline check
+                    break
+                for future in done:
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        # A pool process died, start a new pool on the next scan
+                        with self._lock:
+                            self._executor = None
+                        raise
+                    if result is not None:
+                        yield futures[future], result
+        finally:
+            # Drop the queued chunks of a scan that stopped early
+            for future in pending:
+                future.cancel()
+
+    def _sync_cache(self, snapshot):
+        """Drops the cached similarities of sequences that left the population when a new snapshot is scanned."""
+        with self._lock:
+            previous, self._cache_snapshot = self._cache_snapshot, snapshot
+        if previous is not None and previous is not snapshot:
+            self.cache.invalidate(set(previous.digests) - set(snapshot.digests))
+
+    def _get_executor(self):
+        """Returns the pool of this process, starting it on first use or after a fork."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                context = multiprocessing.get_context(self.start_method)
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def close(self):
+        """Stops the pool of this process."""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._cache_snapshot = None
@@ -0,0 +1,165 @@
+# Seed-and-extend global similarity for sequences too long for a full alignment
+
+import numpy as np
+
+from alignment import banded_alignment_score, get_alignment_engine
+from kmer_index import kmer_codes
+
+
+def unique_seeds(seq1, seq2, k=16):
+    """
+    Finds the k-mers that occur exactly once in each sequence.
+
+    Parameters:
+        seq1 (str or numpy.ndarray): First DNA sequence.
+        seq2 (str or numpy.ndarray): Second DNA sequence.
+        k (int, optional): Seed length, at most 21. Defaults to 16.
+    Returns:
+        tuple: Start of each seed in seq1, sorted, and its start in seq2.
+    """
+    positions = []
+    for sequence in (seq1, seq2):
+        codes, first, counts = np.unique(kmer_codes(sequence, k), return_index=True, return_counts=True)
+        positions.append((codes[counts == 1], first[counts == 1]))
+    (codes1, starts1), (codes2, starts2) = positions
+    _, in1, in2 = np.intersect1d(codes1, codes2, assume_unique=True, return_indices=True)
+    order = np.argsort(starts1[in1], kind='stable')
+    return starts1[in1][order], starts2[in2][order]
+
+
+def seed_segments(starts1, starts2, k):
+    """
+    Merges seeds that overlap or touch on the same diagonal into gapless segments.
+
+    Parameters:
+        starts1 (numpy.ndarray): Start of each seed in the first sequence.
+        starts2 (numpy.ndarray): Start of each seed in the second sequence.
+        k (int): Seed length.
+    Returns:
+        tuple: int64 arrays of the start in each sequence and the length of every
+            segment, sorted by start in the first sequence.
+    """
+    diagonals = starts1 - starts2
+    order = np.lexsort((starts1, diagonals))
+    starts1, starts2, diagonals = starts1[order], starts2[order], diagonals[order]
+    # A seed opens a segment unless it continues the previous one on its diagonal
+    opens = np.ones(len(starts1), dtype=bool)
+    opens[1:] = (diagonals[1:] != diagonals[:-1]) | (starts1[1:] > starts1[:-1] + k)
+    firsts = np.flatnonzero(opens)
+    lasts = np.append(firsts[1:], len(starts1))[:len(firsts)] - 1
+    lengths = starts1[lasts] + k - starts1[firsts]
+    order = np.argsort(starts1[firsts], kind='stable')
+    return (starts1[firsts][order].astype(np.int64), starts2[firsts][order].astype(np.int64),
+            lengths[order].astype(np.int64))
+
+
+def chain_segments(starts1, starts2, lengths, length1, length2, match_score=3, gap_penalty=-2, window=64):
+    """
+    Selects the colinear, non-overlapping segments that best anchor a global alignment.
+
+    A chain scores its matched bases minus a gap for every base its diagonal moves,
+    counting the moves from the start of both sequences to the first segment and from
+    the last segment to their ends. A unique seed far off the diagonal then only joins
+    the chain when its matches pay for the indel it implies. Each segment considers the
+    `window` segments before it as predecessors.
+
+    Parameters:
+        starts1 (numpy.ndarray): Start of each segment in the first sequence, sorted.
+        starts2 (numpy.ndarray): Start of each segment in the second sequence.
+        lengths (numpy.ndarray): Length of each segment.
+        length1 (int): Length of the first sequence.
+        length2 (int): Length of the second sequence.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        gap_penalty (int, optional): Penalty per gap position. Defaults to -2.
+        window (int, optional): Number of predecessors considered. Defaults to 64.
+    Returns:
+        list of tuple: (start1, start2, length) of the chained segments, in sequence order.
+    """
+    count = len(starts1)
+    diagonals = starts1 - starts2
+    ends1, ends2 = starts1 + lengths, starts2 + lengths
+    scores = np.empty(count, dtype=np.int64)
+    previous = np.full(count, -1, dtype=np.int64)
+    for i in range(count):
+        diagonal = int(diagonals[i])
+        best = gap_penalty * abs(diagonal)
+        first = max(i - window, 0)
+        candidates = np.flatnonzero((ends1[first:i] <= starts1[i]) & (ends2[first:i] <= starts2[i])) + first
+        if len(candidates):
+            totals = scores[candidates] + gap_penalty * np.abs(diagonals[candidates] - diagonal)
+            j = int(np.argmax(totals))
+            if totals[j] > best:
+                best = int(totals[j])
+                previous[i] = candidates[j]
+        scores[i] = best + int(lengths[i]) * match_score
+    finals = scores + gap_penalty * np.abs(length1 - length2 - diagonals)
+    # The empty chain only pays for the difference in length
+    if not count or finals.max() <= gap_penalty * abs(length1 - length2):
+        return []
+    chain = []
+    segment = int(np.argmax(finals))
+    while segment >= 0:
+        chain.append((int(starts1[segment]), int(starts2[segment]), int(lengths[segment])))
+        segment = int(previous[segment])
+    return chain[::-1]
+
+
+def seed_extend_similarity(seq1, seq2, match_score=3, mismatch_penalty=-1, gap_penalty=-2, k=16,
+                           max_cells=25000000, engine=None):
+    """
+    Estimates the Needleman-Wunsch similarity of long sequences in near-linear time.
+
+    Sequences whose full DP fits in `max_cells` cells are aligned exactly. Otherwise,
+    exact k-mers that are unique in both sequences seed the alignment, seeds on a
+    diagonal are merged into segments, and the chain of segments that best fits a
+    global alignment is kept (see chain_segments). The regions between segments are
+    aligned exactly when they fit in `max_cells`, and with a banded DP of about
+    `max_cells` cells otherwise. The result is the score of one valid global
+    alignment, so it never exceeds the exact similarity.
+
+    Parameters:
+        seq1 (str): First DNA sequence.
+        seq2 (str): Second DNA sequence.
+        match_score (int, optional): Score for matches. Defaults to 3.
+        mismatch_penalty (int, optional): Penalty for mismatches. Defaults to -1.
+        gap_penalty (int, optional): Penalty for gaps. Defaults to -2.
+        k (int, optional): Seed length, at most 21. Defaults to 16.
+        max_cells (int, optional): Largest DP aligned exactly, and the size of the banded
+            DP of larger regions. Defaults to 25000000, a 5000 by 5000 base alignment.
+        engine (str, optional): Name of the alignment engine of the exact DPs. Defaults to DEFAULT_ALIGNMENT_ENGINE.
+    Returns:
+        float: Similarity estimate between the two sequences.
+    """
+    if not len(seq1) or not len(seq2):
+        return 0.0
+    scoring = (match_score, mismatch_penalty, gap_penalty)
+    align = get_alignment_engine(engine)
+    max_score = max(len(seq1), len(seq2)) * match_score
+    if len(seq1) * len(seq2) <= max_cells:
+        return align(seq1, seq2, *scoring) / max_score
+    array1, array2 = _as_array(seq1), _as_array(seq2)
+    segments = chain_segments(*seed_segments(*unique_seeds(array1, array2, k), k), len(seq1), len(seq2),
+                              match_score, gap_penalty)
+    score = 0
+    position1 = position2 = 0
+    for start1, start2, length in segments + [(len(seq1), len(seq2), 0)]:
+        # Region between the previous segment and this one
+        region1, region2 = seq1[position1:start1], seq2[position2:start2]
+        if not len(region1) or not len(region2):
+            score += (len(region1) + len(region2)) * gap_penalty
+        elif len(region1) * len(region2) <= max_cells:
+            score += align(region1, region2, *scoring)
+        else:
+            bandwidth = max(max_cells // (2 * min(len(region1), len(region2))), 1)
+            score += banded_alignment_score(region1, region2, bandwidth, *scoring)
+        # Seeds are exact k-mer code matches; bases outside A, C, G and T share a code
+        matches = int(np.count_nonzero(array1[start1:start1 + length] == array2[start2:start2 + length]))
+        score += matches * match_score + (length - matches) * mismatch_penalty
+        position1, position2 = start1 + length, start2 + length
+    return score / max_score
+
+
+def _as_array(sequence):
+    if isinstance(sequence, np.ndarray):
+        return sequence
+    return np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)
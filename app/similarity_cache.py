@@ -0,0 +1,245 @@
+# Memoized alignment similarities keyed by the digests of the compared sequences
+
+import json
+import math
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from population import sequence_digest
+
+
+class RedisSimilarityBackend:
+    """
+    Similarity entries shared by the workers through Redis.
+
+    Entries are JSON strings expiring after `ttl` seconds; bound the memory of the
+    server with its maxmemory policy. Any client with the redis-py interface works.
+    """
+
+    def __init__(self, client, prefix='similarity:', ttl=86400):
+        """
+        Parameters:
+            client (redis.Redis): Redis client.
+            prefix (str, optional): Prefix of the keys. Defaults to 'similarity:'.
+            ttl (float, optional): Seconds an entry is kept. Defaults to 86400.
+        """
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url, prefix='similarity:', ttl=86400):
+        import redis
+        return cls(redis.Redis.from_url(url), prefix, ttl)
+
+    def get_many(self, keys):
+        """Returns the entry of each key, None for keys without one."""
+        if not keys:
+            return []
+        values = self.client.mget([self.prefix + key.hex() for key in keys])
+        return [tuple(json.loads(value)) if value else None for value in values]
+
+    def set_many(self, items):
+        """Stores (key, entry) pairs."""
+        if not items:
+            return
+        pipeline = self.client.pipeline()
+        for key, entry in items:
+            pipeline.set(self.prefix + key.hex(), json.dumps(entry), ex=max(math.ceil(self.ttl), 1))
+        pipeline.execute()
+
+
+class SimilarityCache:
+    """
+    Bounded LRU cache of Needleman-Wunsch similarities.
+
+    Entries are keyed by the digests of the query and target sequences and by the
+    scoring parameters, so a population record whose sequence changes gets a new key
+    and never reads the entry of its former sequence. An entry keeps the integer
+    alignment score and maximum score, which answers any threshold exactly as
+    similarity_many would. A target rejected below a threshold is stored as a bound
+    and answers the same or higher thresholds.
+
+    With a `backend`, entries missing locally are looked up in, and new entries are
+    written to, a store shared by every worker.
+
+    Attributes:
+        hits (int): Similarities answered from the cache.
+        misses (int): Similarities that had to be computed.
+        evictions (int): Entries dropped to stay within `max_entries`.
+        invalidations (int): Entries dropped by invalidate().
+    """
+
+    def __init__(self, max_entries=100000, backend=None, scoring=(3, -1, -2)):
+        """
+        Parameters:
+            max_entries (int, optional): Number of entries kept in this process. Defaults to 100000.
+            backend (RedisSimilarityBackend, optional): Shared store. Defaults to None.
+            scoring (tuple, optional): Match score, mismatch penalty and gap penalty of the
+                cached similarities. Defaults to (3, -1, -2).
+        """
+        self.max_entries = max_entries
+        self.backend = backend
+        self.scoring = scoring
+        self._suffix = struct.pack('<3i', *scoring)
+        # Key -> (score or None, maximum score, minimum score the target failed or None)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, query_digest, target_digest):
+        return query_digest + target_digest + self._suffix
+
+    def lookup(self, query, target_digests, threshold=None):
+        """
+        Looks up the similarities of a query with several targets.
+
+        Parameters:
+            query (str): Query DNA sequence.
+            target_digests (list of bytes): sequence_digest() of each target.
+            threshold (float, optional): Threshold the similarities are computed with. Defaults to None.
+        Returns:
+            tuple: Similarity of each target (NaN where rejected by the threshold or unknown)
+                and whether each target was found.
+        """
+        scores = np.full(len(target_digests), np.nan)
+        found = np.zeros(len(target_digests), dtype=bool)
+        if self.max_entries <= 0 or not len(query):
+            return scores, found
+        query_digest = sequence_digest(query)
+        keys = [self.key(query_digest, digest) for digest in target_digests]
+        with self._lock:
+            entries = [self._entries.get(key) for key in keys]
+            for key, entry in zip(keys, entries):
+                if entry is not None:
+                    self._entries.move_to_end(key)
+        if self.backend is not None:
+            missing = [position for position, entry in enumerate(entries) if entry is None]
+            shared = self.backend.get_many([keys[position] for position in missing])
+            with self._lock:
+                for position, entry in zip(missing, shared):
+                    if entry is not None:
+                        entries[position] = entry
+                        self._put(keys[position], entry)
+        for position, entry in enumerate(entries):
+            if entry is None:
+                continue
+            score, max_score, rejected_below = entry
+            min_score = self.min_score(threshold, max_score)
+            if score is not None:
+                found[position] = True
+                if min_score is None or score >= min_score:
+                    scores[position] = score / max_score
+            elif min_score is not None and min_score >= rejected_below:
+                found[position] = True
+        with self._lock:
+            self.hits += int(found.sum())
+            self.misses += len(target_digests) - int(found.sum())
+        return scores, found
+
+    def store(self, query, target_lengths, target_digests, similarities, threshold=None):
+        """
+        Records similarities computed by similarity_many.
+
+        Parameters:
+            query (str): Query DNA sequence.
+            target_lengths (list of int): Length of each target.
+            target_digests (list of bytes): sequence_digest() of each target.
+            similarities (numpy.ndarray): Similarity of each target, NaN where rejected.
+            threshold (float, optional): Threshold the similarities were computed with. Defaults to None.
+        """
+        if self.max_entries <= 0 or not len(query):
+            return
+        query_digest = sequence_digest(query)
+        items = []
+        for length, digest, similarity in zip(target_lengths, target_digests, similarities.tolist()):
+            # Empty targets are never aligned
+            if not length:
+                continue
+            max_score = max(len(query), int(length)) * self.scoring[0]
+            if math.isnan(similarity):
+                entry = (None, max_score, self.min_score(threshold, max_score))
+            else:
+                entry = (round(similarity * max_score), max_score, None)
+            items.append((self.key(query_digest, digest), entry))
+        kept = []
+        with self._lock:
+            for key, entry in items:
+                previous = self._entries.get(key)
+                # A rejection bound never replaces a known score, nor a lower (tighter) bound
+                if entry[0] is None and previous is not None and (previous[0] is not None or previous[2] <= entry[2]):
+                    continue
+                self._put(key, entry)
+                kept.append((key, entry))
+        if self.backend is not None and kept:
+            self.backend.set_many(kept)
+
+    def similarity(self, query, target, compute):
+        """
+        Returns the similarity of two sequences, calling compute(query, target) on a miss.
+
+        Parameters:
+            query (str): First DNA sequence.
+            target (str): Second DNA sequence.
+            compute (callable): Similarity function, such as needleman_wunsch_similarity.
+        Returns:
+            float: Similarity of the sequences.
+        """
+        digests = [sequence_digest(target)]
+        scores, found = self.lookup(query, digests)
+        if found[0]:
+            return float(scores[0])
+        similarity = compute(query, target)
+        self.store(query, [len(target)], digests, np.array([similarity]))
+        return similarity
+
+    def invalidate(self, target_digests):
+        """
+        Drops the local entries of targets, such as the former sequences of changed records.
+
+        Shared entries expire with their TTL; they are keyed by digest, so they are never
+        read for a changed sequence.
+
+        Parameters:
+            target_digests (set of bytes): Digests of the targets to drop.
+        Returns:
+            int: Number of entries dropped.
+        """
+        if not target_digests:
+            return 0
+        with self._lock:
+            stale = [key for key in self._entries if key[16:32] in target_digests]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self):
+        """Returns the counters and size of the cache."""
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations}
+
+    @staticmethod
+    def min_score(threshold, max_score):
+        """Minimum alignment score similarity_many requires for a threshold, None without one."""
+        if threshold is None:
+            return None
+        return int(np.ceil(threshold * max_score - 1e-9))
+
+    def _put(self, key, entry):
+        """Inserts an entry as the most recent one; the caller holds the lock."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
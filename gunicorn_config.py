@@ -1,3 +1,41 @@
+import os
+
 bind = "0.0.0.0:8000"
-workers = 2  # Adjust based on your server's CPU cores
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))  # Adjust based on your server's CPU cores
 timeout = 120  # Set a timeout that fits your requirements
+# Each worker scans the population with its own process pool, configured through the environment:
+#   SCAN_PROCESSES   pool processes per worker (default: half the CPU cores, 0 scans in the request thread)
+#   SCAN_CHUNK_SIZE  population records per pool task (default: 64)
+#   SCAN_DEADLINE    seconds a request may scan (default: 100), kept below `timeout` so a slow
+#                    scan returns partial results ("complete": false) instead of the worker being killed
+# Alignment similarities are memoized per worker:
+#   SIMILARITY_CACHE_SIZE  similarities kept per worker (default: 100000, 0 disables the cache)
+#   SIMILARITY_CACHE_URL   Redis URL of a cache shared by the workers (default: none)
+# /compare on long uploads:
+#   LONG_COMPARE_LENGTH  bases above which sequences are compared full length with seed-and-extend
+#                        (default: 2000, 0 truncates every upload to 2000 bases)
+#   MAX_COMPARE_LENGTH   bases read from each upload (default: 10000000)
+# The application (population store, model artifacts) is imported once in the master and shared
+# copy-on-write by the forked workers; scan pools and job threads start lazily in each worker
+preload_app = True
+# Kinship model artifacts:
+#   MODELS_DIR             directory of the pickles (default: ../models next to the app)
+#   MODEL_FILE             model pickle in MODELS_DIR, or an absolute path (default: finalized_model_lgb.pkl)
+#   MODELS_REQUIRED        1 stops the startup when an artifact is missing (default: 0, the app starts and the
+#                          model endpoints answer 503 until the artifacts load; /models reports the error)
+#   MODEL_RELOAD_INTERVAL  seconds between checks for changed pickles, reloaded without a restart (default: 30, 0 disables)
+# Metrics: GET /metrics serves latency histograms and counters in the Prometheus text format.
+#   METRICS_DIR  directory where each worker writes its metrics so /metrics adds up every worker
+#                (default: none, each worker reports its own); clear it when the server starts
+# A request with an "X-Profile: 1" header gets a Server-Timing header with the time of each stage.
+# Population source, overridden by app/benchmark.py to serve a synthetic population:
+#   POPULATION_API_URL  population API (default: the deployed EisaAPI)
+#   SNAPSHOT_DIR        directory of the persistent population snapshot (default: ../population_snapshot)
+# Asynchronous jobs (/jobs/...) are kept in the web process unless JOB_BROKER_URL (or REDIS_URL)
+# points at Redis. With more than one worker they need that shared broker, and answer 503 without
+# it; the Procfile `worker` process (`cd app && python job_worker.py`) runs the jobs.
+
+
+def post_fork(server, worker):
+    # Lets the application know how many workers share the jobs, whatever set the worker count
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
@@ -0,0 +1,39 @@
+# The application modules import each other by name, as when run from app/
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'app'))
+
+# application reads its configuration on import: keep it off the deployed API, the
+# repository's snapshot directory and extra scan processes
+os.environ.setdefault('POPULATION_API_URL', 'http://127.0.0.1:9/api/population')
+os.environ.setdefault('SNAPSHOT_DIR', tempfile.mkdtemp(prefix='population_snapshot_'))
+os.environ.setdefault('SCAN_PROCESSES', '0')
+
+
+@pytest.fixture
+def population_server():
+    """Local population API serving 40 synthetic records."""
+    from benchmark import PopulationServer, synthetic_population
+    server = PopulationServer(synthetic_population(40, 400)).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def application(population_server, monkeypatch):
+    """The application module, reading the population from `population_server`."""
+    import application
+    from population import PopulationStore
+    monkeypatch.setattr(application, 'population_store', PopulationStore(population_server.url))
+    return application
+
+
+@pytest.fixture
+def client(application):
+    return application.application.test_client()
@@ -0,0 +1,111 @@
+# Score parity of the alignment engines with the pairwise2 alignment they replaced
+
+import glob
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+from alignment import (ALIGNMENT_ENGINES, biopython_alignment_score, needleman_wunsch_similarity,
+                       numpy_alignment_score, similarity_many)
+from fasta import read_sequence
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore')
+    from Bio import pairwise2
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'Model_test_only')
+TEST_DIRS = sorted(glob.glob(os.path.join(DATA_DIR, '*', 'Test_*')))
+
+
+def read_test_sequences(test_dir):
+    """Returns the sequences of a test case, truncated to 2000 bases as the endpoints read them."""
+    sequences = []
+    for path in sorted(glob.glob(os.path.join(test_dir, '*.txt'))):
+        with open(path, 'rb') as file:
+            sequences.append(read_sequence(file))
+    return sequences
+
+
+def pairwise2_score(seq1, seq2, match_score=3, mismatch_penalty=-1, gap_penalty=-2):
+    """Scores the best global alignment as the original needleman_wunsch_similarity did."""
+    return pairwise2.align.globalms(seq1, seq2, match_score, mismatch_penalty, gap_penalty, gap_penalty,
+                                    score_only=True)
+
+
+def pairwise2_similarity(seq1, seq2):
+    return pairwise2_score(seq1, seq2) / (max(len(seq1), len(seq2)) * 3)
+
+
+@pytest.fixture(scope='module')
+def sequences():
+    return [sequence for test_dir in TEST_DIRS for sequence in read_test_sequences(test_dir)]
+
+
+@pytest.fixture(scope='module')
+def queries(sequences):
+    # A parent of every other test case keeps the pairwise2 reference fast enough
+    return sequences[::4]
+
+
+@pytest.fixture(scope='module')
+def expected(queries, sequences):
+    """pairwise2 similarity of every query against every test sequence."""
+    return np.array([[pairwise2_similarity(query, sequence) for sequence in sequences] for query in queries])
+
+
+def test_test_data_is_present():
+    assert len(TEST_DIRS) == 12
+
+
+@pytest.mark.parametrize('test_dir', TEST_DIRS, ids=lambda path: os.path.relpath(path, DATA_DIR))
+@pytest.mark.parametrize('score_function', [numpy_alignment_score, biopython_alignment_score],
+                         ids=['numpy', 'biopython'])
+def test_engine_scores_match_pairwise2(test_dir, score_function):
+    parent, child = read_test_sequences(test_dir)
+    assert score_function(parent, child) == pairwise2_score(parent, child)
+
+
+@pytest.mark.parametrize('engine', sorted(ALIGNMENT_ENGINES))
+def test_similarity_matches_pairwise2(engine, queries, sequences, expected):
+    for i, query in enumerate(queries):
+        for j, sequence in enumerate(sequences):
+            assert needleman_wunsch_similarity(query, sequence, engine=engine) == expected[i, j]
+
+
+@pytest.mark.parametrize('scoring', [(3, -1, -2), (2, -3, -1)])
+def test_engines_match_pairwise2_on_other_scoring(scoring, sequences):
+    seq1, seq2 = sequences[0][:300], sequences[5][:250]
+    score = pairwise2_score(seq1, seq2, *scoring)
+    assert numpy_alignment_score(seq1, seq2, *scoring) == score
+    assert biopython_alignment_score(seq1, seq2, *scoring) == score
+
+
+def test_similarity_many_matches_pairwise2(queries, sequences, expected):
+    for index, query in enumerate(queries):
+        np.testing.assert_array_equal(similarity_many(query, sequences, block_size=5), expected[index])
+
+
+def test_similarity_many_handles_empty_and_short_sequences():
+    targets = ['', 'A', 'ACGT', 'acgtn', 'TTTTTTTTTT']
+    for query in ['', 'A', 'ACGTTGCA']:
+        expected = [pairwise2_similarity(query, target) if query and target else 0.0 for target in targets]
+        np.testing.assert_array_equal(similarity_many(query, targets), expected)
+
+
+@pytest.mark.parametrize('threshold', [0.0, 0.5, 0.8, 1.0])
+def test_similarity_many_threshold_is_exact_or_rejected(threshold, queries, sequences, expected):
+    for index, query in enumerate(queries):
+        similarities = similarity_many(query, sequences, block_size=5, threshold=threshold)
+        rejected = np.isnan(similarities)
+        # Exactly the targets below the threshold are rejected, the others keep their exact similarity
+        np.testing.assert_array_equal(rejected, expected[index] < threshold)
+        np.testing.assert_array_equal(similarities[~rejected], expected[index][~rejected])
+
+
+def test_similarity_threshold_rejects_with_nan(sequences):
+    query, target = sequences[0], sequences[1]
+    similarity = needleman_wunsch_similarity(query, target)
+    assert needleman_wunsch_similarity(query, target, threshold=similarity) == similarity
+    assert np.isnan(needleman_wunsch_similarity(query, target, threshold=similarity + 0.01))
@@ -0,0 +1,73 @@
+# /identify/batch and /missing/batch against the local population API
+
+import io
+import json
+
+import pytest
+
+BATCH_URLS = ['/identify/batch', '/missing/batch']
+
+
+@pytest.fixture
+def sequences(population_server):
+    return [entry['DNA_sequence'] for entry in json.loads(population_server.body)['population']]
+
+
+def post_batch(client, url, data, status='all'):
+    response = client.post(url, data={'file': (io.BytesIO(data), 'batch.fasta'), 'status': status})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def fasta(records):
+    return b''.join(b'>' + header.encode() + b'\n' + sequence.encode() + b'\n' for header, sequence in records)
+
+
+def test_identify_batch_results_in_file_order(client, sequences):
+    body = post_batch(client, '/identify/batch', fasta([('first', sequences[3]), ('second', 'ACGT' * 50),
+                                                        ('third', sequences[7])]))
+    assert body['statusCode'] == 200
+    assert [(result['id'], result['header']) for result in body['results']] == [(0, 'first'), (1, 'second'),
+                                                                               (2, 'third')]
+    matches = [result['result'] for result in body['results']]
+    assert [match['match_status'] for match in matches] == ['DNA MATCH', 'DNA NOT MATCH', 'DNA MATCH']
+    assert matches[0]['matches']['national_id'] == '3'
+    assert matches[2]['matches']['national_id'] == '7'
+
+
+def test_missing_batch_matches_each_record(client, sequences):
+    body = post_batch(client, '/missing/batch', fasta([('a', sequences[5]), ('b', 'ACGT' * 50)]))
+    assert body['statusCode'] == 200
+    first, second = (result['result'] for result in body['results'])
+    assert first['main_match_info']['national_id'] == '5'
+    assert second['main_match_info'] is None
+
+
+@pytest.mark.parametrize('url', BATCH_URLS)
+def test_invalid_symbol_names_the_record(client, sequences, url):
+    data = fasta([('good', sequences[0])]) + b'>bad one\nACGT\nAC!T\n'
+    body = post_batch(client, url, data)
+    assert body == {
+        "message": "Invalid DNA sequence: unexpected symbol '!' at line 5, base 7 of record 1 ('bad one').",
+        "statusCode": 400
+    }
+
+
+@pytest.mark.parametrize('url', BATCH_URLS)
+def test_record_without_bases_is_named(client, sequences, url):
+    data = fasta([('a', sequences[0])]) + b'>empty\n' + fasta([('c', sequences[1])])
+    body = post_batch(client, url, data)
+    assert body == {"message": "Invalid DNA sequence: record 1 ('empty') has no bases.", "statusCode": 400}
+
+
+@pytest.mark.parametrize('url', BATCH_URLS)
+def test_batch_size_limits(application, client, url, monkeypatch):
+    assert post_batch(client, url, b'')['statusCode'] == 400
+    monkeypatch.setattr(application, 'MAX_BATCH_RECORDS', 2)
+    body = post_batch(client, url, fasta([(str(index), 'ACGT' * 10) for index in range(3)]))
+    assert body == {"message": "Too many records, a batch holds at most 2.", "statusCode": 400}
+
+
+def test_identify_batch_validates_the_status(client, sequences):
+    body = post_batch(client, '/identify/batch', fasta([('a', sequences[0])]), status='unknown')
+    assert body['statusCode'] == 400
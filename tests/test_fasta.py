@@ -0,0 +1,99 @@
+# Streaming FASTA reader: truncation as before, records, normalization and validation
+
+import io
+import random
+
+import numpy as np
+import pytest
+
+from fasta import InvalidSequence, read_fasta, read_records, read_sequence
+
+
+def baseline_sequence(data, max_length=2000):
+    """The line-based reader read_sequence replaced, for the inputs it handled."""
+    sequence, total_length = b'', 0
+    for line in io.BytesIO(data):
+        line = line.strip()
+        if line.startswith(b'>'):
+            continue
+        remaining_length = max_length - total_length
+        if remaining_length <= 0:
+            break
+        sequence += line[:remaining_length]
+        total_length += min(len(line), remaining_length)
+    return sequence.decode()
+
+
+def fasta_file(rng, records, line_length, line_break=b'\n'):
+    lines = []
+    for index in range(records):
+        lines.append(b'>record %d description' % index)
+        bases = ''.join(rng.choice('ACGT') for _ in range(rng.randrange(0, 3000))).encode()
+        lines.extend(bases[i:i + line_length] for i in range(0, len(bases), line_length))
+    return line_break.join(lines) + line_break
+
+
+@pytest.mark.parametrize('max_length', [0, 1, 59, 60, 61, 2000, 5000])
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 16])
+def test_truncation_matches_line_reader(max_length, chunk_size):
+    rng = random.Random(max_length)
+    for records, line_length in ((0, 60), (1, 60), (3, 60), (2, 1), (1, 100000)):
+        data = fasta_file(rng, records, line_length)
+        expected = baseline_sequence(data, max_length)
+        assert read_fasta(io.BytesIO(data), max_length, chunk_size).text == expected
+    assert read_sequence(io.BytesIO(data)) == baseline_sequence(data)
+
+
+def test_headerless_text_matches_line_reader():
+    data = b'acgt\n  ACGTN  \n\nTTGA'
+    assert read_sequence(io.BytesIO(data)) == baseline_sequence(data).upper() == 'ACGTACGTNTTGA'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1 << 16])
+def test_records_and_boundaries(chunk_size):
+    data = b'NNA\n>first one\nacgt\nAC\n  >second\r\n\r\n>third\nT'
+    sequence = read_fasta(io.BytesIO(data), max_length=None, chunk_size=chunk_size)
+    assert sequence.text == 'NNAACGTACT'
+    assert [(record.header, record.start, record.end) for record in sequence.records] == [
+        ('', 0, 3), ('first one', 3, 9), ('second', 9, 9), ('third', 9, 10)]
+    assert sequence.record_text(1) == 'ACGTAC'
+    np.testing.assert_array_equal(sequence.array(), np.frombuffer(b'NNAACGTACT', dtype=np.uint8))
+
+
+def test_header_on_the_last_line():
+    sequence = read_fasta(io.BytesIO(b'>first\nACGT\n>last'), max_length=None)
+    assert [(record.header, len(record)) for record in sequence.records] == [('first', 4), ('last', 0)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1 << 16])
+def test_crlf_and_lowercase(chunk_size):
+    data = b'>sample\r\nacgtu\r\nnRyKm\r\n'
+    assert read_fasta(io.BytesIO(data), chunk_size=chunk_size).text == 'ACGTUNRYKM'
+
+
+def test_read_records_truncates_each_record():
+    data = b'>a\n' + b'A' * 10 + b'\n>b\n' + b'C' * 3 + b'\n>c\n' + b'G' * 10
+    assert read_records(io.BytesIO(data), max_length=5) == [('a', 'AAAAA'), ('b', 'CCC'), ('c', 'GGGGG')]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 1 << 16])
+@pytest.mark.parametrize('data, symbol, location', [
+    (b'ACGTX', 'X', "line 1, base 5"),
+    (b'>h\nAC\nG,T', ',', "line 3, base 4 of record 0 ('h')"),
+    (b'AC GT\n>h\nAA\nA1', '1', "line 4, base 4 of record 1 ('h')"),
+    (b'>a\nAC\n\n>b c\n  ac\r\n gt x\n', 'x', "line 6, base 5 of record 1 ('b c')"),
+    # A '>' inside a line does not open a header
+    (b'ACGT>ACGT', '>', "line 1, base 5"),
+])
+def test_invalid_symbol_location(data, symbol, location, chunk_size):
+    with pytest.raises(InvalidSequence) as error:
+        read_fasta(io.BytesIO(data), max_length=None, chunk_size=chunk_size)
+    assert str(error.value) == f"Invalid DNA sequence: unexpected symbol {symbol!r} at {location}."
+
+
+def test_symbols_past_max_length_are_not_validated():
+    # data/test.txt has a ',' at base 2001, after the 2000 bases compared
+    data = b'A' * 2000 + b','
+    assert read_sequence(io.BytesIO(data)) == 'A' * 2000
+    with pytest.raises(InvalidSequence):
+        read_sequence(io.BytesIO(data), max_length=2001)
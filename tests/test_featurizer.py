@@ -0,0 +1,87 @@
+# The k-mer featurizer must give the model the same input as the fitted vectorizer and scaler
+
+import glob
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pytest
+
+from featurizer import KmerFeaturizer
+from fasta import read_sequence
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(ROOT_DIR, 'models')
+DATA_DIR = os.path.join(ROOT_DIR, 'data', 'Model_test_only')
+
+
+def load_model_file(name):
+    with warnings.catch_warnings(), open(os.path.join(MODELS_DIR, name), 'rb') as file:
+        # The pickles may come from another scikit-learn version
+        warnings.simplefilter('ignore')
+        return pickle.load(file)
+
+
+def vectorizer_input(sequence, k=7):
+    """Space-joined k-mers, as the original /predict passed them to the vectorizer."""
+    return ' '.join(sequence[i:i + k] for i in range(len(sequence) - k + 1))
+
+
+@pytest.fixture(scope='module')
+def vectorizer():
+    return load_model_file('vectorizer.pkl')
+
+
+@pytest.fixture(scope='module')
+def scaler():
+    scaler = load_model_file('scaler.pkl')
+    # Pickled by a scikit-learn older than the `clip` option, which newer versions read
+    if not hasattr(scaler, 'clip'):
+        scaler.clip = False
+    return scaler
+
+
+@pytest.fixture(scope='module')
+def sequences():
+    sequences = []
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, '*', 'Test_*', '*.txt'))):
+        with open(path, 'rb') as file:
+            sequences.append(read_sequence(file))
+    # Lowercase bases, other IUPAC codes and sequences shorter than a k-mer
+    return sequences + [sequences[0][:500].lower(), 'ACGTNACGTACGTTRYACGTAC' * 20, 'ACGTAC', '']
+
+
+def test_counts_match_vectorizer(vectorizer, sequences):
+    featurizer = KmerFeaturizer.from_vectorizer(vectorizer)
+    expected = vectorizer.transform([vectorizer_input(sequence) for sequence in sequences])
+    np.testing.assert_array_equal(featurizer.transform(sequences).toarray(), expected.toarray())
+
+
+def test_pair_features_match_scaler(vectorizer, scaler, sequences):
+    featurizer = KmerFeaturizer.from_vectorizer(vectorizer)
+    pairs = list(zip(sequences[::2], sequences[1::2]))
+    parents = vectorizer.transform([vectorizer_input(parent) for parent, _ in pairs]).toarray()
+    children = vectorizer.transform([vectorizer_input(child) for _, child in pairs]).toarray()
+    expected = scaler.transform(np.hstack([parents, children]))
+    features = featurizer.pair_features(pairs, scale=np.asarray(scaler.scale_, dtype=np.float64))
+    np.testing.assert_array_equal(features.toarray(), expected)
+    np.testing.assert_array_equal(featurizer.pair_features(pairs).toarray(), np.hstack([parents, children]))
+
+
+def test_query_features_match_pair_features(vectorizer, scaler, sequences):
+    featurizer = KmerFeaturizer.from_vectorizer(vectorizer)
+    scale = np.asarray(scaler.scale_, dtype=np.float64)
+    query, others = sequences[0], sequences[1:6]
+    matrix = featurizer.transform(others)
+    for role, pairs in (('parent', [(query, other) for other in others]),
+                        ('child', [(other, query) for other in others])):
+        features = featurizer.query_features(query, matrix, query_role=role, scale=scale)
+        np.testing.assert_array_equal(features.toarray(), featurizer.pair_features(pairs, scale=scale).toarray())
+
+
+def test_from_columns_matches_from_vectorizer(vectorizer, sequences):
+    featurizer = KmerFeaturizer.from_vectorizer(vectorizer)
+    restored = KmerFeaturizer.from_columns(featurizer.columns, featurizer.n_features)
+    assert restored.k == featurizer.k
+    np.testing.assert_array_equal(restored.transform(sequences).toarray(), featurizer.transform(sequences).toarray())
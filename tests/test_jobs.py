@@ -0,0 +1,124 @@
+# Job submission, polling and results with the in-process broker and a Redis stand-in
+
+import threading
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, JobManager, MemoryBroker, RedisBroker
+
+
+class StandInRedis:
+    """In-process stand-in for the part of the redis-py client the broker uses."""
+
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+        self.changed = threading.Condition()
+
+    def set(self, key, value, ex=None):
+        with self.changed:
+            self.values[key] = (value.encode(), time.monotonic() + ex if ex else None)
+
+    def get(self, key):
+        with self.changed:
+            value, expires_at = self.values.get(key, (None, None))
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.values[key]
+                return None
+            return value
+
+    def lpush(self, key, value):
+        with self.changed:
+            self.lists.setdefault(key, []).insert(0, value.encode())
+            self.changed.notify_all()
+
+    def brpop(self, key, timeout=0):
+        with self.changed:
+            if not self.changed.wait_for(lambda: self.lists.get(key), timeout or None):
+                return None
+            return key.encode(), self.lists[key].pop()
+
+
+def double(payload, progress):
+    progress(0.5)
+    return {"value": payload["value"] * 2}
+
+
+def fail(payload, progress):
+    raise RuntimeError("scan failed")
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def broker(request):
+    return MemoryBroker() if request.param == 'memory' else RedisBroker(StandInRedis())
+
+
+def make_manager(broker, workers=1, **kwargs):
+    manager = JobManager(broker, workers=workers, **kwargs)
+    manager.register('double', double)
+    manager.register('fail', fail)
+    return manager
+
+
+def test_submit_poll_and_result(broker):
+    manager = make_manager(broker)
+    job = manager.submit('double', {"value": 21})
+    assert job['status'] == 'queued'
+    finished = manager.get(job['id'], wait=5)
+    assert finished['status'] == DONE
+    assert finished['result'] == {"value": 42}
+    assert finished['progress'] == 1.0
+    assert manager.get(job['id']) == finished
+
+
+def test_failed_job_records_the_error(broker):
+    manager = make_manager(broker)
+    job = manager.get(manager.submit('fail', {})['id'], wait=5)
+    assert job['status'] == FAILED
+    assert job['error'] == "scan failed"
+
+
+def test_progress_is_visible_while_running(broker):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(payload, progress):
+        progress(0.25)
+        started.set()
+        release.wait(5)
+        return None
+
+    manager = make_manager(broker)
+    manager.register('slow', slow)
+    job_id = manager.submit('slow', {})['id']
+    assert started.wait(5)
+    running = manager.get(job_id)
+    assert (running['status'], running['progress']) == ('running', 0.25)
+    release.set()
+    assert manager.get(job_id, wait=5)['status'] == DONE
+
+
+def test_separate_worker_process_runs_shared_jobs():
+    # The web process only submits; a job_worker sharing the broker runs the job
+    broker = RedisBroker(StandInRedis())
+    web = make_manager(broker, workers=0)
+    worker = make_manager(broker, workers=0)
+    job_id = web.submit('double', {"value": 2})['id']
+    assert web.get(job_id)['status'] == 'queued'
+    assert worker.run_once(timeout=1)
+    assert web.get(job_id)['result'] == {"value": 4}
+    assert not worker.run_once(timeout=0.1)
+
+
+def test_results_expire_after_their_ttl(broker):
+    manager = make_manager(broker, workers=0, result_ttl=1)
+    job_id = manager.submit('double', {"value": 1})['id']
+    manager.run_once(timeout=1)
+    assert manager.get(job_id)['status'] == DONE
+    time.sleep(1.1)
+    assert manager.get(job_id) is None
+
+
+def test_unknown_job_kind_is_rejected(broker):
+    with pytest.raises(ValueError):
+        make_manager(broker).submit('unknown', {})
@@ -0,0 +1,84 @@
+# The streaming parser of population responses must decode what json.loads decodes
+
+import json
+import random
+
+import pytest
+
+from json_stream import iter_array_items
+from packed_population import record_key
+from population import PopulationUnavailable, preprocess_entry, read_population
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def random_entry(rng, index):
+    entry = {
+        '_id': f'{index:024x}',
+        'name': rng.choice(['Layla', 'Omar', 'Ça va', 'محمد', 'a "quoted" \\ name', '😀 emoji']),
+        'status': rng.choice(['missing', 'crime', 'disaster']),
+        'DNA_sequence': ''.join(rng.choice('ACGTacgtN') for _ in range(rng.randrange(0, 2600))),
+        'age': rng.choice([0, -3, 12, 12.5, 1e-7, 3.25e10, True, None]),
+        'address': {'city': 'Cairo', 'lines': ['1', 2, [3.0]]},
+        'phone': ' \t\n',
+    }
+    if index % 7 == 0:
+        del entry['DNA_sequence']
+    if index % 5 == 0:
+        del entry['_id']
+        entry['national_id'] = str(29900000000000 + index)
+    return entry
+
+
+@pytest.fixture(scope='module')
+def document():
+    rng = random.Random(0)
+    body = {'status': 'success', 'results': 40, 'population': [random_entry(rng, i) for i in range(40)],
+            'meta': {'page': 1.0, 'next': None}}
+    return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 4096, 1 << 20])
+def test_items_match_json_loads(document, chunk_size):
+    expected = json.loads(document)['population']
+    assert list(iter_array_items(chunked(document, chunk_size), 'population')) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5])
+@pytest.mark.parametrize('text', [
+    '{"population": [12.5, -0, 1e5, 2E-3, 10, 123456789012345678901234567890]}',
+    '{"population": []}',
+    ' \n{ "a" : [1, {"population": [0]}] , "population" : [ "x" , [ ] , { } ] } \n',
+    '{"population": ["\\u00e9\\ud83d\\ude00", "\\"\\\\\\/\\b\\f\\n\\r\\t"]}',
+])
+def test_values_match_json_loads(text, chunk_size):
+    document = text.encode('utf-8')
+    expected = json.loads(document)['population']
+    assert list(iter_array_items(chunked(document, chunk_size), 'population')) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '', '[]', '{"population": {}}', '{"other": []}', '{"population": [1, 2}',
+    '{"population": [1 2]}', '{"population": [1]} extra', '{"population": [1]',
+])
+def test_malformed_documents_raise(text):
+    with pytest.raises(ValueError):
+        list(iter_array_items(chunked(text.encode('utf-8'), 3), 'population'))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 100, 1 << 16])
+def test_read_population_matches_preprocess_entry(document, chunk_size):
+    entries = [entry for entry in json.loads(document)['population'] if 'DNA_sequence' in entry]
+    records, sequences = read_population(chunked(document, chunk_size))
+    assert len(records) == len(entries)
+    for record, sequence, entry in zip(records, sequences, entries):
+        expected_sequence, status, info = preprocess_entry(entry)
+        assert sequence == expected_sequence
+        assert (record.status, record.info, record.key) == (status, info, record_key(entry))
+
+
+def test_read_population_rejects_malformed_responses():
+    with pytest.raises(PopulationUnavailable):
+        read_population([b'{"population": [{"DNA_sequence": "ACGT"}'])
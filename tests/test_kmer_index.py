@@ -0,0 +1,61 @@
+# k-mer index candidates and their metric
+
+import io
+import json
+import threading
+
+import numpy as np
+
+import metrics
+from alignment import needleman_wunsch_similarity
+from benchmark import synthetic_population
+from kmer_index import KmerIndex
+
+
+def sequences(count=40, length=400):
+    return [entry['DNA_sequence'] for entry in synthetic_population(count, length)['population']]
+
+
+def test_candidates_keep_every_record_reaching_the_threshold():
+    population = sequences()
+    index = KmerIndex(population)
+    query = population[4][:390] + 'ACGTACGTAC'
+    candidates = index.candidates(query, 0.955)
+    reaching = [i for i, sequence in enumerate(population) if needleman_wunsch_similarity(query, sequence) >= 0.955]
+    assert set(reaching) <= set(candidates.tolist())
+    assert len(candidates) < len(population)
+
+
+def test_concurrent_queries_share_no_state():
+    population = sequences()
+    index = KmerIndex(population)
+    expected = {i: index.candidates(population[i], 0.955).tolist() for i in range(8)}
+    results = {}
+
+    def query(i):
+        for _ in range(20):
+            results.setdefault(i, []).append(index.candidates(population[i], 0.955).tolist())
+
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(result == expected[i] for i, runs in results.items() for result in runs)
+    assert not hasattr(index, 'last_candidates')
+
+
+def candidate_counts():
+    counts, total = metrics.KMER_CANDIDATES.state().get(json.dumps(()), [[], 0.0])
+    return sum(counts), total
+
+
+def test_missing_search_records_the_candidate_count(application, client, population_server):
+    population = [entry['DNA_sequence'] for entry in json.loads(population_server.body)['population']]
+    searches, total = candidate_counts()
+    response = client.post('/missing', data={'file': (io.BytesIO(population[2].encode()), 'query.txt')})
+    assert response.get_json()['main_match_info']['national_id'] == '2'
+    index = application.population_store.get().kmer_index
+    expected = len(index.candidates(population[2], application.MIN_RELATIVE_SIMILARITY))
+    assert candidate_counts() == (searches + 1, total + expected)
+    assert f'dna_kmer_candidates_count {searches + 1}' in client.get('/metrics').get_data(as_text=True)
@@ -0,0 +1,94 @@
+# Loading and hot reload of the model artifacts
+
+import os
+import pickle
+import shutil
+import time
+import warnings
+
+import pytest
+
+from model_registry import ModelRegistry, ModelUnavailable
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+
+
+@pytest.fixture
+def directory(tmp_path):
+    """Artifacts directory with the vectorizer and scaler but no model."""
+    for name in ('vectorizer.pkl', 'scaler.pkl'):
+        shutil.copy(os.path.join(MODELS_DIR, name), tmp_path / name)
+    return tmp_path
+
+
+def write_model(directory, model):
+    with open(directory / 'model.pkl', 'wb') as file:
+        pickle.dump(model, file)
+
+
+def wait_for_model(registry, expected, timeout=10):
+    """Calls get() like the requests do until the expected model is served."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if registry.get().model == expected:
+                return
+        except ModelUnavailable:
+            pass
+        time.sleep(0.02)
+    pytest.fail(f"{expected!r} was not loaded within {timeout}s")
+
+
+@pytest.fixture(autouse=True)
+def ignore_version_warnings():
+    # The pickles may come from another scikit-learn version
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def test_missing_model_is_loaded_once_added(directory):
+    registry = ModelRegistry(str(directory), model_file='model.pkl', check_interval=0.05)
+    with pytest.raises(ModelUnavailable):
+        registry.load()
+    with pytest.raises(ModelUnavailable, match='Missing model artifacts'):
+        registry.get()
+    write_model(directory, 'stand-in model')
+    wait_for_model(registry, 'stand-in model')
+    assert registry.status()['loaded']
+
+
+def test_missing_model_is_not_retried_without_hot_reload(directory):
+    registry = ModelRegistry(str(directory), model_file='model.pkl', check_interval=0)
+    with pytest.raises(ModelUnavailable):
+        registry.load()
+    write_model(directory, 'stand-in model')
+    time.sleep(0.1)
+    with pytest.raises(ModelUnavailable):
+        registry.get()
+
+
+def test_changed_model_is_reloaded(directory):
+    write_model(directory, 'first model')
+    registry = ModelRegistry(str(directory), model_file='model.pkl', check_interval=0.05)
+    assert registry.load().model == 'first model'
+    featurizer = registry.get().featurizer
+    write_model(directory, 'second model')
+    # Make the change visible on file systems with a coarse modification time
+    os.utime(directory / 'model.pkl', ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    wait_for_model(registry, 'second model')
+    assert registry.get().featurizer.n_features == featurizer.n_features
+
+
+def test_failed_reload_keeps_the_loaded_artifacts(directory):
+    write_model(directory, 'first model')
+    registry = ModelRegistry(str(directory), model_file='model.pkl', check_interval=0.05)
+    registry.load()
+    (directory / 'model.pkl').write_bytes(b'not a pickle')
+    os.utime(directory / 'model.pkl', ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    deadline = time.monotonic() + 2
+    while registry.error is None and time.monotonic() < deadline:
+        assert registry.get().model == 'first model'
+        time.sleep(0.02)
+    assert registry.error is not None
+    assert registry.get().model == 'first model'
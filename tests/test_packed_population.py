@@ -0,0 +1,105 @@
+# Persistent packed snapshot: encoding, incremental syncs, compaction and damaged snapshots
+
+import os
+import random
+
+import numpy as np
+import pytest
+
+from packed_population import PackedPopulation, pack_sequence, unpack_sequence
+from population import PopulationRecord, PopulationStore
+
+
+def decode(sequences):
+    return [sequence.tobytes().decode('ascii') for sequence in sequences]
+
+
+def make_records(count, length=100, seed=0, updated_at='2024-01-01'):
+    rng = random.Random(seed)
+    records = [PopulationRecord('missing', {'name': f'record {index}', 'updatedAt': updated_at}, key=f'id{index}')
+               for index in range(count)]
+    sequences = [''.join(rng.choice('ACGT') for _ in range(length)) for _ in range(count)]
+    return records, sequences
+
+
+@pytest.mark.parametrize('length', [0, 1, 3, 4, 7, 8, 9, 33])
+def test_pack_round_trip_with_ambiguous_bases(length):
+    rng = random.Random(length)
+    for alphabet in ('ACGT', 'ACGTNRYKMSWBDHVU'):
+        sequence = ''.join(rng.choice(alphabet) for _ in range(length))
+        packed, ambiguous = pack_sequence(sequence)
+        assert ambiguous == ''.join(symbol for symbol in sequence if symbol not in 'ACGT')
+        buffer = np.frombuffer(b'\xff' * 3 + packed + b'\xff', dtype=np.uint8)
+        assert unpack_sequence(buffer, 3, length, ambiguous).tobytes().decode() == sequence
+
+
+def test_sync_reuses_records_by_updated_at(tmp_path):
+    packed = PackedPopulation(str(tmp_path))
+    records, sequences = make_records(10)
+    assert packed.sync(records, sequences, etag='"v1"') == {"reused": 0, "packed": 10}
+    assert packed.sync(records, sequences, etag='"v2"') == {"reused": 10, "packed": 0}
+    # A changed record is repacked, as is one without updatedAt or key
+    records[2] = PopulationRecord('crime', {'name': 'changed', 'updatedAt': '2024-02-01'}, key='id2')
+    sequences[2] = 'NNACGTRY'
+    records[5] = PopulationRecord('missing', {'name': 'no date'}, key='id5')
+    records[7] = PopulationRecord('missing', {'name': 'no key', 'updatedAt': '2024-01-01'})
+    assert packed.sync(records, sequences) == {"reused": 7, "packed": 3}
+    table, loaded = packed.load()
+    assert decode(loaded) == sequences
+    assert [row[2] for row in table['records']][2] == 'crime'
+    assert table['records'][2][6] == {'name': 'changed', 'updatedAt': '2024-02-01'}
+    assert table['etag'] is None
+
+
+def test_compaction_rewrites_offsets(tmp_path):
+    packed = PackedPopulation(str(tmp_path))
+    records, sequences = make_records(20, length=101)
+    packed.sync(records, sequences)
+    # Dropping most records leaves more dead bytes than live ones
+    kept = [3, 11, 19]
+    sequences[11] = 'ACGTN' * 20
+    records[11] = PopulationRecord('missing', {'updatedAt': '2024-03-01'}, key='id11')
+    packed.sync([records[index] for index in kept], [sequences[index] for index in kept])
+    table, loaded = packed.load()
+    assert table['generation'] == 1
+    offsets = [row[3] for row in table['records']]
+    sizes = [-(-row[4] // 4) + (-(-row[4] // 8) if row[5] else 0) for row in table['records']]
+    assert offsets == [0, sizes[0], sizes[0] + sizes[1]]
+    assert os.path.getsize(packed.data_path(1)) == sum(sizes)
+    assert decode(loaded) == [sequences[index] for index in kept]
+
+
+def test_compaction_keeps_mapped_generations(tmp_path):
+    packed = PackedPopulation(str(tmp_path))
+    records, sequences = make_records(20)
+    packed.sync(records, sequences)
+    _, mapped = packed.load()
+    packed.sync(records[:2], sequences[:2])
+    # The first generation is still mapped, so it is kept and still decodes
+    assert os.path.exists(packed.data_path(0))
+    assert decode(mapped) == sequences
+    # Releasing the view unmaps the file and drops its lock
+    del mapped
+    packed.sync(records[:2], sequences[:2])
+    assert not os.path.exists(packed.data_path(0))
+    assert decode(packed.load()[1]) == sequences[:2]
+
+
+def test_load_without_data_file_raises(tmp_path):
+    packed = PackedPopulation(str(tmp_path))
+    records, sequences = make_records(5)
+    packed.sync(records, sequences)
+    os.remove(packed.data_path(0))
+    with pytest.raises(FileNotFoundError):
+        packed.load()
+    # The next sync repacks every record instead of pointing into the missing file
+    assert packed.sync(records, sequences) == {"reused": 0, "packed": 5}
+    assert decode(packed.load()[1]) == sequences
+
+
+def test_store_rebuilds_a_damaged_snapshot(population_server, tmp_path):
+    PopulationStore(population_server.url, snapshot_dir=str(tmp_path)).get()
+    os.remove(PackedPopulation(str(tmp_path)).data_path(0))
+    snapshot = PopulationStore(population_server.url, snapshot_dir=str(tmp_path)).get()
+    assert len(snapshot.records) == 40
+    assert population_server.responses == [200, 200]
@@ -0,0 +1,108 @@
+# Caching and revalidation of the population API against a local stand-in server
+
+import socket
+import time
+
+import pytest
+
+from benchmark import PopulationServer, synthetic_population
+from population import PopulationStore, PopulationUnavailable
+
+
+@pytest.fixture
+def server():
+    server = PopulationServer(synthetic_population(20, 300)).start()
+    yield server
+    server.stop()
+
+
+def names(snapshot):
+    return [record.info['name'] for record in snapshot.records]
+
+
+def stop(server, store):
+    """Takes the API down, including the connection the store keeps alive."""
+    server.stop()
+    store.session.close()
+
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/api/population'
+
+
+def test_snapshot_is_reused_within_ttl(server):
+    store = PopulationStore(server.url, ttl=60)
+    snapshot = store.get()
+    assert len(snapshot.records) == 20
+    assert store.get() is snapshot
+    assert server.responses == [200]
+
+
+def test_expired_snapshot_is_revalidated_with_etag(server):
+    store = PopulationStore(server.url, ttl=0, stale_ttl=0)
+    snapshot = store.get()
+    assert snapshot.etag == server.etag
+    # An unchanged population is answered with 304 and the snapshot is kept
+    assert store.get() is snapshot
+    assert server.responses == [200, 304]
+    server.update(synthetic_population(5, 300, seed=1))
+    changed = store.get()
+    assert changed is not snapshot
+    assert names(changed) == [entry['name'] for entry in synthetic_population(5, 300, seed=1)['population']]
+    assert server.responses == [200, 304, 200]
+
+
+def test_stale_snapshot_is_served_while_refreshing(server):
+    store = PopulationStore(server.url, ttl=0.1, stale_ttl=60)
+    snapshot = store.get()
+    time.sleep(0.15)
+    server.update(synthetic_population(5, 300, seed=1))
+    server.delay = 1
+    start = time.monotonic()
+    assert store.get() is snapshot
+    assert store.get() is snapshot
+    assert time.monotonic() - start < 0.5
+    deadline = time.monotonic() + 10
+    while store.snapshot is snapshot and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(store.get().records) == 5
+    # A single background refresh ran
+    assert server.responses == [200, 200]
+
+
+def test_stale_snapshot_is_served_when_the_api_is_down(server):
+    store = PopulationStore(server.url, ttl=0.1, stale_ttl=60)
+    snapshot = store.get()
+    stop(server, store)
+    time.sleep(0.15)
+    assert store.get() is snapshot
+    deadline = time.monotonic() + 10
+    while store._refreshing and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert store.get() is snapshot
+    assert server.responses == [200]
+
+
+def test_unavailable_without_snapshot():
+    store = PopulationStore(unused_url(), timeout=(1, 1))
+    with pytest.raises(PopulationUnavailable):
+        store.get()
+
+
+def test_expired_snapshot_waits_for_the_api(server):
+    store = PopulationStore(server.url, ttl=0, stale_ttl=0, timeout=(1, 1))
+    store.get()
+    stop(server, store)
+    with pytest.raises(PopulationUnavailable):
+        store.get()
+
+
+def test_persistent_snapshot_serves_a_cold_store(server, tmp_path):
+    PopulationStore(server.url, ttl=60, snapshot_dir=str(tmp_path)).get()
+    cold = PopulationStore(server.url, ttl=60, snapshot_dir=str(tmp_path))
+    snapshot = cold.get()
+    assert names(snapshot) == [entry['name'] for entry in synthetic_population(20, 300)['population']]
+    assert server.responses == [200]
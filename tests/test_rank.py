@@ -0,0 +1,108 @@
+# /rank against the kinship model scored one pair at a time
+
+import io
+import os
+import pickle
+import shutil
+import warnings
+
+import lightgbm as lgb
+import numpy as np
+import pytest
+from scipy import sparse
+
+from featurizer import KmerFeaturizer
+from model_registry import ModelRegistry
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+
+
+def load_model_file(name):
+    with warnings.catch_warnings(), open(os.path.join(MODELS_DIR, name), 'rb') as file:
+        # The pickles may come from another scikit-learn version
+        warnings.simplefilter('ignore')
+        return pickle.load(file)
+
+
+def vectorizer_input(sequence, k=7):
+    return ' '.join(sequence[i:i + k] for i in range(len(sequence) - k + 1))
+
+
+@pytest.fixture
+def population(population_server):
+    import json
+    return json.loads(population_server.body)['population']
+
+
+@pytest.fixture
+def model_files(tmp_path, population):
+    """A small LightGBM classifier trained on pairs of the population, with the repository's vectorizer and scaler."""
+    vectorizer, scaler = load_model_file('vectorizer.pkl'), load_model_file('scaler.pkl')
+    featurizer = KmerFeaturizer.from_vectorizer(vectorizer)
+    sequences = [entry['DNA_sequence'] for entry in population]
+    pairs = [(sequences[i], sequences[(i * 7) % len(sequences)]) for i in range(len(sequences))]
+    features = featurizer.pair_features(pairs, scale=np.asarray(scaler.scale_, dtype=np.float64))
+    labels = np.arange(len(pairs)) % 2
+    model = lgb.LGBMClassifier(n_estimators=20, min_child_samples=2, verbose=-1).fit(features, labels)
+    with open(tmp_path / 'model.pkl', 'wb') as file:
+        pickle.dump(model, file)
+    for name in ('vectorizer.pkl', 'scaler.pkl'):
+        shutil.copy(os.path.join(MODELS_DIR, name), tmp_path / name)
+    if not hasattr(scaler, 'clip'):
+        # Pickled by a scikit-learn older than the `clip` option, which newer versions read
+        scaler.clip = False
+    return tmp_path, model, vectorizer, scaler
+
+
+@pytest.fixture
+def rank(application, client, model_files, monkeypatch):
+    directory = model_files[0]
+    registry = ModelRegistry(str(directory), model_file='model.pkl', check_interval=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        registry.load()
+    monkeypatch.setattr(application, 'model_registry', registry)
+
+    def rank(sequence, **form):
+        data = {'file': (io.BytesIO(sequence.encode()), 'query.txt'), **form}
+        return client.post('/rank', data=data, content_type='multipart/form-data').get_json()
+    return rank
+
+
+def pair_probability(model, vectorizer, scaler, parent, child):
+    """Probability of one pair, featurized as the original /predict did."""
+    parent_vector = vectorizer.transform([vectorizer_input(parent)]).toarray()
+    child_vector = vectorizer.transform([vectorizer_input(child)]).toarray()
+    features = scaler.transform(np.hstack([parent_vector, child_vector]))
+    return model.predict_proba(sparse.csr_matrix(features))[0, 1]
+
+
+@pytest.mark.parametrize('role, status', [('parent', 'all'), ('child', 'all'), ('parent', 'crime')])
+def test_ranking_matches_pair_predictions(rank, model_files, population, role, status):
+    _, model, vectorizer, scaler = model_files
+    query = population[3]['DNA_sequence'][:2000]
+    response = rank(query, role=role, status=status, top_k='5')
+    assert response['statusCode'] == 200
+    entries = [entry for entry in population if status == 'all' or entry['status'] == status]
+    expected = []
+    for entry in entries:
+        pair = (query, entry['DNA_sequence']) if role == 'parent' else (entry['DNA_sequence'], query)
+        expected.append((pair_probability(model, vectorizer, scaler, *pair), entry['name']))
+    # Highest probability first, population order among ties
+    order = sorted(range(len(expected)), key=lambda index: (-expected[index][0], index))[:5]
+    candidates = response['candidates']
+    assert [candidate['relative_data']['name'] for candidate in candidates] == [expected[i][1] for i in order]
+    for candidate, index in zip(candidates, order):
+        assert candidate['probability'] == pytest.approx(expected[index][0], abs=1e-12)
+        assert candidate['prediction'] == ('relative' if expected[index][0] > 0.5 else 'not relative')
+
+
+def test_unknown_status_is_rejected(rank, population):
+    response = rank(population[0]['DNA_sequence'], status='bogus')
+    assert response['statusCode'] == 400
+    assert 'Invalid status' in response['message']
+
+
+@pytest.mark.parametrize('form', [{'top_k': '0'}, {'top_k': 'ten'}, {'role': 'sibling'}])
+def test_invalid_parameters_are_rejected(rank, population, form):
+    assert rank(population[0]['DNA_sequence'], **form)['statusCode'] == 400
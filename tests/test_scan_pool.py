@@ -0,0 +1,119 @@
+# Population scans in-process and on a process pool, over memory and packed snapshots, with deadlines
+
+import random
+import time
+
+import numpy as np
+import pytest
+
+from alignment import similarity_many
+from packed_population import PackedPopulation
+from population import PopulationRecord, PopulationSnapshot
+from scan_pool import ScanPool
+
+
+def random_population(count, length, seed=0):
+    rng = random.Random(seed)
+    base = ''.join(rng.choice('ACGT') for _ in range(length))
+    sequences = []
+    for index in range(count):
+        # Mutated copies of one sequence, so thresholds keep some records and reject others
+        sequence = [rng.choice('ACGT') if rng.random() < index / count else base_symbol for base_symbol in base]
+        if index % 5 == 0:
+            sequence[index % length] = 'N'
+        sequences.append(''.join(sequence))
+    records = [PopulationRecord('missing', {'updatedAt': '2024-01-01'}, key=str(index)) for index in range(count)]
+    return records, sequences, base
+
+
+def make_snapshot(kind, records, sequences, directory):
+    if kind == 'memory':
+        return PopulationSnapshot(records, sequences)
+    packed = PackedPopulation(str(directory))
+    packed.sync(records, sequences)
+    _, packed_sequences = packed.load()
+    return PopulationSnapshot(records, packed_sequences)
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = ScanPool(2, chunk_size=8)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(params=[0, 2], ids=['in-process', 'pool'])
+def scan_pool(request, pool):
+    return ScanPool(0, chunk_size=8) if request.param == 0 else pool
+
+
+@pytest.fixture(params=['memory', 'packed'])
+def population(request, tmp_path):
+    records, sequences, query = random_population(40, 300)
+    return make_snapshot(request.param, records, sequences, tmp_path), sequences, query
+
+
+@pytest.mark.parametrize('threshold', [None, 0.8])
+def test_complete_scan_matches_similarity_many(scan_pool, population, threshold):
+    snapshot, sequences, query = population
+    indices = list(range(3, 40))
+    expected = similarity_many(query, [sequences[index] for index in indices], threshold=threshold)
+    fractions = []
+    result = scan_pool.scan(snapshot, indices, query, threshold=threshold, progress=fractions.append)
+    assert result.complete
+    assert result.scanned.all()
+    np.testing.assert_array_equal(result.scores, expected)
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+    if threshold is not None:
+        assert 0 < np.isnan(expected).sum() < len(indices)
+
+
+def test_passed_deadline_scans_nothing(scan_pool, population):
+    snapshot, _, query = population
+    result = scan_pool.scan(snapshot, range(40), query, deadline=time.monotonic() - 1)
+    assert not result.complete
+    assert not result.scanned.any()
+    assert np.isnan(result.scores).all()
+
+
+@pytest.mark.parametrize('kind', ['memory', 'packed'])
+def test_short_deadline_returns_a_partial_scan(scan_pool, kind, tmp_path):
+    records, sequences, query = random_population(400, 2000, seed=1)
+    snapshot = make_snapshot(kind, records, sequences, tmp_path)
+    start = time.monotonic()
+    result = scan_pool.scan(snapshot, range(400), query, deadline=start + 0.3)
+    elapsed = time.monotonic() - start
+    assert not result.complete
+    # Queued chunks are cancelled and running ones stop at their next deadline check
+    assert elapsed < 1.5
+    scanned = np.flatnonzero(result.scanned)
+    assert np.isnan(result.scores[~result.scanned]).all()
+    if len(scanned):
+        expected = similarity_many(query, [sequences[index] for index in scanned])
+        np.testing.assert_array_equal(result.scores[scanned], expected)
+    # The next scan is not held up by the chunks of the cut one
+    start = time.monotonic()
+    indices = list(range(8))
+    result = scan_pool.scan(snapshot, indices, query)
+    assert result.complete
+    assert time.monotonic() - start < 2
+    np.testing.assert_array_equal(result.scores, similarity_many(query, sequences[:8]))
+
+
+def test_iter_chunks_covers_every_record_once(scan_pool, population):
+    snapshot, sequences, query = population
+    indices = np.arange(0, 40, 2)
+    covered = []
+    for chunk, scores in scan_pool.iter_chunks(snapshot, indices, query):
+        covered.extend(chunk.tolist())
+        np.testing.assert_array_equal(scores, similarity_many(query, [sequences[index] for index in indices[chunk]]))
+    assert sorted(covered) == list(range(len(indices)))
+
+
+def test_packed_snapshot_tasks_carry_offsets(tmp_path):
+    from scan_pool import _chunk_targets
+    records, sequences, _ = random_population(10, 50)
+    snapshot = make_snapshot('packed', records, sequences, tmp_path)
+    path, rows = _chunk_targets(snapshot, np.arange(3, 6))
+    assert path == snapshot.sequences.path
+    assert [length for _, length, _ in rows] == [50, 50, 50]
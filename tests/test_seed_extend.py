@@ -0,0 +1,78 @@
+# Seed-and-extend estimates of the long test pairs against the exact alignment
+
+import os
+import random
+
+import numpy as np
+import pytest
+
+from alignment import banded_alignment_score, needleman_wunsch_similarity, numpy_alignment_score
+from fasta import read_sequence
+from seed_extend import chain_segments, seed_extend_similarity
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'Model_test_only')
+# biopython_alignment_score of the full Not_relative/Test_1 pair, which takes about 40 seconds to compute
+TEST_1_SCORE = 145142
+
+
+def read_pair(test_dir, child_length=None):
+    """Reads a long test pair at full length; the Test_2 child is only valid for 2000 bases."""
+    paths = sorted(os.listdir(os.path.join(DATA_DIR, test_dir)))
+    sequences = []
+    for path, max_length in zip(paths, (None, child_length)):
+        with open(os.path.join(DATA_DIR, test_dir, path), 'rb') as file:
+            sequences.append(read_sequence(file, max_length=max_length))
+    return sequences
+
+
+def random_sequence(rng, length):
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+
+@pytest.mark.parametrize('test_dir, child_length', [('Not_relative/Test_2', 2000), ('Not_relative/Test_3', None)])
+def test_matches_exact_alignment(test_dir, child_length):
+    parent, child = read_pair(test_dir, child_length)
+    exact = needleman_wunsch_similarity(parent, child)
+    assert seed_extend_similarity(parent, child) == pytest.approx(exact, abs=0.01)
+    assert seed_extend_similarity(parent, child) <= exact
+
+
+def test_matches_exact_alignment_of_full_length_pair():
+    parent, child = read_pair('Not_relative/Test_1')
+    assert len(parent) == len(child) == 78216
+    assert seed_extend_similarity(parent, child) == pytest.approx(TEST_1_SCORE / (78216 * 3), abs=0.01)
+
+
+@pytest.mark.parametrize('max_cells', [1000000, 100000])
+def test_seeded_alignment_stays_close_to_exact(max_cells):
+    # Test_3 fits a full alignment by default; a smaller budget goes through the seeds
+    parent, child = read_pair('Not_relative/Test_3')
+    exact = needleman_wunsch_similarity(parent, child)
+    similarity = seed_extend_similarity(parent, child, max_cells=max_cells)
+    assert exact - 0.03 <= similarity <= exact
+
+
+def test_unrelated_sequences_use_the_banded_alignment():
+    rng = random.Random(0)
+    seq1, seq2 = random_sequence(rng, 2500), random_sequence(rng, 2500)
+    exact = needleman_wunsch_similarity(seq1, seq2)
+    assert seed_extend_similarity(seq1, seq2) == exact
+    assert exact - 0.02 <= seed_extend_similarity(seq1, seq2, max_cells=1000000) <= exact
+
+
+def test_far_off_diagonal_seed_is_not_chained():
+    # One shared 40-base segment that would force a 1000-base indel
+    chain = chain_segments(np.array([900]), np.array([1900]), np.array([40]), 2100, 2000)
+    assert chain == []
+    chain = chain_segments(np.array([0, 900]), np.array([0, 880]), np.array([500, 1000]), 2100, 2000)
+    assert chain == [(0, 0, 500), (900, 880, 1000)]
+
+
+def test_banded_alignment_is_exact_with_a_wide_band():
+    rng = random.Random(1)
+    for _ in range(100):
+        seq1 = random_sequence(rng, rng.randrange(0, 80))
+        seq2 = random_sequence(rng, rng.randrange(0, 80))
+        exact = numpy_alignment_score(seq1, seq2)
+        assert banded_alignment_score(seq1, seq2, 80) == exact
+        assert banded_alignment_score(seq1, seq2, 2) <= exact